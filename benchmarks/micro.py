@@ -0,0 +1,108 @@
+"""Microbenchmarks of the data access and matching code at several catalogue sizes.
+
+Each size gets its own database, seeded by `benchmarks.seed`. The read cache is
+cleared before every finder call, so each call scores and loads its recipes; the
+ingredient index stays built, as it would in a running worker.
+
+    $ python -m benchmarks.micro --sizes 1000 10000 --number 200 --output micro.jsonl
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+from typing import Any, Callable
+from sqlalchemy import Connection
+from src.db.cache import recipe_cache
+from src.db.operations import _combine_joined_recipe_records
+from src.db.setup import build_engine
+from src.db.sql_operations import (
+    build_fts_match_query,
+    select_joined_recipes_by_filters,
+    select_joined_recipes_by_ids,
+    select_recipe_by_id_with_ingredients,
+    select_recipe_ids_by_search,
+)
+from src.settings import settings
+from src.smarts.ingredient_index import ingredient_index
+from src.smarts.recipe_finder import RecipeFinder
+from benchmarks.seed import SIZES, seed
+from benchmarks.timing import measure, report, summarise
+
+PAGE_SIZE = 50
+FINDER_QUERY = {"garlic", "onion", "chicken"}
+
+
+def build_cases(
+    conn: Connection, recipe_count: int, rng: random.Random
+) -> dict[str, Callable[[], Any]]:
+    def random_ids() -> list[int]:
+        return rng.sample(range(1, recipe_count + 1), PAGE_SIZE)
+
+    def find() -> Any:
+        recipe_cache.clear()
+        return RecipeFinder(conn=conn).find(FINDER_QUERY, None, limit=PAGE_SIZE)
+
+    joined_rows = select_joined_recipes_by_ids(conn=conn, recipe_ids=random_ids())
+    match_query = build_fts_match_query("chicken garlic")
+    assert match_query is not None
+    return {
+        "select_recipe_by_id_with_ingredients": lambda: (
+            select_recipe_by_id_with_ingredients(
+                recipe_id=rng.randint(1, recipe_count), conn=conn
+            )
+        ),
+        "select_joined_recipes_by_ids": lambda: select_joined_recipes_by_ids(
+            conn=conn, recipe_ids=random_ids()
+        ),
+        "select_joined_recipes_by_filters": lambda: (
+            select_joined_recipes_by_filters(
+                conn=conn,
+                name=None,
+                author=None,
+                ingred_names=["garlic"],
+                limit=PAGE_SIZE,
+            )
+        ),
+        "select_recipe_ids_by_search": lambda: select_recipe_ids_by_search(
+            conn=conn, match_query=match_query, limit=PAGE_SIZE
+        ),
+        "_combine_joined_recipe_records": lambda: _combine_joined_recipe_records(
+            joined_rows
+        ),
+        "RecipeFinder.find": find,
+    }
+
+
+def run_size(
+    database_url: str, recipe_count: int, number: int, output: str | None
+) -> None:
+    engine = build_engine(database_url, settings.copy(update={"SQLA_ECHO": False}), [])
+    seed(engine, recipe_count)
+    ingredient_index.invalidate()
+    rng = random.Random(0)
+    with engine.connect() as conn:
+        for name, call in build_cases(conn, recipe_count, rng).items():
+            latencies = measure(call, number=number)
+            report(
+                {"benchmark": name, "recipes": recipe_count, **summarise(latencies)},
+                output,
+            )
+    ingredient_index.invalidate()
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--output", help="JSON lines file the results are added to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for recipe_count in args.sizes:
+            database_url = f"sqlite+pysqlite:///{Path(tmp_dir) / str(recipe_count)}.db"
+            run_size(database_url, recipe_count, args.number, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Replays a recorded workload against the ASGI app and reports latency and throughput.
+
+Every line of the workload file is one request: {"name", "method", "path"} plus
+optional "params" and "json". "{recipe_id}" in a path is replaced by a random ID of
+a seeded recipe. The requests are sent round robin through httpx in the same
+process as the app, so the numbers cover routing, validation, the datastore and
+serialisation, but not a network or a server's worker model.
+
+    $ python -m benchmarks.replay --recipes 10000 --requests 5000 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+WORKLOAD = "benchmarks/workload.jsonl"
+
+
+def load_workload(path: str) -> list[dict[str, Any]]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
+
+
+async def replay(
+    app: Any,
+    workload: list[dict[str, Any]],
+    request_count: int,
+    concurrency: int,
+    recipe_count: int,
+) -> tuple[dict[str, list[float]], int, float]:
+    """Sends `request_count` requests from `concurrency` concurrent clients.
+
+    Returns the latencies by request name, the number of error responses and the
+    elapsed wall time in seconds.
+    """
+    import httpx
+
+    rng = random.Random(0)
+    pending = iter(range(request_count))
+    latencies: dict[str, list[float]] = {x["name"]: [] for x in workload}
+    errors = 0
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for x in pending:
+            request = workload[x % len(workload)]
+            path = request["path"].format(recipe_id=rng.randint(1, recipe_count))
+            start = time.perf_counter()
+            response = await client.request(
+                request["method"],
+                path,
+                params=request.get("params"),
+                json=request.get("json"),
+            )
+            latencies[request["name"]].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    async with httpx.AsyncClient(app=app, base_url="http://replay") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload", default=WORKLOAD)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--recipes", type=int, default=1_000)
+    parser.add_argument(
+        "--database-url",
+        help="replay against this database instead of a freshly seeded one",
+    )
+    parser.add_argument("--output", help="JSON lines file the results are added to")
+    args = parser.parse_args()
+    workload = load_workload(args.workload)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = args.database_url
+        if database_url is None:
+            database_url = f"sqlite+pysqlite:///{Path(tmp_dir) / 'replay'}.db"
+        # The settings are read on import, the engines are created by init_db
+        os.environ["DATABASE_URL"] = database_url
+        os.environ["SQLA_ECHO"] = "false"
+        from src.app import app
+        from src.db.setup import init_db
+        from benchmarks.seed import seed
+        from benchmarks.timing import report, summarise
+
+        engine, _ = init_db()
+        if args.database_url is None:
+            seed(engine, args.recipes)
+        latencies, errors, elapsed = asyncio.run(
+            replay(app, workload, args.requests, args.concurrency, args.recipes)
+        )
+        engine.dispose()
+
+    for name, values in latencies.items():
+        if len(values) > 0:
+            report(
+                {"request": name, "count": len(values), **summarise(values)},
+                args.output,
+            )
+    everything = [x for values in latencies.values() for x in values]
+    report(
+        {
+            "request": "all",
+            "count": len(everything),
+            "errors": errors,
+            "concurrency": args.concurrency,
+            "requests/s": round(len(everything) / elapsed, 1),
+            **summarise(everything),
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Seeds a database with N recipes expanded from the test dataset.
+
+The 201 recipes of tests/full-dataset.json are stored once, then copied until there
+are N recipes. Copies get a numbered name, one of a few authors, a rating, scaled
+amounts and sometimes one ingredient less, so names, ratings and ingredient sets
+spread the way a larger catalogue would instead of repeating exactly.
+
+    $ python -m benchmarks.seed --recipes 10000 --database-url sqlite:///bench.db
+"""
+import argparse
+import json
+import random
+import time
+from typing import Iterator
+from sqlalchemy import Engine
+from src.db.operations import bulk_import_recipes
+from src.db.setup import build_engine, construct_db_if_none_exists, metadata
+from src.schemas.recipe import BaseRecipe
+from src.settings import settings
+
+DATASET = "tests/full-dataset.json"
+# Catalogue sizes the suite reports on by default
+SIZES = (1_000, 10_000, 100_000)
+AMOUNT_FACTORS = (0.5, 0.75, 1.0, 1.5, 2.0)
+AUTHOR_COUNT = 50
+
+
+def load_dataset(path: str = DATASET) -> list[BaseRecipe]:
+    with open(path, "r") as f:
+        return [BaseRecipe(**x) for x in json.load(f)]
+
+
+def expand_recipes(
+    dataset: list[BaseRecipe], count: int, seed: int = 0
+) -> Iterator[BaseRecipe]:
+    """Yields `count` recipes, the dataset first and then altered copies of it.
+
+    The same `seed` always yields the same recipes.
+    """
+    rng = random.Random(seed)
+    for x in range(count):
+        recipe = dataset[x % len(dataset)]
+        copy_number = x // len(dataset)
+        if copy_number == 0:
+            yield recipe
+            continue
+        factor = rng.choice(AMOUNT_FACTORS)
+        ingredients = [
+            ingred.copy(update={"amount": ingred.amount * factor})
+            if ingred.amount is not None
+            else ingred
+            for ingred in recipe.ingredients
+        ]
+        if len(ingredients) > 1 and rng.random() < 0.3:
+            ingredients.pop(rng.randrange(len(ingredients)))
+        yield recipe.copy(
+            update={
+                "name": f"{recipe.name.strip()} #{copy_number}",
+                "author": f"{recipe.author} {rng.randrange(AUTHOR_COUNT)}",
+                "rating": rng.randint(1, 10),
+                "ingredients": ingredients,
+            }
+        )
+
+
+def seed(engine: Engine, count: int, seed: int = 0) -> int:
+    """Creates the schema on `engine` and stores `count` expanded recipes."""
+    construct_db_if_none_exists(engine=engine, metadata=metadata)
+    recipes = expand_recipes(load_dataset(), count, seed=seed)
+    with engine.connect() as conn:
+        return bulk_import_recipes(recipes, conn)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=SIZES[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = build_engine(
+        args.database_url, settings.copy(update={"SQLA_ECHO": False}), []
+    )
+    start = time.perf_counter()
+    count = seed(engine, args.recipes, seed=args.seed)
+    engine.dispose()
+    print(f"Seeded {count} recipes in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
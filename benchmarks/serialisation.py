@@ -0,0 +1,96 @@
+"""Compares the JSON encoding paths of recipe list responses.
+
+"validated" is what FastAPI does with a returned model list: validate it against
+the response model, `jsonable_encoder` it and encode with the stdlib. "fast json"
+and "fast orjson" are `src.serialisation.dumps` without and with orjson, as
+sent with FAST_JSON_RESPONSES. The recipes are the full test dataset.
+
+    $ python -m benchmarks.serialisation --number 50
+"""
+import argparse
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import Any, Callable
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from src.db.operations import read_recipes
+from src.db.setup import build_engine
+from src import serialisation
+from src.schemas.recipe import Recipe, ScoredRecipe
+from src.settings import settings
+from src.smarts.ingredient_index import ingredient_index
+from src.smarts.recipe_finder import RecipeFinder
+from benchmarks.seed import load_dataset, seed
+from benchmarks.timing import measure, report, summarise
+
+
+def build_encoders(response_type: Any) -> dict[str, Callable[[Any], bytes]]:
+    field = create_response_field(name="Response_benchmark", type_=response_type)
+    loop = asyncio.new_event_loop()
+    orjson = serialisation.orjson
+
+    def validated(content: Any) -> bytes:
+        data = loop.run_until_complete(
+            serialize_response(field=field, response_content=content)
+        )
+        return JSONResponse(data).body
+
+    def fast_json(content: Any) -> bytes:
+        serialisation.orjson = None
+        try:
+            return serialisation.dumps(content)
+        finally:
+            serialisation.orjson = orjson
+
+    encoders = {"validated": validated, "fast json": fast_json}
+    if orjson is not None:
+        encoders["fast orjson"] = serialisation.dumps
+    return encoders
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=50)
+    parser.add_argument("--output", help="JSON lines file the results are added to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite+pysqlite:///{Path(tmp_dir) / 'serialisation'}.db"
+        engine = build_engine(
+            database_url, settings.copy(update={"SQLA_ECHO": False}), []
+        )
+        seed(engine, len(load_dataset()))
+        ingredient_index.invalidate()
+        with engine.connect() as conn:
+            cases = {
+                "list[Recipe]": (read_recipes(conn=conn), list[Recipe]),
+                "list[ScoredRecipe]": (
+                    RecipeFinder(conn=conn).find({"garlic", "onion", "salt"}, None),
+                    list[ScoredRecipe],
+                ),
+            }
+        ingredient_index.invalidate()
+        engine.dispose()
+
+    for case, (content, response_type) in cases.items():
+        encoders = build_encoders(response_type)
+        expected = encoders["validated"](content)
+        for name, encode in encoders.items():
+            assert encode(content) == expected, f"{name} differs from validated"
+            latencies = measure(lambda: encode(content), number=args.number)
+            report(
+                {
+                    "benchmark": case,
+                    "encoder": name,
+                    "items": len(content),
+                    "bytes": len(expected),
+                    **summarise(latencies),
+                },
+                args.output,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compares read/write concurrency of the SQLite storage profiles.
+
+Several reader threads fetch recipes with their ingredients while one writer keeps
+updating recipes, each update in its own committed transaction, the way separate
+gunicorn workers share one database file. Every profile runs against its own copy
+of the seeded database.
+
+    $ python -m benchmarks.sqlite_profile --readers 4 --seconds 5
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from src.db.setup import build_engine, build_sqlite_pragmas
+from src.db.sql_operations import select_recipe_by_id_with_ingredients
+from src.settings import settings
+from benchmarks.seed import seed
+
+PROFILES = {
+    "rollback-journal": [("journal_mode", "DELETE"), ("synchronous", "FULL")],
+    "configured": build_sqlite_pragmas(settings),
+}
+
+
+def run_profile(
+    name: str, database_url: str, readers: int, seconds: float, recipe_count: int
+) -> dict[str, float | int | str]:
+    engine = build_engine(
+        database_url, settings.copy(update={"SQLA_ECHO": False}), PROFILES[name]
+    )
+    stop = threading.Event()
+    read_latencies: list[float] = []
+    writes = 0
+    lock_errors = 0
+    counter_lock = threading.Lock()
+
+    def read_loop():
+        nonlocal lock_errors
+        latencies = []
+        with engine.connect() as conn:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    select_recipe_by_id_with_ingredients(
+                        recipe_id=random.randint(1, recipe_count), conn=conn
+                    )
+                    conn.rollback()
+                except OperationalError:
+                    conn.rollback()
+                    with counter_lock:
+                        lock_errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+        with counter_lock:
+            read_latencies.extend(latencies)
+
+    def write_loop():
+        nonlocal writes, lock_errors
+        with engine.connect() as conn:
+            while not stop.is_set():
+                try:
+                    conn.execute(
+                        text("UPDATE recipe SET rating = :r WHERE recipe_id = :id"),
+                        {"r": random.randint(1, 10), "id": random.randint(1, 50)},
+                    )
+                    conn.commit()
+                    writes += 1
+                except OperationalError:
+                    conn.rollback()
+                    with counter_lock:
+                        lock_errors += 1
+
+    threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+    threads.append(threading.Thread(target=write_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    read_latencies.sort()
+    return {
+        "profile": name,
+        "reads/s": round(len(read_latencies) / seconds),
+        "writes/s": round(writes / seconds),
+        "read p50 ms": round(statistics.median(read_latencies) * 1000, 3),
+        "read p99 ms": round(read_latencies[int(len(read_latencies) * 0.99)] * 1000, 3),
+        "lock errors": lock_errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--recipes", type=int, default=2_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in PROFILES:
+            database_url = f"sqlite+pysqlite:///{Path(tmp_dir) / name}.db"
+            seed_engine = build_engine(
+                database_url, settings.copy(update={"SQLA_ECHO": False}), []
+            )
+            recipe_count = seed(seed_engine, args.recipes)
+            seed_engine.dispose()
+            print(
+                run_profile(
+                    name, database_url, args.readers, args.seconds, recipe_count
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measures the per-call cost of building statements against reusing prebuilt ones.
+
+For each hot query, the statement is either built the way `sql_operations` used to
+build it, with the values inlined as literals, or taken from `src.db.statements`
+and executed with parameters. Both forms hit the engine's compiled cache, so the
+difference is construction and cache key generation.
+
+    $ python -m benchmarks.statements --number 5000
+"""
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+from sqlalchemy import Connection, Executable
+from src.db import statements
+from src.db.setup import build_engine, ingredients_table, recipes_table
+from src.settings import settings
+from benchmarks.seed import seed
+
+
+def per_call_statements() -> dict[str, tuple[Callable[[], Executable], dict]]:
+    """Pairs of a per-call built statement and the parameters of the prebuilt one."""
+    return {
+        "recipe_by_id": (
+            lambda: statements.build_recipe_select().where(
+                recipes_table.c.recipe_id == 7
+            ),
+            {"recipe_id": 7},
+        ),
+        "recipe_with_ingredients_by_id": (
+            lambda: statements.build_recipe_with_ingredients_select_statement(
+                isouter=True
+            )
+            .where(recipes_table.c.recipe_id == 7)
+            .order_by(ingredients_table.c.ingred_id),
+            {"recipe_id": 7},
+        ),
+        "joined_recipes_by_ids": (
+            lambda: statements.build_recipe_with_ingredients_select_statement()
+            .where(recipes_table.c.recipe_id.in_(list(range(1, 51))))
+            .order_by(recipes_table.c.recipe_id),
+            {"values": list(range(1, 51))},
+        ),
+    }
+
+
+def prebuilt_statement(name: str) -> Executable:
+    statement = getattr(statements, name)
+    if isinstance(statement, statements.ValuesStatement):
+        return statement.by_values
+    return statement
+
+
+def run(conn: Connection, number: int) -> None:
+    for name, (build, params) in per_call_statements().items():
+        prebuilt = prebuilt_statement(name)
+        built_s = timeit.timeit(lambda: conn.execute(build()).all(), number=number)
+        prebuilt_s = timeit.timeit(
+            lambda: conn.execute(prebuilt, params).all(), number=number
+        )
+        print(
+            {
+                "query": name,
+                "built µs/call": round(built_s / number * 1e6, 1),
+                "prebuilt µs/call": round(prebuilt_s / number * 1e6, 1),
+                "speed-up": round(built_s / prebuilt_s, 2),
+            }
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=5000)
+    parser.add_argument("--recipes", type=int, default=1_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite+pysqlite:///{Path(tmp_dir) / 'statements'}.db"
+        engine = build_engine(
+            database_url, settings.copy(update={"SQLA_ECHO": False}), []
+        )
+        seed(engine, args.recipes)
+        with engine.connect() as conn:
+            run(conn, args.number)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Latency summaries shared by the benchmarks."""
+import json
+import statistics
+import time
+from typing import Any, Callable
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    """Nearest-rank percentile of already sorted values, `share` in [0, 1]."""
+    index = min(int(len(sorted_values) * share), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarise(latencies: list[float]) -> dict[str, float]:
+    """Mean, p50 and p99 of latencies in seconds, reported in milliseconds."""
+    latencies = sorted(latencies)
+    return {
+        "mean ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50 ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99 ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def measure(call: Callable[[], Any], number: int, warmup: int = 3) -> list[float]:
+    """Latencies of `number` calls, after `warmup` calls that are not measured."""
+    for _ in range(warmup):
+        call()
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(row: dict[str, Any], output: str | None = None) -> None:
+    """Prints a result and appends it as a JSON line to `output`, if given.
+
+    Appending keeps earlier runs, so results can be compared across commits.
+    """
+    print(row)
+    if output is not None:
+        with open(output, "a") as f:
+            f.write(json.dumps(row) + "\n")
@@ -1,23 +1,90 @@
+import argparse
 import json
+import time
+from typing import Any, Iterator, TextIO
 from sqlalchemy import MetaData, create_engine
-from src.db.tables import build_ingredients_table, build_recipes_table
-from src.db.operations import create_recipe
+from src.db.tables import (
+    build_canonical_ingredients_table,
+    build_data_generation_table,
+    build_ingredients_table,
+    build_recipe_documents_table,
+    build_recipe_search_table,
+    build_recipes_table,
+)
+from src.db.operations import bulk_import_recipes
 from src.settings import settings
 from src.schemas.recipe import BaseRecipe
 
-# creates a fresh database
-metadata = MetaData()
-metadata, recipes_table = build_recipes_table(metadata=metadata)
-metadata, ingredients_table = build_ingredients_table(metadata=metadata)
-engine = create_engine(settings.DATABASE_URL, echo=True)
-metadata.drop_all(engine)
-metadata.create_all(bind=engine)
-
-# insert sample data
-with engine.connect() as conn:
-    with open("tests/full-dataset.json", "r") as f:
-        json_data = json.load(f)
-        for recipe in json_data:
-            recipe = BaseRecipe(**recipe)
-            if create_recipe(recipe, conn) is None:
-                raise Exception("Encoding error:")
\ No newline at end of file
+
+def iter_json_array(fp: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yields the elements of a top-level JSON array one at a time.
+
+    Only one chunk of the file plus the element being decoded is held in memory,
+    so arbitrarily large datasets can be imported.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected the file to contain a JSON array")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = fp.read(chunk_size)
+            eof = chunk == ""
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Bulk loads recipes from a JSON array file into the database."
+    )
+    parser.add_argument("--file", default="tests/full-dataset.json")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="number of recipes written per transaction",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="keep existing recipes instead of creating a fresh database",
+    )
+    args = parser.parse_args()
+
+    metadata = MetaData()
+    metadata, _ = build_canonical_ingredients_table(metadata=metadata)
+    metadata, recipes_table = build_recipes_table(metadata=metadata)
+    metadata, ingredients_table = build_ingredients_table(metadata=metadata)
+    metadata, _ = build_recipe_search_table(metadata=metadata)
+    metadata, _ = build_recipe_documents_table(metadata=metadata)
+    metadata, _ = build_data_generation_table(metadata=metadata)
+    engine = create_engine(settings.DATABASE_URL)
+    if not args.append:
+        metadata.drop_all(engine)
+    metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    with engine.connect() as conn, open(args.file, "r") as f:
+        recipes = (BaseRecipe(**recipe) for recipe in iter_json_array(f))
+        count = bulk_import_recipes(recipes, conn, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} recipes in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
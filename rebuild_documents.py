@@ -0,0 +1,30 @@
+import argparse
+import time
+from src.db.operations import rebuild_recipe_documents
+from src.db.setup import get_engine
+from src.settings import settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuilds the stored recipe documents from the recipe tables."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="number of recipes read and encoded at a time",
+    )
+    args = parser.parse_args()
+    if not settings.RECIPE_DOCUMENTS_ENABLED:
+        parser.error("set RECIPE_DOCUMENTS_ENABLED=true, as the app will run with it")
+
+    start = time.perf_counter()
+    with get_engine().connect() as conn:
+        count = rebuild_recipe_documents(conn, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Stored {count} recipe documents in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,53 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import FastAPI
+from src import instrumentation
+from src.db.cache import CacheStats, recipe_cache
+from src.db.setup import dispose_db, init_db
 from src.routers import recipes
+from src.settings import settings
+from src.warm_up import warm_up
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Sets up the datastore, and optionally warms up, before serving requests."""
+    engine, async_engine = init_db()
+    if settings.INSTRUMENTATION_ENABLED:
+        instrumentation.instrument_engine(engine)
+        instrumentation.instrument_engine(async_engine.sync_engine)
+    app.state.warm_up_seconds = {}
+    if settings.WARM_UP_ENABLED:
+        app.state.warm_up_seconds = await warm_up(
+            engine, async_engine, pool_size=settings.DB_POOL_SIZE
+        )
+        logger.info("Warmed up in %s", app.state.warm_up_seconds)
+    yield
+    await dispose_db()
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = instrumentation.InstrumentedRoute
 app.include_router(recipes.router)
+if settings.INSTRUMENTATION_ENABLED:
+    # The engines are instrumented by `lifespan`, once they exist
+    instrumentation.install(
+        app,
+        engines=[],
+        profile_sample_rate=settings.PROFILE_SAMPLE_RATE,
+        profile_keep_slowest=settings.PROFILE_KEEP_SLOWEST,
+        profile_dir=settings.PROFILE_DIR,
+    )
 
 
 @app.get("/")
 def read_root():
     return {"message": "it's working! it's working!!"}
+
+
+@app.get("/cache/stats")
+def read_cache_stats() -> CacheStats:
+    return recipe_cache.stats()
@@ -0,0 +1,184 @@
+"""Async counterparts of `src.db.operations`.
+
+Each function hands the synchronous implementation to `AsyncConnection.run_sync`.
+SQLAlchemy runs it inside a greenlet and turns every statement it executes into an
+awaited call on the async driver, so the event loop keeps serving other requests
+while a query is in flight. The statements, caching and index maintenance stay in
+one place instead of being duplicated for each execution model.
+
+Finding recipes by ingredient is the exception. It spends its time scoring in
+Python, which would hold up the event loop, and it builds the shared ingredient
+index, whose locks only exclude threads. It runs with a synchronous connection
+in a worker thread instead.
+"""
+import asyncio
+from typing import AsyncIterator
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncConnection
+from src.db import operations
+from src.db.setup import get_engine
+from src.db.sql_operations import build_recipe_export_statement
+from src.schemas.recipe import (
+    BaseRecipe,
+    PantryRecipe,
+    Recipe,
+    RecipePatch,
+    ScoredRecipe,
+)
+from src.smarts.recipe_finder import RecipeFinder
+
+
+async def create_recipe(new_recipe: BaseRecipe, conn: AsyncConnection) -> Recipe:
+    return await conn.run_sync(
+        lambda sync_conn: operations.create_recipe(new_recipe, sync_conn)
+    )
+
+
+async def create_recipes(
+    new_recipes: list[BaseRecipe], conn: AsyncConnection
+) -> list[Recipe]:
+    return await conn.run_sync(
+        lambda sync_conn: operations.create_recipes(new_recipes, sync_conn)
+    )
+
+
+async def read_recipe_by_id(id: int, conn: AsyncConnection) -> Recipe | None:
+    return await conn.run_sync(
+        lambda sync_conn: operations.read_recipe_by_id(id=id, conn=sync_conn)
+    )
+
+
+async def read_recipe_document(id: int, conn: AsyncConnection) -> bytes | None:
+    return await conn.run_sync(
+        lambda sync_conn: operations.read_recipe_document(id=id, conn=sync_conn)
+    )
+
+
+async def read_recipes_matching_query(
+    conn: AsyncConnection,
+    name: str | None,
+    author: str | None,
+    ingredients: list[str] | None,
+    limit: int | None = None,
+    after: tuple[str, int] | None = None,
+) -> list[Recipe]:
+    return await conn.run_sync(
+        lambda sync_conn: operations.read_recipes_matching_query(
+            conn=sync_conn,
+            name=name,
+            author=author,
+            ingredients=ingredients,
+            limit=limit,
+            after=after,
+        )
+    )
+
+
+async def read_recipes(conn: AsyncConnection) -> list[Recipe] | None:
+    return await conn.run_sync(
+        lambda sync_conn: operations.read_recipes(conn=sync_conn)
+    )
+
+
+async def stream_recipes(
+    conn: AsyncConnection, batch_size: int = 500
+) -> AsyncIterator[Recipe]:
+    """Yields every stored recipe, ordered by recipe_id.
+
+    Rows come from a server-side cursor, `batch_size` at a time. Each recipe is
+    yielded as soon as its last row has been read, so memory use does not grow with
+    the size of the catalogue.
+    """
+    stmt = build_recipe_export_statement().execution_options(yield_per=batch_size)
+    result = await conn.stream(stmt)
+    recipe_rows: list[Row] = []
+    async for row in result:
+        if len(recipe_rows) > 0 and recipe_rows[0].recipe_id != row.recipe_id:
+            yield operations._combine_joined_recipe_records(recipe_rows)[0]
+            recipe_rows = []
+        recipe_rows.append(row)
+    if len(recipe_rows) > 0:
+        yield operations._combine_joined_recipe_records(recipe_rows)[0]
+
+
+async def search_recipes(
+    query: str, conn: AsyncConnection, limit: int, offset: int = 0
+) -> list[ScoredRecipe]:
+    return await conn.run_sync(
+        lambda sync_conn: operations.search_recipes(
+            query=query, conn=sync_conn, limit=limit, offset=offset
+        )
+    )
+
+
+async def update_recipe(recipe: Recipe, conn: AsyncConnection) -> Recipe:
+    return await conn.run_sync(
+        lambda sync_conn: operations.update_recipe(recipe, sync_conn)
+    )
+
+
+async def patch_recipe(
+    recipe_id: int, patch: RecipePatch, conn: AsyncConnection
+) -> Recipe | None:
+    return await conn.run_sync(
+        lambda sync_conn: operations.patch_recipe(recipe_id, patch, sync_conn)
+    )
+
+
+async def update_recipes(recipes: list[Recipe], conn: AsyncConnection) -> list[Recipe]:
+    return await conn.run_sync(
+        lambda sync_conn: operations.update_recipes(recipes, sync_conn)
+    )
+
+
+async def delete_recipes(recipe_ids: list[int], conn: AsyncConnection) -> list[int]:
+    return await conn.run_sync(
+        lambda sync_conn: operations.delete_recipes(
+            recipe_ids=recipe_ids, conn=sync_conn
+        )
+    )
+
+
+async def delete_recipe(recipe_id: int, conn: AsyncConnection):
+    await conn.run_sync(
+        lambda sync_conn: operations.delete_recipe(recipe_id=recipe_id, conn=sync_conn)
+    )
+
+
+async def find_recipes(
+    ingredients: set[str],
+    exclude: set[int] | None,
+    limit: int | None = None,
+    offset: int = 0,
+    prefer_rare_ingredients: bool = False,
+    ingred_amount_is_factor: bool = False,
+    prefer_popular_recipes: bool = False,
+    exact: bool = False,
+) -> list[ScoredRecipe]:
+    def find() -> list[ScoredRecipe]:
+        with get_engine().connect() as conn:
+            return RecipeFinder(
+                conn=conn,
+                prefer_rare_ingredients=prefer_rare_ingredients,
+                ingred_amount_is_factor=ingred_amount_is_factor,
+                prefer_popular_recipes=prefer_popular_recipes,
+                exact_ingredients=exact,
+            ).find(ingredients, exclude, limit=limit, offset=offset)
+
+    return await asyncio.to_thread(find)
+
+
+async def find_recipes_by_pantry(
+    pantry: set[str],
+    max_missing: int = 0,
+    limit: int | None = None,
+    offset: int = 0,
+    exact: bool = False,
+) -> list[PantryRecipe]:
+    def find() -> list[PantryRecipe]:
+        with get_engine().connect() as conn:
+            return RecipeFinder(conn=conn, exact_ingredients=exact).find_by_pantry(
+                pantry, max_missing=max_missing, limit=limit, offset=offset
+            )
+
+    return await asyncio.to_thread(find)
@@ -0,0 +1,240 @@
+import pickle
+import time
+from collections import OrderedDict
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable, Hashable, Protocol
+from pydantic import BaseModel
+from src.settings import settings
+
+
+class EntryKind(str, Enum):
+    """What a cache entry holds, which decides when a write invalidates it.
+
+    `RECIPE` entries hold one recipe and are keyed `(EntryKind.RECIPE, recipe_id)`.
+    `QUERY` entries hold the result of a query over many recipes. Any write can
+    change which recipes a query returns, or shift its pages, so every write drops
+    all of them.
+    """
+
+    RECIPE = "recipe"
+    QUERY = "query"
+
+
+class CacheStats(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+    max_entries: int
+    ttl_seconds: float
+
+
+class RecipeCache(Protocol):
+    """The interface the read paths use, so the backend can be swapped."""
+
+    def get(self, key: tuple[Hashable, ...]) -> Any | None:
+        ...
+
+    def epoch(self) -> int:
+        ...
+
+    def set(self, key: tuple[Hashable, ...], value: Any, epoch: int) -> None:
+        ...
+
+    def invalidate_recipe(self, recipe_id: int) -> None:
+        ...
+
+    def invalidate_queries(self) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+    def stats(self) -> CacheStats:
+        ...
+
+
+class NullCache:
+    """A cache that stores nothing. Every read goes to the datastore."""
+
+    def __init__(self):
+        self._misses = 0
+
+    def get(self, key: tuple[Hashable, ...]) -> Any | None:
+        self._misses += 1
+        return None
+
+    def epoch(self) -> int:
+        return 0
+
+    def set(self, key: tuple[Hashable, ...], value: Any, epoch: int) -> None:
+        pass
+
+    def invalidate_recipe(self, recipe_id: int) -> None:
+        pass
+
+    def invalidate_queries(self) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            backend="none",
+            hits=0,
+            misses=self._misses,
+            evictions=0,
+            invalidations=0,
+            size=0,
+            max_entries=0,
+            ttl_seconds=0,
+        )
+
+
+class LRUCache:
+    """A size-bounded, least-recently-used cache whose entries expire after a TTL.
+
+    Keys are tuples whose first element is an `EntryKind`. `None` is never stored,
+    so `get` returning `None` always means a miss.
+
+    Values are stored pickled, so every `get` returns a fresh copy that callers may
+    modify. A reader takes the `epoch` before it reads the datastore and passes it to
+    `set`; if anything was invalidated in between, the value may predate that write
+    and is dropped.
+
+    The cache lives in one process. With several workers, a write only invalidates
+    the entries of the worker that made it, and the others serve stale reads for up
+    to `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = Lock()
+        self._entries: OrderedDict[tuple[Hashable, ...], tuple[float, bytes]]
+        self._entries = OrderedDict()
+        self._epoch = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key: tuple[Hashable, ...]) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self._evictions += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return pickle.loads(value)
+
+    def epoch(self) -> int:
+        """Counts the invalidations so far; see `set`."""
+        with self._lock:
+            return self._epoch
+
+    def set(self, key: tuple[Hashable, ...], value: Any, epoch: int) -> None:
+        if value is None:
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[key] = (self._clock() + self.ttl_seconds, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_recipe(self, recipe_id: int) -> None:
+        """Drops the entry of one recipe and every query entry."""
+        with self._lock:
+            self._epoch += 1
+            if self._entries.pop((EntryKind.RECIPE, recipe_id), None) is not None:
+                self._invalidations += 1
+            self._drop_queries()
+
+    def invalidate_queries(self) -> None:
+        """Drops every query entry, e.g. because a new recipe was created."""
+        with self._lock:
+            self._epoch += 1
+            self._drop_queries()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                backend="lru",
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl_seconds,
+            )
+
+    def _drop_queries(self) -> None:
+        query_keys = [x for x in self._entries if x[0] is EntryKind.QUERY]
+        for key in query_keys:
+            del self._entries[key]
+        self._invalidations += len(query_keys)
+
+
+def build_cache(backend: str, max_entries: int, ttl_seconds: float) -> RecipeCache:
+    if backend == "lru":
+        return LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == "none":
+        return NullCache()
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def query_key(name: str, *params: Any) -> tuple[Hashable, ...]:
+    """Normalises query parameters into a cache key.
+
+    Sets and lists are sorted, so the order in which a client lists query values
+    does not create separate entries. Tuples are kept as they are, since their
+    order carries meaning, e.g. a pagination key.
+    """
+    normalised: list[Hashable] = [EntryKind.QUERY, name]
+    for param in params:
+        if isinstance(param, (set, frozenset, list)):
+            normalised.append(tuple(sorted(param)))
+        else:
+            normalised.append(param)
+    return tuple(normalised)
+
+
+def recipe_key(recipe_id: int) -> tuple[Hashable, ...]:
+    return (EntryKind.RECIPE, recipe_id)
+
+
+recipe_cache = build_cache(
+    backend=settings.CACHE_BACKEND,
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CACHE_TTL_SECONDS,
+)
@@ -1,32 +1,62 @@
-from sqlalchemy import Connection
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+from sqlalchemy import Connection, Row
 from src.schemas.recipe import (
     Recipe,
     BaseRecipe,
-    RecipeInDB,
     Ingredient,
-    JoinedRecipeRecord,
+    RecipePatch,
+    ScoredRecipe,
 )
 from src.db.sql_operations import (
     insert_recipe,
     select_ingredients_by_recipe_id,
-    select_recipes,
     update_recipe_entry,
     delete_recipe_by_id,
     delete_ingredients_of_recipe,
     insert_ingredients,
+    insert_ingredients_of_recipes,
+    insert_recipes,
     select_recipe_by_id,
     select_recipe_by_id_with_ingredients,
-    select_recipe_ids_by_ingredients,
-    select_recipes_by_ids,
+    build_fts_match_query,
+    select_joined_recipes_by_filters,
+    select_joined_recipes_by_ids,
+    select_recipe_ids_by_search,
     select_joined_recipes_matching_query,
+    insert_recipes_returning,
+    insert_ingredients_of_recipes_returning,
+    update_recipe_entries,
+    select_recipe_created_at_by_ids,
+    delete_ingredients_of_recipes,
+    delete_recipes_by_ids,
+    select_ingredient_rows_by_recipe_id,
+    update_ingredient_entries,
+    delete_ingredients_by_ids,
+    select_recipe_ids,
+    select_recipe_document_by_id,
+    upsert_recipe_documents,
+    delete_recipe_documents,
+    bump_data_generation,
+    has_recipe_search,
+    refresh_recipe_search,
 )
+from src.serialisation import dumps
+from src.settings import settings
+from src.db.cache import query_key, recipe_cache, recipe_key
+from src.smarts.ingredient_index import ingredient_index
+
+T = TypeVar("T")
+
+
+class SearchUnavailable(Exception):
+    """The database has no full-text search table, i.e. SQLite lacks FTS5."""
 
 
 def create_recipe(new_recipe: BaseRecipe, conn: Connection) -> Recipe:
     """Creates and stores a new recipe in the datastore."""
     new_pk = insert_recipe(new_recipe=new_recipe, conn=conn)
     insert_ingredients(ingredients=new_recipe.ingredients, recipe_id=new_pk, conn=conn)
-    conn.commit()
     recipe_in_db = select_recipe_by_id(id=new_pk, conn=conn)
     if recipe_in_db is None:
         raise Exception(
@@ -35,62 +65,191 @@ def create_recipe(new_recipe: BaseRecipe, conn: Connection) -> Recipe:
     ingredient_list = select_ingredients_by_recipe_id(recipe_id=new_pk, conn=conn)
     recipe_in_db.ingredients = ingredient_list
     recipe = Recipe(**recipe_in_db.dict())
+    _refresh_recipe_search([new_pk], conn)
+    _store_recipe_documents([recipe], conn)
+    data_generation = bump_data_generation(conn=conn)
+    conn.commit()
+    ingredient_index.add_recipe(
+        new_pk, [x.ingred_name for x in recipe.ingredients], data_generation
+    )
+    recipe_cache.invalidate_queries()
     return recipe
 
 
+def bulk_import_recipes(
+    new_recipes: Iterable[BaseRecipe], conn: Connection, batch_size: int = 500
+) -> int:
+    """Stores many new recipes in the datastore and returns how many were stored.
+
+    Recipes are consumed lazily from `new_recipes` and written `batch_size` at a
+    time: one executemany for the recipes, one for all of their ingredients and one
+    commit per batch. Unlike `create_recipe`, nothing is read back, except to
+    store the recipe documents when RECIPE_DOCUMENTS_ENABLED is set.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    count = 0
+    for batch in _batched(new_recipes, batch_size):
+        new_pks = insert_recipes(new_recipes=batch, conn=conn)
+        insert_ingredients_of_recipes(
+            ingredients_by_recipe=[
+                (new_pk, new_recipe.ingredients)
+                for new_pk, new_recipe in zip(new_pks, batch)
+            ],
+            conn=conn,
+        )
+        _refresh_recipe_search(new_pks, conn)
+        if settings.RECIPE_DOCUMENTS_ENABLED:
+            _refresh_recipe_documents(new_pks, conn)
+        bump_data_generation(conn=conn)
+        conn.commit()
+        count += len(batch)
+    ingredient_index.invalidate()
+    recipe_cache.invalidate_queries()
+    return count
+
+
+def create_recipes(new_recipes: list[BaseRecipe], conn: Connection) -> list[Recipe]:
+    """Creates and stores many new recipes in one transaction.
+
+    Recipes and ingredients are each written with one executemany and come back
+    through RETURNING, so, unlike `create_recipe`, nothing is read back.
+    """
+    recipe_rows = insert_recipes_returning(new_recipes=new_recipes, conn=conn)
+    ingredient_rows = insert_ingredients_of_recipes_returning(
+        ingredients_by_recipe=[
+            (row.recipe_id, new_recipe.ingredients)
+            for row, new_recipe in zip(recipe_rows, new_recipes)
+        ],
+        conn=conn,
+    )
+    recipes = [Recipe.construct(**x._asdict(), ingredients=[]) for x in recipe_rows]
+    _attach_ingredient_records(recipes, ingredient_rows)
+    _refresh_recipe_search([x.recipe_id for x in recipes], conn)
+    _store_recipe_documents(recipes, conn)
+    data_generation = bump_data_generation(conn=conn)
+    conn.commit()
+    for recipe in recipes:
+        ingredient_index.add_recipe(
+            recipe.recipe_id,
+            [x.ingred_name for x in recipe.ingredients],
+            data_generation,
+        )
+    recipe_cache.invalidate_queries()
+    return recipes
+
+
 def read_recipe_by_id(id: int, conn: Connection) -> Recipe | None:
     """Fetches a stored recipe from the datastore.
 
     If there is no matching entity in the datastore, returns None
     """
+    recipe = recipe_cache.get(recipe_key(id))
+    if recipe is not None:
+        return recipe
+    epoch = recipe_cache.epoch()
     recipe = select_recipe_by_id_with_ingredients(recipe_id=id, conn=conn)
-    if recipe is None:
-        return None
+    recipe_cache.set(recipe_key(id), recipe, epoch)
     return recipe
 
 
+def read_recipe_document(id: int, conn: Connection) -> bytes | None:
+    """Fetches the stored response body of a recipe, as encoded JSON.
+
+    Returns None if RECIPE_DOCUMENTS_ENABLED is not set or no document is stored,
+    in which case the recipe has to be read with `read_recipe_by_id`.
+    """
+    if not settings.RECIPE_DOCUMENTS_ENABLED:
+        return None
+    return select_recipe_document_by_id(recipe_id=id, conn=conn)
+
+
+def rebuild_recipe_documents(conn: Connection, batch_size: int = 500) -> int:
+    """Replaces every stored recipe document and returns how many were stored.
+
+    Recipes are read `batch_size` at a time, all in one transaction, so readers see
+    either the old documents or the new ones. Only run it with the triggers of
+    `build_recipe_documents_table` installed, i.e. with RECIPE_DOCUMENTS_ENABLED set,
+    or later writes leave the documents stale.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    delete_recipe_documents(conn=conn)
+    count = 0
+    for batch in _batched(select_recipe_ids(conn=conn), batch_size):
+        count += _refresh_recipe_documents(batch, conn)
+    conn.commit()
+    return count
+
+
 def read_recipes_matching_query(
     conn: Connection,
     name: str | None,
     author: str | None,
     ingredients: list[str] | None,
-):
-    full_recipe_list: list[RecipeInDB] = []
-    qualifying_recipe_ids = select_recipe_ids_by_ingredients(
-        conn=conn, ingred_names=ingredients
+    limit: int | None = None,
+    after: tuple[str, int] | None = None,
+) -> list[Recipe]:
+    """Fetches stored recipes matching any of the query parameters.
+
+    Recipes and their ingredients are read with one joined query, so the number of
+    queries does not depend on the number of matching recipes. Recipes are ordered by
+    (name, recipe_id); pass `limit` and the key of the last recipe of the previous
+    page as `after` to read one page at a time.
+    """
+    key = query_key("recipes", name, author, ingredients, limit, after)
+    recipes = recipe_cache.get(key)
+    if recipes is not None:
+        return recipes
+    epoch = recipe_cache.epoch()
+    joined_recipe_records = select_joined_recipes_by_filters(
+        conn=conn,
+        name=name,
+        author=author,
+        ingred_names=ingredients,
+        limit=limit,
+        after=after,
     )
-    qualifying_recipes = select_recipes(conn=conn, name=name, author=author)
-    if qualifying_recipes is None and qualifying_recipe_ids is None:
-        return None
-    elif qualifying_recipes is not None and qualifying_recipe_ids is None:
-        full_recipe_list = qualifying_recipes
-    elif qualifying_recipes is None and qualifying_recipe_ids is not None:
-        resp = select_recipes_by_ids(conn=conn, recipe_ids=list(qualifying_recipe_ids))
-        if resp is not None:
-            full_recipe_list = resp
-    elif qualifying_recipes is not None and qualifying_recipe_ids is not None:
-        newly_identified_ids = []
-        recipe_dict = {x.recipe_id: x for x in qualifying_recipes}
-        for id in qualifying_recipe_ids:
-            if id not in recipe_dict:
-                newly_identified_ids.append(id)
-
-        if len(newly_identified_ids) > 0:
-            resp = select_recipes_by_ids(conn=conn, recipe_ids=newly_identified_ids)
-            if resp is not None:
-                full_recipe_list = qualifying_recipes + resp
-        else:
-            full_recipe_list = qualifying_recipes
-
-    recipes: list[Recipe] = []
-    for partial_recipe in full_recipe_list:
-        partial_recipe.ingredients = select_ingredients_by_recipe_id(
-            recipe_id=partial_recipe.recipe_id, conn=conn
-        )
-        recipes.append(Recipe(**partial_recipe.dict()))
+    recipes = _combine_joined_recipe_records(joined_recipe_records)
+    recipe_cache.set(key, recipes, epoch)
     return recipes
 
 
+def search_recipes(
+    query: str, conn: Connection, limit: int, offset: int = 0
+) -> list[ScoredRecipe]:
+    """Full-text search over recipe names, ingredient names and instructions.
+
+    Words are matched after stemming, so "onions" finds "onion". Recipes are ranked
+    by bm25; the returned score is the negated rank, so higher is better. Raises
+    SearchUnavailable if the database has no full-text search.
+    """
+    if not has_recipe_search(conn=conn):
+        raise SearchUnavailable("Full-text search is not available")
+    match_query = build_fts_match_query(query)
+    if match_query is None:
+        return []
+    key = query_key("search", match_query, limit, offset)
+    scored_recipes = recipe_cache.get(key)
+    if scored_recipes is not None:
+        return scored_recipes
+    epoch = recipe_cache.epoch()
+    ranking = select_recipe_ids_by_search(
+        conn=conn, match_query=match_query, limit=limit, offset=offset
+    )
+    joined_records = select_joined_recipes_by_ids(
+        conn=conn, recipe_ids=[recipe_id for recipe_id, _ in ranking]
+    )
+    recipes = {x.recipe_id: x for x in _combine_joined_recipe_records(joined_records)}
+    scored_recipes = [
+        ScoredRecipe(score=-rank, recipe=recipes[recipe_id])
+        for recipe_id, rank in ranking
+        if recipe_id in recipes
+    ]
+    recipe_cache.set(key, scored_recipes, epoch)
+    return scored_recipes
+
+
 def update_recipe(recipe: Recipe, conn: Connection) -> Recipe:
     """Updates a stored recipe and returns it."""
     recipe_in_db = select_recipe_by_id(id=recipe.recipe_id, conn=conn)
@@ -99,11 +258,9 @@ def update_recipe(recipe: Recipe, conn: Connection) -> Recipe:
             "Recipe does not exist in database and as such cannot be updated"
         )
     update_recipe_entry(recipe=recipe, conn=conn)
-    delete_ingredients_of_recipe(recipe_id=recipe.recipe_id, conn=conn)
-    insert_ingredients(
+    _sync_ingredients(
         recipe_id=recipe.recipe_id, ingredients=recipe.ingredients, conn=conn
     )
-    conn.commit()
     recipe_in_db = select_recipe_by_id(id=recipe.recipe_id, conn=conn)
     if recipe_in_db is None:
         raise Exception(
@@ -114,54 +271,252 @@ def update_recipe(recipe: Recipe, conn: Connection) -> Recipe:
     )
     recipe_in_db.ingredients = ingredient_list
     recipe = Recipe(**recipe_in_db.dict())
+    _refresh_recipe_search([recipe.recipe_id], conn)
+    _store_recipe_documents([recipe], conn)
+    data_generation = bump_data_generation(conn=conn)
+    conn.commit()
+    # Replaced even if the ingredients did not change, so the index generation
+    # moves on and scores derived from the rating are refreshed
+    ingredient_index.replace_recipe(
+        recipe.recipe_id, [x.ingred_name for x in recipe.ingredients], data_generation
+    )
+    recipe_cache.invalidate_recipe(recipe.recipe_id)
     return recipe
 
 
+def patch_recipe(recipe_id: int, patch: RecipePatch, conn: Connection) -> Recipe | None:
+    """Updates only the fields set in `patch` and returns the recipe.
+
+    Returns None if the recipe is not stored.
+    """
+    recipe = select_recipe_by_id_with_ingredients(recipe_id=recipe_id, conn=conn)
+    if recipe is None:
+        return None
+    changes = {field: getattr(patch, field) for field in patch.__fields_set__}
+    return update_recipe(recipe.copy(update=changes), conn)
+
+
+def update_recipes(recipes: list[Recipe], conn: Connection) -> list[Recipe]:
+    """Updates many stored recipes in one transaction and returns them.
+
+    Raises a LookupError, and changes nothing, if any of the recipes is not stored.
+    """
+    recipe_ids = [x.recipe_id for x in recipes]
+    created_at = select_recipe_created_at_by_ids(conn=conn, recipe_ids=recipe_ids)
+    missing = [x for x in recipe_ids if x not in created_at]
+    if len(missing) > 0:
+        conn.rollback()
+        raise LookupError(
+            f"Recipes {missing} do not exist in database and cannot be updated"
+        )
+    modified_at = update_recipe_entries(recipes=recipes, conn=conn)
+    delete_ingredients_of_recipes(recipe_ids=recipe_ids, conn=conn)
+    ingredient_rows = insert_ingredients_of_recipes_returning(
+        ingredients_by_recipe=[(x.recipe_id, x.ingredients) for x in recipes],
+        conn=conn,
+    )
+    updated = [
+        recipe.copy(
+            update={
+                "created_at": created_at[recipe.recipe_id],
+                "modified_at": modified_at,
+                "ingredients": [],
+            }
+        )
+        for recipe in recipes
+    ]
+    _attach_ingredient_records(updated, ingredient_rows)
+    _refresh_recipe_search(recipe_ids, conn)
+    _store_recipe_documents(updated, conn)
+    data_generation = bump_data_generation(conn=conn)
+    conn.commit()
+    for recipe in updated:
+        ingredient_index.replace_recipe(
+            recipe.recipe_id,
+            [x.ingred_name for x in recipe.ingredients],
+            data_generation,
+        )
+        recipe_cache.invalidate_recipe(recipe.recipe_id)
+    return updated
+
+
+def delete_recipes(recipe_ids: list[int], conn: Connection) -> list[int]:
+    """Removes many recipes, with their ingredients, in one transaction.
+
+    Returns the IDs of the recipes that were stored and are now removed.
+    """
+    delete_ingredients_of_recipes(recipe_ids=recipe_ids, conn=conn)
+    deleted = delete_recipes_by_ids(recipe_ids=recipe_ids, conn=conn)
+    data_generation = bump_data_generation(conn=conn)
+    conn.commit()
+    for recipe_id in deleted:
+        ingredient_index.remove_recipe(recipe_id, data_generation)
+        recipe_cache.invalidate_recipe(recipe_id)
+    return deleted
+
+
 def delete_recipe(recipe_id: int, conn: Connection):
-    """Removes recipe from datastore"""
+    """Removes recipe, with its ingredients, from datastore"""
+    delete_ingredients_of_recipe(recipe_id=recipe_id, conn=conn)
     delete_recipe_by_id(recipe_id=recipe_id, conn=conn)
+    data_generation = bump_data_generation(conn=conn)
     conn.commit()
+    ingredient_index.remove_recipe(recipe_id, data_generation)
+    recipe_cache.invalidate_recipe(recipe_id)
 
 
 def read_recipes(conn: Connection):
+    key = query_key("all_recipes")
+    recipes = recipe_cache.get(key)
+    if recipes is not None:
+        return recipes
+    epoch = recipe_cache.epoch()
     joined_recipe_records = select_joined_recipes_matching_query(
         conn=conn, name=None, author=None, ingredients=None
     )
     if joined_recipe_records is None:
         return None
-    return _combine_joined_recipe_records(joined_recipe_records)
+    recipes = _combine_joined_recipe_records(joined_recipe_records)
+    recipe_cache.set(key, recipes, epoch)
+    return recipes
 
 
-def _combine_joined_recipe_records(
-    joined_records: list[JoinedRecipeRecord],
-) -> list[Recipe]:
+def _sync_ingredients(
+    recipe_id: int, ingredients: list[Ingredient], conn: Connection
+) -> None:
+    """Brings the stored ingredients of a recipe in line with `ingredients`.
+
+    Stored rows are compared with the new list position by position, in insertion
+    order. Only rows whose values differ are updated, surplus rows are deleted and
+    missing ones inserted, so an unchanged list costs a single SELECT.
+    """
+    stored_rows = select_ingredient_rows_by_recipe_id(recipe_id=recipe_id, conn=conn)
+    changed_rows: list[tuple[int, Ingredient]] = []
+    for (ingred_id, *stored_values), ingred in zip(stored_rows, ingredients):
+        new_values = [
+            ingred.ingred_name,
+            ingred.amount,
+            ingred.unit,
+            ingred.notes,
+            ingred.group,
+        ]
+        if stored_values != new_values:
+            changed_rows.append((ingred_id, ingred))
+    update_ingredient_entries(ingredients_by_id=changed_rows, conn=conn)
+    surplus_ids = [x.ingred_id for x in stored_rows[len(ingredients) :]]
+    delete_ingredients_by_ids(ingred_ids=surplus_ids, conn=conn)
+    new_ingredients = ingredients[len(stored_rows) :]
+    insert_ingredients(ingredients=new_ingredients, recipe_id=recipe_id, conn=conn)
+
+
+def _refresh_recipe_search(recipe_ids: list[int], conn: Connection) -> None:
+    """Rewrites the full-text search rows of `recipe_ids`, if there is a search table.
+
+    Call this after the last write to the recipes in the transaction.
+    """
+    if has_recipe_search(conn=conn):
+        refresh_recipe_search(recipe_ids=recipe_ids, conn=conn)
+
+
+def _store_recipe_documents(recipes: list[Recipe], conn: Connection) -> None:
+    """Stores the response bodies of `recipes` if RECIPE_DOCUMENTS_ENABLED is set.
+
+    Call this after the last write to the recipes in the transaction: the triggers
+    of `build_recipe_documents_table` drop a document whenever its recipe changes.
+    """
+    if not settings.RECIPE_DOCUMENTS_ENABLED:
+        return
+    upsert_recipe_documents(
+        documents=[(x.recipe_id, dumps(x)) for x in recipes], conn=conn
+    )
+
+
+def _refresh_recipe_documents(recipe_ids: list[int], conn: Connection) -> int:
+    """Reads the given recipes and stores their documents, returning how many."""
+    recipes = _combine_joined_recipe_records(
+        select_joined_recipes_by_ids(conn=conn, recipe_ids=recipe_ids)
+    )
+    upsert_recipe_documents(
+        documents=[(x.recipe_id, dumps(x)) for x in recipes], conn=conn
+    )
+    return len(recipes)
+
+
+def _batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _combine_joined_recipe_records(joined_records: Iterable[Row]) -> list[Recipe]:
+    """Groups joined recipe/ingredient rows into recipes, keeping the row order.
+
+    The rows must have the columns of `build_recipe_with_ingredients_select_statement`
+    and come from our own tables. That data was validated on the way in, so the
+    models are built with `construct()` instead of being validated once per row.
+    Rows of an outer join with no ingredient only contribute the recipe.
+    """
     recipes_dict: dict[int, Recipe] = {}
-    for r in joined_records:
-        if r.recipe_id in recipes_dict:
-            recipes_dict[r.recipe_id].ingredients.append(
-                Ingredient(
-                    ingred_name=r.ingred_name,
-                    amount=r.amount,
-                    unit=r.unit,
-                    notes=r.notes,
-                    group=r.group,
-                )
+    for (
+        recipe_id,
+        name,
+        author,
+        rating,
+        prep_time,
+        cook_time,
+        created_at,
+        modified_at,
+        instructions,
+        ingred_name,
+        amount,
+        unit,
+        notes,
+        group,
+    ) in joined_records:
+        recipe = recipes_dict.get(recipe_id)
+        if recipe is None:
+            recipe = Recipe.construct(
+                recipe_id=recipe_id,
+                name=name,
+                author=author,
+                rating=rating,
+                prep_time=prep_time,
+                cook_time=cook_time,
+                created_at=created_at,
+                modified_at=modified_at,
+                instructions=instructions,
+                ingredients=[],
             )
-        elif r.recipe_id not in recipes_dict:
-            r.ingredients = []
-            r.ingredients.append(
-                Ingredient(
-                    ingred_name=r.ingred_name,
-                    amount=r.amount,
-                    unit=r.unit,
-                    notes=r.notes,
-                    group=r.group,
+            recipes_dict[recipe_id] = recipe
+        if ingred_name is not None:
+            recipe.ingredients.append(
+                Ingredient.construct(
+                    ingred_name=ingred_name,
+                    amount=amount,
+                    unit=unit,
+                    notes=notes,
+                    group=group,
                 )
             )
-            recipe = Recipe(
-                **r.dict(exclude={"ingred_name", "amount", "unit", "notes", "group"})
-            )
-            recipes_dict[r.recipe_id] = recipe
+    return list(recipes_dict.values())
 
-    recipes = [value for value in recipes_dict.values()]
-    return recipes
+
+def _attach_ingredient_records(
+    recipes: list[Recipe], ingredient_records: Iterable[Row]
+) -> None:
+    """Appends ingredient rows to the recipes they belong to, keeping the row order.
+
+    Rows are (recipe_id, ingred_name, amount, unit, notes, group), as returned by
+    `insert_ingredients_of_recipes_returning`.
+    """
+    recipes_by_id = {x.recipe_id: x for x in recipes}
+    for recipe_id, ingred_name, amount, unit, notes, group in ingredient_records:
+        recipes_by_id[recipe_id].ingredients.append(
+            Ingredient.construct(
+                ingred_name=ingred_name,
+                amount=amount,
+                unit=unit,
+                notes=notes,
+                group=group,
+            )
+        )
@@ -1,33 +1,367 @@
 from pathlib import Path
+from threading import Lock
+from typing import Any, AsyncIterator, Iterable
 from sqlalchemy import (
+    AsyncAdaptedQueuePool,
+    Connection,
+    Table,
+    bindparam,
+    select,
+    update,
     create_engine,
+    event,
+    make_url,
     MetaData,
     inspect,
+    text,
     Engine,
+    QueuePool,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.schema import CreateColumn
+
+from src.settings import Settings, settings
+from src.smarts.normaliser import normalise_ingredient_name
+from src.db.tables import (
+    DATA_GENERATION_DDL,
+    RECIPE_DOCUMENT_DDL,
+    RECIPE_DOCUMENT_TRIGGERS,
+    RECIPE_SEARCH_DDL,
+    build_canonical_ingredients_table,
+    build_data_generation_table,
+    build_recipes_table,
+    build_ingredients_table,
+    build_recipe_documents_table,
+    build_recipe_search_table,
+    supports_fts5,
 )
 
-from src.settings import settings
-from src.db.tables import build_recipes_table, build_ingredients_table
 
+def construct_db_if_none_exists(
+    engine: Engine, metadata: MetaData, settings: Settings = settings
+) -> None:
+    """Creates missing tables, then migrates existing tables to the declared schema.
 
-def construct_db_if_none_exists(engine: Engine, metadata: MetaData) -> None:
+    `create_all` only emits the indexes of tables it creates, so databases created
+    before a table, column or index was declared are brought up to date here.
+    """
     Path(f"{Path.cwd()}/instance").mkdir(exist_ok=True)
     inspector = inspect(engine)
     table_names = inspector.get_table_names()
     if "recipe" not in table_names or "ingredient" not in table_names:
         metadata.create_all(bind=engine)
+    for table in metadata.sorted_tables:
+        table.create(bind=engine, checkfirst=True)
+    ensure_columns(engine=engine, metadata=metadata)
+    ensure_indexes(engine=engine, metadata=metadata)
+    ensure_canonical_ids(engine=engine, metadata=metadata)
+    ensure_recipe_search(engine=engine)
+    if "recipe_document" in metadata.tables:
+        ensure_recipe_documents(
+            engine=engine, enabled=settings.RECIPE_DOCUMENTS_ENABLED
+        )
+    if "data_generation" in metadata.tables:
+        ensure_sqlite_ddl(engine=engine, statements=DATA_GENERATION_DDL)
+
+
+def ensure_columns(engine: Engine, metadata: MetaData) -> list[str]:
+    """Adds the declared columns missing from existing tables and returns them.
+
+    Columns are added with ALTER TABLE, which SQLite only allows for columns that
+    may be NULL. Constraints other than the type are not added.
+    """
+    inspector = inspect(engine)
+    added: list[str] = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {x["name"] for x in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    table_name = engine.dialect.identifier_preparer.format_table(table)
+                    column_spec = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(
+                        text(f"ALTER TABLE {table_name} ADD COLUMN {column_spec}")
+                    )
+                    added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def ensure_indexes(engine: Engine, metadata: MetaData) -> list[str]:
+    """Creates the declared indexes that do not exist yet and returns their names."""
+    inspector = inspect(engine)
+    created: list[str] = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {x["name"] for x in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda x: str(x.name)):
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(str(index.name))
+    return created
+
+
+def build_async_database_url(database_url: str) -> str:
+    """Derives the URL of the async driver from a synchronous sqlite URL."""
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        raise ValueError("Set ASYNC_DATABASE_URL for databases other than sqlite")
+    return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+
+
+def ensure_recipe_search(engine: Engine) -> bool:
+    """Creates the full-text search table and its triggers if they are missing.
+
+    A newly created search table is filled from the existing recipes. Returns
+    whether full-text search is available.
+    """
+    with engine.begin() as conn:
+        if not supports_fts5(None, None, conn):
+            return False
+        is_new = not inspect(conn).has_table("recipe_search")
+        for statement in RECIPE_SEARCH_DDL:
+            conn.execute(text(statement))
+        if is_new:
+            rebuild_recipe_search(conn)
+    return True
+
+
+def ensure_recipe_documents(engine: Engine, enabled: bool) -> None:
+    """Installs the triggers of the recipe_document table if `enabled`, else drops them.
+
+    Documents stored while the triggers were missing may be stale, so every stored
+    document is dropped when the triggers are installed, and when they are dropped.
+    `src.db.operations.rebuild_recipe_documents` stores them again.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        trigger_count = conn.execute(
+            text(
+                """SELECT count(*) FROM sqlite_master
+                WHERE type = 'trigger' AND name IN :names"""
+            ).bindparams(bindparam("names", expanding=True)),
+            {"names": RECIPE_DOCUMENT_TRIGGERS},
+        ).scalar()
+        if trigger_count == (len(RECIPE_DOCUMENT_TRIGGERS) if enabled else 0):
+            return
+        conn.execute(text("DELETE FROM recipe_document"))
+        for name in RECIPE_DOCUMENT_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        if enabled:
+            for statement in RECIPE_DOCUMENT_DDL:
+                conn.execute(text(statement))
+
+
+def ensure_sqlite_ddl(engine: Engine, statements: list[str]) -> None:
+    """Runs idempotent DDL, such as the triggers of a table, on sqlite databases.
+
+    `create_all` only emits it with a new table, so databases created before the
+    DDL was declared are brought up to date here.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def rebuild_recipe_search(conn: Connection) -> None:
+    """Refills the full-text search table from the recipe and ingredient tables."""
+    conn.execute(text("DELETE FROM recipe_search"))
+    conn.execute(
+        text(
+            """INSERT INTO recipe_search (rowid, name, instructions, ingredients)
+            SELECT recipe_id, name, instructions, (
+                SELECT group_concat(ingred_name, ' ') FROM ingredient
+                WHERE ingredient.recipe_id = recipe.recipe_id
+            )
+            FROM recipe"""
+        )
+    )
+
+
+def ensure_canonical_ids(engine: Engine, metadata: MetaData) -> int:
+    """Links every ingredient row without a canonical ingredient to one.
+
+    Fills in databases created before ingredients were normalised. Returns the
+    number of ingredient rows updated.
+    """
+    ingredients = metadata.tables["ingredient"]
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(ingredients.c.ingred_id, ingredients.c.ingred_name).where(
+                ingredients.c.canonical_id.is_(None),
+                ingredients.c.ingred_name.is_not(None),
+            )
+        ).all()
+        canonical_names = {
+            ingred_id: normalise_ingredient_name(ingred_name)
+            for ingred_id, ingred_name in rows
+        }
+        canonical_ids = resolve_canonical_ids(
+            conn, metadata.tables["canonical_ingredient"], canonical_names.values()
+        )
+        updates = [
+            {"b_ingred_id": ingred_id, "canonical_id": canonical_ids[name]}
+            for ingred_id, name in canonical_names.items()
+            if name in canonical_ids
+        ]
+        if len(updates) > 0:
+            conn.execute(
+                update(ingredients).where(
+                    ingredients.c.ingred_id == bindparam("b_ingred_id")
+                ),
+                updates,
+            )
+    return len(updates)
+
+
+def resolve_canonical_ids(
+    conn: Connection, canonical_table: Table, canonical_names: Iterable[str]
+) -> dict[str, int]:
+    """Maps canonical ingredient names to their IDs, storing names not seen yet.
+
+    A single executemany upsert returns the ID of new and existing names alike.
+    Empty names have no canonical ingredient. Does not commit.
+    """
+    names = sorted({x for x in canonical_names if x != ""})
+    if len(names) == 0:
+        return {}
+    stmt = sqlite_insert(canonical_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[canonical_table.c.name], set_={"name": stmt.excluded.name}
+    ).returning(
+        canonical_table.c.name,
+        canonical_table.c.canonical_id,
+        sort_by_parameter_order=True,
+    )
+    result = conn.execute(stmt, [{"name": x} for x in names])
+    return dict(result.tuples().all())
+
+
+def build_sqlite_pragmas(settings: Settings) -> list[tuple[str, Any]]:
+    """The PRAGMA statements of the configured SQLite storage profile."""
+    return [
+        ("busy_timeout", settings.SQLITE_BUSY_TIMEOUT_MS),
+        ("journal_mode", settings.SQLITE_JOURNAL_MODE),
+        ("synchronous", settings.SQLITE_SYNCHRONOUS),
+        ("cache_size", settings.SQLITE_CACHE_SIZE),
+        ("mmap_size", settings.SQLITE_MMAP_SIZE),
+        ("temp_store", settings.SQLITE_TEMP_STORE),
+    ]
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: list[tuple[str, Any]]) -> None:
+    """Runs `pragmas` on every new DBAPI connection that `engine` opens."""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def build_engine(
+    database_url: str, settings: Settings, pragmas: list[tuple[str, Any]] | None = None
+) -> Engine:
+    """Creates a pooled engine. sqlite connections get the storage profile."""
+    engine = create_engine(
+        database_url,
+        echo=settings.SQLA_ECHO,
+        poolclass=QueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    if engine.dialect.name == "sqlite":
+        if pragmas is None:
+            pragmas = build_sqlite_pragmas(settings)
+        apply_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+def build_async_engine(database_url: str, settings: Settings) -> AsyncEngine:
+    """Creates a pooled async engine. sqlite connections get the storage profile."""
+    async_engine = create_async_engine(
+        database_url,
+        echo=settings.SQLA_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    if async_engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(async_engine.sync_engine, build_sqlite_pragmas(settings))
+    return async_engine
 
 
 metadata = MetaData()
+metadata, canonical_ingredients_table = build_canonical_ingredients_table(
+    metadata=metadata
+)
 metadata, recipes_table = build_recipes_table(metadata=metadata)
 metadata, ingredients_table = build_ingredients_table(metadata=metadata)
-engine = create_engine(settings.DATABASE_URL, echo=settings.SQLA_ECHO)
-construct_db_if_none_exists(engine=engine, metadata=metadata)
+metadata, recipe_search_table = build_recipe_search_table(metadata=metadata)
+metadata, recipe_documents_table = build_recipe_documents_table(metadata=metadata)
+metadata, data_generation_table = build_data_generation_table(metadata=metadata)
+_engines: tuple[Engine, AsyncEngine] | None = None
+_engines_lock = Lock()
+
+
+def init_db(settings: Settings = settings) -> tuple[Engine, AsyncEngine]:
+    """Creates the engines of this process and brings the schema up to date.
+
+    Nothing touches the database at import. The app calls this from its lifespan,
+    before it serves requests; tests and scripts call it themselves, or get the
+    engines lazily through `get_engine`. Later calls return the same engines.
+    """
+    global _engines
+    with _engines_lock:
+        if _engines is None:
+            engine = build_engine(settings.DATABASE_URL, settings)
+            construct_db_if_none_exists(
+                engine=engine, metadata=metadata, settings=settings
+            )
+            async_engine = build_async_engine(
+                settings.ASYNC_DATABASE_URL
+                or build_async_database_url(settings.DATABASE_URL),
+                settings,
+            )
+            _engines = (engine, async_engine)
+        return _engines
+
+
+async def dispose_db() -> None:
+    """Closes the pooled connections of both engines. `init_db` creates new ones."""
+    global _engines
+    with _engines_lock:
+        engines, _engines = _engines, None
+    if engines is not None:
+        engines[0].dispose()
+        await engines[1].dispose()
+
+
+def get_engine() -> Engine:
+    return init_db()[0]
+
+
+def get_async_engine() -> AsyncEngine:
+    return init_db()[1]
 
 
 def get_db_conn():
-    connection = engine.connect()
+    connection = get_engine().connect()
     try:
         yield connection
     finally:
         connection.close()
+
+
+async def get_async_db_conn() -> AsyncIterator[AsyncConnection]:
+    async with get_async_engine().connect() as connection:
+        yield connection
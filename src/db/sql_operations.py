@@ -1,22 +1,87 @@
+import re
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Iterator
+from weakref import WeakKeyDictionary
 from sqlalchemy import (
     Connection,
-    select,
+    Engine,
+    Table,
     insert,
     Result,
+    Row,
     delete,
-    update,
     Select,
-    or_,
+    inspect,
 )
+from sqlalchemy.schema import CreateTable
 from src.schemas.recipe import (
     Recipe,
     BaseRecipe,
     RecipeInDB,
     Ingredient,
-    JoinedRecipeRecord,
 )
-from src.db.setup import recipes_table, ingredients_table
+from src.db import statements
+from src.db.setup import (
+    canonical_ingredients_table,
+    resolve_canonical_ids,
+)
+from src.db.statements import ValuesStatement, staged_ingred_names_table
+from src.smarts.normaliser import normalise_ingredient_name
+
+# SQLite's historical SQLITE_MAX_VARIABLE_NUMBER is 999. Value sets are split into
+# IN lists below this size so a statement never exceeds the driver's limit.
+MAX_BOUND_PARAMETERS = 900
+# Past this many values, chunking costs too many round trips and the values are
+# written to a temporary table that the query joins against instead.
+STAGED_VALUES_THRESHOLD = 10 * MAX_BOUND_PARAMETERS
+
+_has_recipe_search: WeakKeyDictionary[Engine, bool] = WeakKeyDictionary()
+
+
+def execute_by_values(
+    conn: Connection,
+    statement: ValuesStatement,
+    values: list[Any],
+    params: dict[str, Any] | None = None,
+) -> Iterator[Result]:
+    """Executes `statement` filtered on an arbitrarily large set of values.
+
+    Yields one result per execution. Concatenated, they are the result of one query
+    filtered on all values. Each result must be consumed before the next is asked
+    for.
+        1) Up to `MAX_BOUND_PARAMETERS` values, there is a single expanding IN.
+        2) Up to `STAGED_VALUES_THRESHOLD` values, there is one expanding IN per
+        chunk. Chunks follow the order of `values`.
+        3) Otherwise the values are staged in the statement's staging table and
+        the statement reads them from there.
+
+    Expanding IN parameters keep one statement shape, so the compiled statement is
+    cached however many values there are. Duplicate values are dropped. Any other
+    parameters of the statement are taken from `params` on every execution.
+    """
+    values = list(dict.fromkeys(values))
+    params = params or {}
+    if len(values) <= STAGED_VALUES_THRESHOLD:
+        for x in range(0, max(len(values), 1), MAX_BOUND_PARAMETERS):
+            chunk = values[x : x + MAX_BOUND_PARAMETERS]
+            yield conn.execute(statement.by_values, {**params, "values": chunk})
+        return
+    with staged_values(conn, statement.staging_table, values):
+        yield conn.execute(statement.by_staged_values, params)
+
+
+@contextmanager
+def staged_values(
+    conn: Connection, staging_table: Table, values: list[Any]
+) -> Iterator[None]:
+    """Fills the connection-local `staging_table` with `values` for the context."""
+    conn.execute(CreateTable(staging_table, if_not_exists=True))
+    conn.execute(insert(staging_table), [{"value": value} for value in values])
+    try:
+        yield
+    finally:
+        conn.execute(delete(staging_table))
 
 
 def insert_recipe(new_recipe: BaseRecipe, conn: Connection) -> int:
@@ -29,16 +94,8 @@ def insert_recipe(new_recipe: BaseRecipe, conn: Connection) -> int:
 
     timestamp = datetime.now()
     result: Result = conn.execute(
-        insert(recipes_table).values(
-            name=new_recipe.name,
-            author=new_recipe.author,
-            rating=new_recipe.rating,
-            prep_time=new_recipe.prep_time,
-            cook_time=new_recipe.cook_time,
-            created_at=timestamp,
-            modified_at=timestamp,
-            instructions=new_recipe.instructions,
-        )
+        statements.insert_recipe,
+        _recipe_values([new_recipe], created_at=timestamp, modified_at=timestamp)[0],
     )
     new_pk = result.inserted_primary_key
     if new_pk is None:
@@ -47,40 +104,96 @@ def insert_recipe(new_recipe: BaseRecipe, conn: Connection) -> int:
         return new_pk[0]
 
 
+def insert_recipes(new_recipes: list[BaseRecipe], conn: Connection) -> list[int]:
+    """Basic naive wrapper for a batched INSERT to the recipe_table.
+
+    All recipes are sent as a single executemany and the new primary keys are
+    returned in the same order as `new_recipes`.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    if len(new_recipes) == 0:
+        return []
+    timestamp = datetime.now()
+    result: Result = conn.execute(
+        statements.insert_recipes_returning_ids,
+        _recipe_values(new_recipes, created_at=timestamp, modified_at=timestamp),
+    )
+    return list(result.scalars().all())
+
+
+def insert_recipes_returning(
+    new_recipes: list[BaseRecipe], conn: Connection
+) -> list[Row]:
+    """Basic naive wrapper for a batched INSERT to the recipe_table.
+
+    Like `insert_recipes`, but every stored column is returned through RETURNING,
+    one row per recipe in the order of `new_recipes`, so nothing has to be read back.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    if len(new_recipes) == 0:
+        return []
+    timestamp = datetime.now()
+    result: Result = conn.execute(
+        statements.insert_recipes_returning,
+        _recipe_values(new_recipes, created_at=timestamp, modified_at=timestamp),
+    )
+    return list(result)
+
+
 def insert_ingredients(ingredients: list[Ingredient], recipe_id: int, conn: Connection):
-    """Basic naive wrapper for a group of INSERTs to the ingredient_table.
+    """Basic naive wrapper for a batched INSERT to the ingredient_table.
 
     This is a 'naive' function because
         1) it does no data validation. That must be done elsewhere.
         2) it does not 'commit' anything to the database. That must be done elsewhere
     """
+    insert_ingredients_of_recipes(
+        ingredients_by_recipe=[(recipe_id, ingredients)], conn=conn
+    )
 
-    for ingred in ingredients:
-        ingred_dict = ingred.dict()
-        ingred_dict["recipe_id"] = recipe_id
-        conn.execute(
-            insert(ingredients_table),
-            [
-                ingred_dict,
-            ],
-        )
+
+def insert_ingredients_of_recipes(
+    ingredients_by_recipe: list[tuple[int, list[Ingredient]]], conn: Connection
+):
+    """Basic naive wrapper for a batched INSERT of the ingredients of many recipes.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    rows = _ingredient_values(ingredients_by_recipe, conn)
+    if len(rows) > 0:
+        conn.execute(statements.insert_ingredients, rows)
+
+
+def insert_ingredients_of_recipes_returning(
+    ingredients_by_recipe: list[tuple[int, list[Ingredient]]], conn: Connection
+) -> list[Row]:
+    """Basic naive wrapper for a batched INSERT of the ingredients of many recipes.
+
+    The stored ingredients are returned through RETURNING as (recipe_id,
+    ingred_name, amount, unit, notes, group) rows, in insertion order.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    rows = _ingredient_values(ingredients_by_recipe, conn)
+    if len(rows) == 0:
+        return []
+    result: Result = conn.execute(statements.insert_ingredients_returning, rows)
+    return list(result)
 
 
 def select_recipe_by_id(id: int, conn: Connection) -> RecipeInDB | None:
     """Basic wrapper for a SELECT from the recipe_table."""
-    recipe_result: Result = conn.execute(
-        select(
-            recipes_table.c.recipe_id,
-            recipes_table.c.name,
-            recipes_table.c.author,
-            recipes_table.c.rating,
-            recipes_table.c.prep_time,
-            recipes_table.c.cook_time,
-            recipes_table.c.created_at,
-            recipes_table.c.modified_at,
-            recipes_table.c.instructions,
-        ).where(recipes_table.c.recipe_id == id)
-    )
+    recipe_result: Result = conn.execute(statements.recipe_by_id, {"recipe_id": id})
     raw_recipe = recipe_result.first()
     if raw_recipe is None:
         return None
@@ -95,84 +208,74 @@ def select_recipes_by_ids(
     """Basic wrapper for a SELECT of recipes from the recipe_table."""
     if recipe_ids is None:
         return None
-    stmt = build_recipe_select()
-    conditions = []
-    for id in recipe_ids:
-        conditions.append(recipes_table.c.recipe_id == id)
-    stmt = stmt.filter(or_(False, *conditions))
-    recipes_result: Result = conn.execute(stmt)
-    raw_recipes = recipes_result.all()
-    if raw_recipes is None:
-        return None
     recipes: list[RecipeInDB] = []
-    for raw_recipe in raw_recipes:
-        raw_recipe_dict = raw_recipe._asdict()
-        recipes.append(RecipeInDB(**raw_recipe_dict))
+    for recipes_result in execute_by_values(
+        conn, statements.recipes_by_ids, recipe_ids
+    ):
+        for raw_recipe in recipes_result:
+            recipes.append(RecipeInDB(**raw_recipe._asdict()))
     return recipes
 
 
-# TODO | Evaluate for deletion
-# def select_recipes_with_ingredients_by_ids(
-#     conn: Connection, recipe_ids: list[int]
-# ) -> list[JoinedRecipeRecord] | None:
-#     stmt = build_recipe_with_ingredients_select_statement()
-#     conditions = []
-#     for id in recipe_ids:
-#         conditions.append(recipes_table.c.recipe_id == id)
-#     stmt = stmt.filter(or_(*conditions))
-#     stmt = stmt.order_by(recipes_table.c.recipe_id)
-#     recipes_result: Result = conn.execute(stmt)
-#     raw_joined_rows = recipes_result.all()
-#     if raw_joined_rows is None:
-#         return None
-#     joined_recipe_records = []
-#     for row in raw_joined_rows:
-#         joined_recipe_record = JoinedRecipeRecord(**row._asdict())
-#         joined_recipe_records.append(joined_recipe_record)
-#     return joined_recipe_records
+def select_joined_recipes_by_ids(conn: Connection, recipe_ids: list[int]) -> list[Row]:
+    """Wrapper for a SELECT of joined records belonging to the given recipes.
+
+    Records are ordered by recipe ID, then by ingredient in insertion order.
+    """
+    if len(recipe_ids) == 0:
+        return []
+    joined_rows: list[Row] = []
+    for recipes_result in execute_by_values(
+        conn, statements.joined_recipes_by_ids, sorted(recipe_ids)
+    ):
+        joined_rows.extend(recipes_result)
+    return joined_rows
 
 
 def select_recipe_by_id_with_ingredients(
     recipe_id: int, conn: Connection
 ) -> Recipe | None:
-    recipe_result: Result = conn.execute(
-        select(
-            recipes_table.c.recipe_id,
-            recipes_table.c.name,
-            recipes_table.c.author,
-            recipes_table.c.rating,
-            recipes_table.c.prep_time,
-            recipes_table.c.cook_time,
-            recipes_table.c.created_at,
-            recipes_table.c.modified_at,
-            recipes_table.c.instructions,
-            ingredients_table.c.ingred_name,
-            ingredients_table.c.amount,
-            ingredients_table.c.unit,
-            ingredients_table.c.notes,
-            ingredients_table.c.group,
-        )
-        .join_from(recipes_table, ingredients_table)
-        .where(recipes_table.c.recipe_id == recipe_id)
-    )
-    raw_joined_rows = recipe_result.all()
+    """Wrapper for a SELECT of one recipe joined with its ingredients.
+
+    The rows come from our own tables, so the models are built with `construct()`
+    and are not validated again.
+    """
+    raw_joined_rows = conn.execute(
+        statements.recipe_with_ingredients_by_id, {"recipe_id": recipe_id}
+    ).all()
     if len(raw_joined_rows) == 0:
         return None
-    recipe_dict = raw_joined_rows[0]._asdict()
-    recipe_dict["ingredients"] = []
-    recipe = Recipe(**recipe_dict)
-    for x in range(0, len(raw_joined_rows)):
-        raw_ingredient = raw_joined_rows[x]._asdict()
-        recipe.ingredients.append(
-            Ingredient(
-                ingred_name=raw_ingredient["ingred_name"],
-                amount=raw_ingredient["amount"],
-                unit=raw_ingredient["unit"],
-                notes=raw_ingredient["notes"],
-                group=raw_ingredient["group"],
-            )
+    (
+        recipe_id,
+        name,
+        author,
+        rating,
+        prep_time,
+        cook_time,
+        created_at,
+        modified_at,
+        instructions,
+        *_,
+    ) = raw_joined_rows[0]
+    ingredients = [
+        Ingredient.construct(
+            ingred_name=ingred_name, amount=amount, unit=unit, notes=notes, group=group
         )
-    return recipe
+        for *_, ingred_name, amount, unit, notes, group in raw_joined_rows
+        if ingred_name is not None
+    ]
+    return Recipe.construct(
+        recipe_id=recipe_id,
+        name=name,
+        author=author,
+        rating=rating,
+        prep_time=prep_time,
+        cook_time=cook_time,
+        created_at=created_at,
+        modified_at=modified_at,
+        instructions=instructions,
+        ingredients=ingredients,
+    )
 
 
 def select_joined_recipes_matching_query(
@@ -180,48 +283,98 @@ def select_joined_recipes_matching_query(
     name: str | None,
     author: str | None,
     ingredients: set[str] | None,
-) -> list[JoinedRecipeRecord] | None:
+) -> list[Row] | None:
     """Wrapper for a SELECT of joined records with potentially multiple conditions
 
     If caller supplies no query parameters, function will return all records.
+    Ingredients match when they normalise to the same canonical ingredient.
+    """
+    canonical_names = [normalise_ingredient_name(x) for x in ingredients or []]
+    params = {"name": name, "author": author}
+    if len(canonical_names) == 0:
+        stmt = statements.joined_recipes_matching_query(
+            by_name=name is not None, by_author=author is not None
+        )
+        recipes_result: Result = conn.execute(stmt, params)
+        return list(recipes_result)
+    values_stmt = statements.joined_recipes_matching_canonical_names(
+        by_name=name is not None, by_author=author is not None
+    )
+    # A recipe matching in several chunks comes back whole from each of them.
+    joined_rows: list[Row] = []
+    seen_ids: set[int] = set()
+    for recipes_result in execute_by_values(conn, values_stmt, canonical_names, params):
+        chunk_rows = list(recipes_result)
+        joined_rows.extend(row for row in chunk_rows if row.recipe_id not in seen_ids)
+        seen_ids.update(row.recipe_id for row in chunk_rows)
+    return joined_rows
+
+
+def select_joined_recipes_by_filters(
+    conn: Connection,
+    name: str | None,
+    author: str | None,
+    ingred_names: list[str] | None,
+    limit: int | None = None,
+    after: tuple[str, int] | None = None,
+) -> list[Row]:
+    """Wrapper for a single SELECT of joined records matching any of the filters.
+
+    Recipes match on an exact `name`, an exact `author` or on having an ingredient
+    with the same canonical ingredient as one of `ingred_names`, see
+    `normalise_ingredient_name`. If caller supplies no filters, all records are
+    returned. Recipes without ingredients are included with empty
+    ingredient columns. Records are ordered by recipe name.
+
+    With `limit`, only the first `limit` matching recipes ordered by (name,
+    recipe_id) are returned, starting after the `after` key if one is given. The
+    page is picked in a subquery, so ingredients are only read for its recipes.
     """
-    stmt = build_recipe_with_ingredients_select_statement()
-    sub_select = select(recipes_table.c.recipe_id).join_from(
-        recipes_table, ingredients_table
+    canonical_names = list(
+        dict.fromkeys(normalise_ingredient_name(x) for x in ingred_names or [])
+    )
+    staged = len(canonical_names) > MAX_BOUND_PARAMETERS
+    stmt = statements.joined_recipes_by_filters(
+        by_name=name is not None,
+        by_author=author is not None,
+        by_ingredients=len(canonical_names) > 0,
+        staged=staged,
+        paged=limit is not None or after is not None,
+        after=after is not None,
     )
-    filters = []
-    if name is not None:
-        filters.append(recipes_table.c.name == name)
-    if author is not None:
-        filters.append(recipes_table.c.author == author)
-    if ingredients is not None:
-        for ingredient in ingredients:
-            filters.append(ingredients_table.c.ingred_name.like(f"%{ingredient}%"))
-    if len(filters) != 0:
-        sub_select = sub_select.filter(or_(False, *filters))
-        stmt = stmt.where(recipes_table.c.recipe_id.in_(sub_select))
-
-    recipes_result: Result = conn.execute(stmt)
-    joined_recipe_records: list[JoinedRecipeRecord] = []
-    for dict_row in recipes_result.mappings():
-        joined_recipe_records.append(JoinedRecipeRecord(**dict_row))
-    return joined_recipe_records
+    params: dict[str, Any] = {
+        "name": name,
+        "author": author,
+        "limit": -1 if limit is None else limit,
+    }
+    if not staged:
+        params["canonical_names"] = canonical_names
+    if after is not None:
+        params["after_name"], params["after_id"] = after
+    if not staged:
+        return list(conn.execute(stmt, params))
+    with staged_values(conn, staged_ingred_names_table, canonical_names):
+        return list(conn.execute(stmt, params))
 
 
 def select_recipes(
-    conn: Connection, name: str | None, author: str | None
+    conn: Connection,
+    name: str | None,
+    author: str | None,
+    limit: int | None = None,
+    after: tuple[str, int] | None = None,
 ) -> list[RecipeInDB] | None:
     """Basic wrapper for a SELECT of records from the recipe_table"""
-    conditions = []
-    stmt = build_recipe_select()
-    if name is not None:
-        conditions.append(recipes_table.c.name == name)
-    if author is not None:
-        conditions.append(recipes_table.c.author == author)
-    if len(conditions) > 0:
-        stmt = stmt.filter(or_(*conditions))
-    stmt = stmt.order_by(recipes_table.c.name)
-    recipe_result: Result = conn.execute(stmt)
+    stmt = statements.recipes_by_filters(
+        by_name=name is not None,
+        by_author=author is not None,
+        after=after is not None,
+        limited=limit is not None,
+    )
+    params: dict[str, Any] = {"name": name, "author": author, "limit": limit}
+    if after is not None:
+        params["after_name"], params["after_id"] = after
+    recipe_result: Result = conn.execute(stmt, params)
     raw_recipes = recipe_result.all()
     recipes: list[RecipeInDB] = []
     if raw_recipes is None:
@@ -239,13 +392,7 @@ def select_ingredients_by_recipe_id(
     """Basic wrapper for SELECT of ingredients from the ingredients_table."""
 
     ingred_result: Result = conn.execute(
-        select(
-            ingredients_table.c.ingred_name,
-            ingredients_table.c.amount,
-            ingredients_table.c.unit,
-            ingredients_table.c.notes,
-            ingredients_table.c.group,
-        ).where(ingredients_table.c.recipe_id == recipe_id)
+        statements.ingredients_by_recipe_id, {"recipe_id": recipe_id}
     )
     raw_ingredients = ingred_result.all()
     formatted_ingredients: list[Ingredient] = []
@@ -254,35 +401,104 @@ def select_ingredients_by_recipe_id(
     return formatted_ingredients
 
 
+def select_ingredient_rows_by_recipe_id(recipe_id: int, conn: Connection) -> list[Row]:
+    """Wrapper for a SELECT of the stored ingredient rows of one recipe.
+
+    Rows are (ingred_id, ingred_name, amount, unit, notes, group), in the order the
+    ingredients were inserted.
+    """
+    ingred_result: Result = conn.execute(
+        statements.ingredient_rows_by_recipe_id, {"recipe_id": recipe_id}
+    )
+    return list(ingred_result)
+
+
 def select_recipe_ids_by_ingredients(
     conn: Connection, ingred_names: list[str] | None
 ) -> set[int] | None:
-    """Basic wrapper for SELECT to find recipes based on ingredient name."""
+    """Basic wrapper for SELECT to find recipes based on ingredient name.
+
+    Names are compared case-insensitively.
+    """
     if ingred_names is None or len(ingred_names) == 0:
         return None
-    stmt = select(ingredients_table.c.recipe_id)
-    conditions = []
-    for ingredient in ingred_names:
-        conditions.append(ingredients_table.c.ingred_name == ingredient)
-    if len(conditions) > 0:
-        stmt = stmt.filter(or_(*conditions))
-    ingred_result: Result = conn.execute(stmt)
     recipe_ids = set()
-    for row in ingred_result:
-        recipe_ids.add(row[0])
+    for ingred_result in execute_by_values(
+        conn, statements.recipe_ids_by_ingredients, ingred_names
+    ):
+        for row in ingred_result:
+            recipe_ids.add(row[0])
     return recipe_ids
 
 
-def select_recipe_ids_by_ingredients_like(
-    conn: Connection, ingred_names: set[str]
-) -> set[int] | None:
-    stmt = select(ingredients_table.c.recipe_id)
-    conditions = []
-    for ingredient in ingred_names:
-        conditions.append(ingredients_table.c.ingred_name.like(f"%{ingredient}%"))
-    stmt = stmt.filter(or_(False, *conditions))
-    result = conn.execute(stmt)
-    return set(result.scalars().all())
+def select_recipe_ingredient_names(conn: Connection) -> list[tuple[int, str]]:
+    """Basic wrapper for a SELECT of every (recipe_id, ingred_name) pair."""
+    result: Result = conn.execute(statements.recipe_ingredient_names)
+    return [(row[0], row[1]) for row in result if row[1] is not None]
+
+
+def select_recipe_ingredient_amounts(
+    conn: Connection,
+) -> list[tuple[int, int | None, str, float | None]]:
+    """Basic wrapper for a SELECT of every (recipe_id, rating, ingred_name, amount)."""
+    result: Result = conn.execute(statements.recipe_ingredient_amounts)
+    return [(row[0], row[1], row[2], row[3]) for row in result if row[2] is not None]
+
+
+def build_fts_match_query(query: str) -> str | None:
+    """Turns free text into a safe FTS5 MATCH expression.
+
+    Every word must appear and the last one may be a prefix, so results narrow as
+    the user types. Words are quoted, so FTS5 operators in user input are inert.
+    Returns None if `query` has no words.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if len(words) == 0:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def select_recipe_ids_by_search(
+    conn: Connection, match_query: str, limit: int, offset: int = 0
+) -> list[tuple[int, float]]:
+    """Basic wrapper for a full-text SELECT against the recipe_search table.
+
+    Returns (recipe_id, rank) pairs, best match first. Ranks are bm25 scores, in
+    which a name hit weighs 10, an ingredient hit 5 and an instructions hit 1. FTS5
+    reports bm25 as a negative number, lower being better.
+    """
+    result: Result = conn.execute(
+        statements.recipe_search_ranked,
+        {"match_query": match_query, "limit": limit, "offset": offset},
+    )
+    return [(row[0], row[1]) for row in result]
+
+
+def has_recipe_search(conn: Connection) -> bool:
+    """Whether the database has the recipe_search table, i.e. is SQLite with FTS5.
+
+    The table is created with the schema, so this is checked once per engine.
+    """
+    available = _has_recipe_search.get(conn.engine)
+    if available is None:
+        available = inspect(conn).has_table("recipe_search")
+        _has_recipe_search[conn.engine] = available
+    return available
+
+
+def refresh_recipe_search(recipe_ids: list[int], conn: Connection):
+    """Basic naive wrapper to rewrite the recipe_search rows of the given recipes.
+
+    Each row is built from the recipe and all of its ingredients, so call this after
+    the last write to the recipes in the transaction. Rows of recipes that are no
+    longer stored are dropped.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    for x in range(0, len(recipe_ids), MAX_BOUND_PARAMETERS):
+        chunk = recipe_ids[x : x + MAX_BOUND_PARAMETERS]
+        conn.execute(statements.delete_recipe_search_rows, {"values": chunk})
+        conn.execute(statements.insert_recipe_search_rows, {"values": chunk})
 
 
 def update_recipe_entry(recipe: Recipe, conn: Connection):
@@ -291,20 +507,75 @@ def update_recipe_entry(recipe: Recipe, conn: Connection):
         1) it does no data validation. That must be done elsewhere.
         2) it does not 'commit' anything to the database. That must be done elsewhere
     """
-    conn.execute(
-        update(recipes_table)
-        .where(recipes_table.c.recipe_id == recipe.recipe_id)
-        .values(
-            recipe_id=recipe.recipe_id,
-            name=recipe.name,
-            author=recipe.author,
-            rating=recipe.rating,
-            prep_time=recipe.prep_time,
-            cook_time=recipe.cook_time,
-            modified_at=datetime.now(),
-            instructions=recipe.instructions,
-        )
-    )
+    update_recipe_entries([recipe], conn)
+
+
+def update_recipe_entries(recipes: list[Recipe], conn: Connection) -> datetime:
+    """Basic naive wrapper for a batched UPDATE to the recipe_table.
+
+    All recipes are sent as a single executemany. Returns the `modified_at` written
+    to every recipe. SQLite cannot return rows from an executemany UPDATE.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    timestamp = datetime.now()
+    if len(recipes) == 0:
+        return timestamp
+    rows = _recipe_values(recipes, modified_at=timestamp)
+    for recipe, row in zip(recipes, rows):
+        row["b_recipe_id"] = recipe.recipe_id
+    conn.execute(statements.update_recipe, rows)
+    return timestamp
+
+
+def update_ingredient_entries(
+    ingredients_by_id: list[tuple[int, Ingredient]], conn: Connection
+):
+    """Basic naive wrapper for a batched UPDATE to the ingredient_table.
+
+    Each stored ingredient row, by ingred_id, is overwritten with its new values.
+
+    This is a 'naive' function because
+        1) it does no data validation. That must be done elsewhere.
+        2) it does not 'commit' anything to the database. That must be done elsewhere
+    """
+    if len(ingredients_by_id) == 0:
+        return
+    rows = []
+    canonical_ids = _canonical_ids_of(conn, [x for _, x in ingredients_by_id])
+    for ingred_id, ingred in ingredients_by_id:
+        ingred_dict = ingred.dict()
+        ingred_dict["b_ingred_id"] = ingred_id
+        ingred_dict["canonical_id"] = canonical_ids.get(ingred.ingred_name)
+        rows.append(ingred_dict)
+    conn.execute(statements.update_ingredient, rows)
+
+
+def delete_ingredients_by_ids(ingred_ids: list[int], conn: Connection):
+    """Basic naive wrapper for a group of DELETEs to the ingredient_table.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    if len(ingred_ids) == 0:
+        return
+    conn.execute(statements.delete_ingredients_by_ids, {"ingred_ids": ingred_ids})
+
+
+def select_recipe_created_at_by_ids(
+    conn: Connection, recipe_ids: list[int]
+) -> dict[int, datetime]:
+    """Basic wrapper for a SELECT of the creation time of the given recipes.
+
+    Recipes that do not exist are missing from the result.
+    """
+    created_at: dict[int, datetime] = {}
+    for result in execute_by_values(
+        conn, statements.recipe_created_at_by_ids, recipe_ids
+    ):
+        created_at.update(result.tuples().all())
+    return created_at
 
 
 def delete_recipe_by_id(recipe_id: int, conn: Connection):
@@ -312,7 +583,7 @@ def delete_recipe_by_id(recipe_id: int, conn: Connection):
 
     Note that this function does not 'commit' anything to the database.
     """
-    conn.execute(delete(recipes_table).where(recipes_table.c.recipe_id == recipe_id))
+    conn.execute(statements.delete_recipe, {"recipe_id": recipe_id})
 
 
 def delete_ingredients_of_recipe(recipe_id: int, conn: Connection):
@@ -320,39 +591,140 @@ def delete_ingredients_of_recipe(recipe_id: int, conn: Connection):
 
     Note that this function does not 'commit' anything to the database.
     """
+    conn.execute(statements.delete_ingredients_of_recipe, {"recipe_id": recipe_id})
+
+
+def delete_recipes_by_ids(recipe_ids: list[int], conn: Connection) -> list[int]:
+    """Basic naive wrapper for a group of DELETEs to the recipe_table.
+
+    Returns the IDs of the recipes that existed and were deleted.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    deleted: list[int] = []
+    for result in execute_by_values(conn, statements.delete_recipes_by_ids, recipe_ids):
+        deleted.extend(result.scalars())
+    return deleted
+
+
+def delete_ingredients_of_recipes(recipe_ids: list[int], conn: Connection):
+    """Basic naive wrapper for a group of DELETEs to the ingredient_table.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    for result in execute_by_values(
+        conn, statements.delete_ingredients_of_recipes, recipe_ids
+    ):
+        result.close()
+
+
+def select_recipe_ids(conn: Connection) -> list[int]:
+    """Basic wrapper for a SELECT of every recipe ID, in ascending order."""
+    return list(conn.execute(statements.recipe_ids).scalars())
+
+
+def select_data_generation(conn: Connection) -> int:
+    """Basic wrapper for a SELECT of the generation of the recipe data.
+
+    The generation grows with every write to the recipe and ingredient tables.
+    """
+    return conn.execute(statements.data_generation).scalar() or 0
+
+
+def bump_data_generation(conn: Connection) -> int:
+    """Basic naive wrapper for an UPDATE of the generation of the recipe data.
+
+    Returns the new generation. Note that this function does not 'commit' anything
+    to the database.
+    """
+    return conn.execute(statements.bump_data_generation).scalar_one()
+
+
+def select_recipe_document_by_id(recipe_id: int, conn: Connection) -> bytes | None:
+    """Basic wrapper for a SELECT from the recipe_document table."""
+    return conn.execute(
+        statements.recipe_document_by_id, {"recipe_id": recipe_id}
+    ).scalar()
+
+
+def upsert_recipe_documents(documents: list[tuple[int, bytes]], conn: Connection):
+    """Basic naive wrapper for a group of INSERTs to the recipe_document table.
+
+    Documents already stored for a recipe are replaced.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    if len(documents) == 0:
+        return
     conn.execute(
-        delete(ingredients_table).where(ingredients_table.c.recipe_id == recipe_id)
+        statements.upsert_recipe_document,
+        [{"recipe_id": x, "document": document} for x, document in documents],
     )
 
 
-def build_recipe_with_ingredients_select_statement() -> Select:
-    return select(
-        recipes_table.c.recipe_id,
-        recipes_table.c.name,
-        recipes_table.c.author,
-        recipes_table.c.rating,
-        recipes_table.c.prep_time,
-        recipes_table.c.cook_time,
-        recipes_table.c.created_at,
-        recipes_table.c.modified_at,
-        recipes_table.c.instructions,
-        ingredients_table.c.ingred_name,
-        ingredients_table.c.amount,
-        ingredients_table.c.unit,
-        ingredients_table.c.notes,
-        ingredients_table.c.group,
-    ).join_from(recipes_table, ingredients_table)
-
-
-def build_recipe_select() -> Select:
-    return select(
-        recipes_table.c.recipe_id,
-        recipes_table.c.name,
-        recipes_table.c.author,
-        recipes_table.c.rating,
-        recipes_table.c.prep_time,
-        recipes_table.c.cook_time,
-        recipes_table.c.created_at,
-        recipes_table.c.modified_at,
-        recipes_table.c.instructions,
+def delete_recipe_documents(conn: Connection):
+    """Basic naive wrapper for a DELETE of every row of the recipe_document table.
+
+    Note that this function does not 'commit' anything to the database.
+    """
+    conn.execute(statements.delete_recipe_documents)
+
+
+def build_recipe_export_statement() -> Select:
+    """Every recipe joined with its ingredients, all rows of a recipe adjacent."""
+    return statements.recipe_export
+
+
+def _recipe_values(
+    recipes: list[BaseRecipe] | list[Recipe],
+    modified_at: datetime,
+    created_at: datetime | None = None,
+) -> list[dict[str, Any]]:
+    rows = []
+    for recipe in recipes:
+        row = {
+            "name": recipe.name,
+            "author": recipe.author,
+            "rating": recipe.rating,
+            "prep_time": recipe.prep_time,
+            "cook_time": recipe.cook_time,
+            "modified_at": modified_at,
+            "instructions": recipe.instructions,
+        }
+        if created_at is not None:
+            row["created_at"] = created_at
+        rows.append(row)
+    return rows
+
+
+def _ingredient_values(
+    ingredients_by_recipe: list[tuple[int, list[Ingredient]]], conn: Connection
+) -> list[dict[str, Any]]:
+    rows = []
+    canonical_ids = _canonical_ids_of(
+        conn, [x for _, ingredients in ingredients_by_recipe for x in ingredients]
+    )
+    for recipe_id, ingredients in ingredients_by_recipe:
+        for ingred in ingredients:
+            ingred_dict = ingred.dict()
+            ingred_dict["recipe_id"] = recipe_id
+            ingred_dict["canonical_id"] = canonical_ids.get(ingred.ingred_name)
+            rows.append(ingred_dict)
+    return rows
+
+
+def _canonical_ids_of(
+    conn: Connection, ingredients: list[Ingredient]
+) -> dict[str, int]:
+    """Maps raw ingredient names to the IDs of their canonical ingredients."""
+    canonical_names = {
+        x.ingred_name: normalise_ingredient_name(x.ingred_name) for x in ingredients
+    }
+    canonical_ids = resolve_canonical_ids(
+        conn, canonical_ingredients_table, canonical_names.values()
     )
+    return {
+        ingred_name: canonical_ids[name]
+        for ingred_name, name in canonical_names.items()
+        if name in canonical_ids
+    }
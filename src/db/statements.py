@@ -0,0 +1,392 @@
+"""Prebuilt statements for the queries of `src.db.sql_operations`.
+
+Building a `select()` and generating its cache key is pure Python work that costs
+more than running a small query against SQLite's page cache. The statements here
+are built once, with bound parameters in place of values, so every execution
+reuses the memoised cache key and the compiled form in the engine's compiled cache.
+
+Statements whose shape depends on which filters are given are built by functions
+memoised on that shape, so there is one statement object per shape, not per call.
+Values always travel as parameters, never inside the statement.
+"""
+from functools import lru_cache
+from typing import Callable, NamedTuple
+from sqlalchemy import (
+    ColumnElement,
+    Executable,
+    Integer,
+    MetaData,
+    Select,
+    String,
+    Table,
+    bindparam,
+    delete,
+    insert,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.db.setup import (
+    canonical_ingredients_table,
+    data_generation_table,
+    ingredients_table,
+    recipe_documents_table,
+    recipes_table,
+)
+from src.db.tables import build_staged_values_table, ingred_name_nocase
+
+staging_metadata = MetaData()
+staging_metadata, staged_recipe_ids_table = build_staged_values_table(
+    metadata=staging_metadata, name="staged_recipe_id", value_type=Integer
+)
+staging_metadata, staged_ingred_names_table = build_staged_values_table(
+    metadata=staging_metadata, name="staged_ingred_name", value_type=String
+)
+
+
+class ValuesStatement(NamedTuple):
+    """A statement filtered on a set of values, in both forms it may be run in.
+
+    `by_values` takes the values as the expanding parameter "values",
+    `by_staged_values` reads them from `staging_table`.
+    """
+
+    by_values: Executable
+    by_staged_values: Executable
+    staging_table: Table
+
+
+def build_recipe_select() -> Select:
+    return select(
+        recipes_table.c.recipe_id,
+        recipes_table.c.name,
+        recipes_table.c.author,
+        recipes_table.c.rating,
+        recipes_table.c.prep_time,
+        recipes_table.c.cook_time,
+        recipes_table.c.created_at,
+        recipes_table.c.modified_at,
+        recipes_table.c.instructions,
+    )
+
+
+def build_recipe_with_ingredients_select_statement(isouter: bool = False) -> Select:
+    return select(
+        recipes_table.c.recipe_id,
+        recipes_table.c.name,
+        recipes_table.c.author,
+        recipes_table.c.rating,
+        recipes_table.c.prep_time,
+        recipes_table.c.cook_time,
+        recipes_table.c.created_at,
+        recipes_table.c.modified_at,
+        recipes_table.c.instructions,
+        ingredients_table.c.ingred_name,
+        ingredients_table.c.amount,
+        ingredients_table.c.unit,
+        ingredients_table.c.notes,
+        ingredients_table.c.group,
+    ).join_from(recipes_table, ingredients_table, isouter=isouter)
+
+
+def build_values_statement(
+    build: Callable[[ColumnElement[bool]], Executable],
+    column: ColumnElement,
+    staging_table: Table,
+) -> ValuesStatement:
+    """Builds both forms of a statement from a function of its filter condition."""
+    return ValuesStatement(
+        by_values=build(column.in_(bindparam("values", expanding=True))),
+        by_staged_values=build(column.in_(select(staging_table.c.value))),
+        staging_table=staging_table,
+    )
+
+
+recipe_by_id = build_recipe_select().where(
+    recipes_table.c.recipe_id == bindparam("recipe_id")
+)
+recipe_with_ingredients_by_id = (
+    build_recipe_with_ingredients_select_statement(isouter=True)
+    .where(recipes_table.c.recipe_id == bindparam("recipe_id"))
+    .order_by(ingredients_table.c.ingred_id)
+)
+ingredients_by_recipe_id = (
+    select(
+        ingredients_table.c.ingred_name,
+        ingredients_table.c.amount,
+        ingredients_table.c.unit,
+        ingredients_table.c.notes,
+        ingredients_table.c.group,
+    )
+    .where(ingredients_table.c.recipe_id == bindparam("recipe_id"))
+    .order_by(ingredients_table.c.ingred_id)
+)
+ingredient_rows_by_recipe_id = (
+    select(
+        ingredients_table.c.ingred_id,
+        ingredients_table.c.ingred_name,
+        ingredients_table.c.amount,
+        ingredients_table.c.unit,
+        ingredients_table.c.notes,
+        ingredients_table.c.group,
+    )
+    .where(ingredients_table.c.recipe_id == bindparam("recipe_id"))
+    .order_by(ingredients_table.c.ingred_id)
+)
+recipe_ingredient_names = select(
+    ingredients_table.c.recipe_id, ingredients_table.c.ingred_name
+).join_from(ingredients_table, recipes_table)
+recipe_ingredient_amounts = select(
+    ingredients_table.c.recipe_id,
+    recipes_table.c.rating,
+    ingredients_table.c.ingred_name,
+    ingredients_table.c.amount,
+).join_from(ingredients_table, recipes_table)
+recipe_export = build_recipe_with_ingredients_select_statement(isouter=True).order_by(
+    recipes_table.c.recipe_id, ingredients_table.c.ingred_id
+)
+recipe_search_ranked = text(
+    """SELECT rowid, bm25(recipe_search, 10.0, 1.0, 5.0) AS rank
+    FROM recipe_search WHERE recipe_search MATCH :match_query
+    ORDER BY rank, rowid LIMIT :limit OFFSET :offset"""
+)
+delete_recipe_search_rows = text(
+    "DELETE FROM recipe_search WHERE rowid IN :values"
+).bindparams(bindparam("values", expanding=True))
+insert_recipe_search_rows = text(
+    """INSERT INTO recipe_search (rowid, name, instructions, ingredients)
+    SELECT recipe_id, name, instructions, (
+        SELECT group_concat(ingred_name, ' ') FROM ingredient
+        WHERE ingredient.recipe_id = recipe.recipe_id
+    )
+    FROM recipe WHERE recipe_id IN :values"""
+).bindparams(bindparam("values", expanding=True))
+
+recipes_by_ids = build_values_statement(
+    lambda condition: build_recipe_select().where(condition),
+    recipes_table.c.recipe_id,
+    staged_recipe_ids_table,
+)
+joined_recipes_by_ids = build_values_statement(
+    lambda condition: build_recipe_with_ingredients_select_statement()
+    .where(condition)
+    .order_by(recipes_table.c.recipe_id, ingredients_table.c.ingred_id),
+    recipes_table.c.recipe_id,
+    staged_recipe_ids_table,
+)
+recipe_ids_by_ingredients = build_values_statement(
+    lambda condition: select(ingredients_table.c.recipe_id).where(condition),
+    ingred_name_nocase(ingredients_table),
+    staged_ingred_names_table,
+)
+recipe_created_at_by_ids = build_values_statement(
+    lambda condition: select(
+        recipes_table.c.recipe_id, recipes_table.c.created_at
+    ).where(condition),
+    recipes_table.c.recipe_id,
+    staged_recipe_ids_table,
+)
+
+# Write statements take their values from the parameters of each execution. The
+# WHERE parameters are prefixed with b_ where they would clash with a SET column.
+insert_recipe = insert(recipes_table)
+insert_recipes_returning_ids = insert(recipes_table).returning(
+    recipes_table.c.recipe_id, sort_by_parameter_order=True
+)
+insert_recipes_returning = insert(recipes_table).returning(
+    *build_recipe_select().selected_columns, sort_by_parameter_order=True
+)
+insert_ingredients = insert(ingredients_table)
+insert_ingredients_returning = insert(ingredients_table).returning(
+    ingredients_table.c.recipe_id,
+    ingredients_table.c.ingred_name,
+    ingredients_table.c.amount,
+    ingredients_table.c.unit,
+    ingredients_table.c.notes,
+    ingredients_table.c.group,
+    sort_by_parameter_order=True,
+)
+update_recipe = update(recipes_table).where(
+    recipes_table.c.recipe_id == bindparam("b_recipe_id")
+)
+update_ingredient = update(ingredients_table).where(
+    ingredients_table.c.ingred_id == bindparam("b_ingred_id")
+)
+delete_recipe = delete(recipes_table).where(
+    recipes_table.c.recipe_id == bindparam("recipe_id")
+)
+delete_ingredients_of_recipe = delete(ingredients_table).where(
+    ingredients_table.c.recipe_id == bindparam("recipe_id")
+)
+delete_ingredients_by_ids = delete(ingredients_table).where(
+    ingredients_table.c.ingred_id.in_(bindparam("ingred_ids", expanding=True))
+)
+delete_recipes_by_ids = build_values_statement(
+    lambda condition: delete(recipes_table)
+    .where(condition)
+    .returning(recipes_table.c.recipe_id),
+    recipes_table.c.recipe_id,
+    staged_recipe_ids_table,
+)
+delete_ingredients_of_recipes = build_values_statement(
+    lambda condition: delete(ingredients_table).where(condition),
+    ingredients_table.c.recipe_id,
+    staged_recipe_ids_table,
+)
+
+
+recipe_document_by_id = select(recipe_documents_table.c.document).where(
+    recipe_documents_table.c.recipe_id == bindparam("recipe_id")
+)
+upsert_recipe_document = sqlite_insert(recipe_documents_table)
+upsert_recipe_document = upsert_recipe_document.on_conflict_do_update(
+    index_elements=[recipe_documents_table.c.recipe_id],
+    set_={"document": upsert_recipe_document.excluded.document},
+)
+delete_recipe_documents = delete(recipe_documents_table)
+recipe_ids = select(recipes_table.c.recipe_id).order_by(recipes_table.c.recipe_id)
+data_generation = select(data_generation_table.c.generation)
+bump_data_generation = (
+    update(data_generation_table)
+    .values(generation=data_generation_table.c.generation + 1)
+    .returning(data_generation_table.c.generation)
+)
+
+
+def build_recipe_keyset_condition() -> ColumnElement[bool]:
+    """Recipes ordered after the (`after_name`, `after_id`) key of the last recipe.
+
+    Unlike an OFFSET, the key keeps pointing at the same position when recipes are
+    inserted or deleted between two pages.
+    """
+    return tuple_(recipes_table.c.name, recipes_table.c.recipe_id) > tuple_(
+        bindparam("after_name"), bindparam("after_id")
+    )
+
+
+def build_recipe_filters(
+    by_name: bool, by_author: bool, by_ingredients: bool, staged: bool
+) -> list[ColumnElement[bool]]:
+    """Conditions of the recipe filters, to be combined with OR.
+
+    They take the parameters `name`, `author` and the expanding `canonical_names`,
+    or the canonical names staged in `staged_ingred_names_table` if `staged`.
+    """
+    filters = []
+    if by_name:
+        filters.append(recipes_table.c.name == bindparam("name"))
+    if by_author:
+        filters.append(recipes_table.c.author == bindparam("author"))
+    if by_ingredients:
+        if staged:
+            canonical_names = select(staged_ingred_names_table.c.value)
+        else:
+            canonical_names = bindparam("canonical_names", expanding=True)
+        filters.append(
+            build_canonical_names_filter(
+                canonical_ingredients_table.c.name.in_(canonical_names)
+            )
+        )
+    return filters
+
+
+def build_canonical_names_filter(
+    condition: ColumnElement[bool],
+) -> ColumnElement[bool]:
+    """Matches recipes with an ingredient whose canonical name meets `condition`."""
+    canonical_ids = select(canonical_ingredients_table.c.canonical_id).where(condition)
+    return recipes_table.c.recipe_id.in_(
+        select(ingredients_table.c.recipe_id).where(
+            ingredients_table.c.canonical_id.in_(canonical_ids)
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def joined_recipes_by_filters(
+    by_name: bool,
+    by_author: bool,
+    by_ingredients: bool,
+    staged: bool = False,
+    paged: bool = False,
+    after: bool = False,
+) -> Select:
+    """Joined records of the recipes matching any of the given filters.
+
+    See `build_recipe_filters` for the parameters of the filters. A `paged`
+    statement only returns the first `limit` recipes ordered by (name, recipe_id),
+    after the key of `build_recipe_keyset_condition` if `after`. The page is picked
+    in a subquery, so ingredients are only read for its recipes.
+    """
+    stmt = build_recipe_with_ingredients_select_statement(isouter=True)
+    filters = build_recipe_filters(by_name, by_author, by_ingredients, staged)
+    if paged:
+        page = select(recipes_table.c.recipe_id)
+        if len(filters) > 0:
+            page = page.where(or_(*filters))
+        if after:
+            page = page.where(build_recipe_keyset_condition())
+        page = page.order_by(recipes_table.c.name, recipes_table.c.recipe_id)
+        page = page.limit(bindparam("limit", type_=Integer))
+        stmt = stmt.where(recipes_table.c.recipe_id.in_(page))
+    elif len(filters) > 0:
+        stmt = stmt.where(or_(*filters))
+    return stmt.order_by(
+        recipes_table.c.name, recipes_table.c.recipe_id, ingredients_table.c.ingred_id
+    )
+
+
+@lru_cache(maxsize=None)
+def joined_recipes_matching_query(by_name: bool, by_author: bool) -> Select:
+    """Joined records of the recipes with ingredients matching any of the filters.
+
+    See `build_recipe_filters` for the parameters of the filters.
+    """
+    stmt = build_recipe_with_ingredients_select_statement()
+    filters = build_recipe_filters(by_name, by_author, False, staged=False)
+    if len(filters) > 0:
+        stmt = stmt.where(or_(*filters))
+    return stmt
+
+
+@lru_cache(maxsize=None)
+def joined_recipes_matching_canonical_names(
+    by_name: bool, by_author: bool
+) -> ValuesStatement:
+    """As `joined_recipes_matching_query`, also matching on canonical names.
+
+    The canonical names are the values of the statement, see `execute_by_values`.
+    """
+
+    def build(condition: ColumnElement[bool]) -> Select:
+        filters = build_recipe_filters(by_name, by_author, False, staged=False)
+        filters.append(build_canonical_names_filter(condition))
+        return build_recipe_with_ingredients_select_statement().where(or_(*filters))
+
+    return build_values_statement(
+        build, canonical_ingredients_table.c.name, staged_ingred_names_table
+    )
+
+
+@lru_cache(maxsize=None)
+def recipes_by_filters(
+    by_name: bool, by_author: bool, after: bool, limited: bool
+) -> Select:
+    """Recipes matching any of the given filters, ordered by (name, recipe_id).
+
+    See `build_recipe_filters` and `build_recipe_keyset_condition` for the
+    parameters. A `limited` statement returns at most `limit` recipes.
+    """
+    stmt = build_recipe_select()
+    filters = build_recipe_filters(by_name, by_author, False, staged=False)
+    if len(filters) > 0:
+        stmt = stmt.where(or_(*filters))
+    if after:
+        stmt = stmt.where(build_recipe_keyset_condition())
+    stmt = stmt.order_by(recipes_table.c.name, recipes_table.c.recipe_id)
+    if limited:
+        stmt = stmt.limit(bindparam("limit", type_=Integer))
+    return stmt
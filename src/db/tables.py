@@ -1,4 +1,6 @@
 from sqlalchemy import (
+    DDL,
+    ColumnElement,
     MetaData,
     Table,
     Integer,
@@ -7,7 +9,13 @@ from sqlalchemy import (
     Float,
     DateTime,
     ForeignKey,
+    Index,
+    LargeBinary,
+    TableClause,
+    column,
+    event,
 )
+from sqlalchemy.types import TypeEngine
 
 
 def build_recipes_table(metadata: MetaData) -> tuple[MetaData, Table]:
@@ -24,6 +32,10 @@ def build_recipes_table(metadata: MetaData) -> tuple[MetaData, Table]:
         Column("modified_at", DateTime, nullable=False),
         Column("instructions", String),
     )
+    # SQLite appends the rowid (recipe_id) to every secondary index, so these also
+    # serve ORDER BY name, recipe_id
+    Index("ix_recipe_name", table.c.name)
+    Index("ix_recipe_author", table.c.author)
     return (metadata, table)
 
 
@@ -41,7 +53,178 @@ def build_ingredients_table(metadata: MetaData) -> tuple[MetaData, Table]:
         Column("unit", String),
         Column("notes", String),
         Column("group", String),
+        Column(
+            "canonical_id",
+            ForeignKey("canonical_ingredient.canonical_id"),
+        ),
         # Column("created_at", DateTime, nullable=False),
         # Column("modified_at", DateTime, nullable=False),
     )
+    Index("ix_ingredient_recipe_id", table.c.recipe_id)
+    Index("ix_ingredient_canonical_id", table.c.canonical_id)
+    # Ingredient names are matched case-insensitively, see `ingred_name_nocase`
+    Index("ix_ingredient_ingred_name_nocase", ingred_name_nocase(table))
+    return (metadata, table)
+
+
+def build_canonical_ingredients_table(metadata: MetaData) -> tuple[MetaData, Table]:
+    """One row per distinct ingredient, named by `normalise_ingredient_name`.
+
+    Every ingredient row points at its canonical ingredient through canonical_id,
+    so exact ingredient matches are integer comparisons on an indexed column.
+    """
+    table = Table(
+        "canonical_ingredient",
+        metadata,
+        Column("canonical_id", Integer, primary_key=True),
+        Column("name", String, nullable=False, unique=True),
+    )
+    return (metadata, table)
+
+
+def ingred_name_nocase(ingredients_table: Table) -> ColumnElement[str]:
+    """The ingredient name under the collation of its case-insensitive index.
+
+    Filters must compare this expression, not the bare column, to use the index.
+    """
+    return ingredients_table.c.ingred_name.collate("NOCASE")
+
+
+def build_staged_values_table(
+    metadata: MetaData, name: str, value_type: type[TypeEngine]
+) -> tuple[MetaData, Table]:
+    """A connection-local TEMPORARY table used to join against large value sets.
+
+    Give these tables their own MetaData so they are never part of `create_all`.
+    """
+    table = Table(
+        name,
+        metadata,
+        Column("value", value_type, primary_key=True),
+        prefixes=["TEMPORARY"],
+    )
+    return (metadata, table)
+
+
+RECIPE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+        name, instructions, ingredients,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS recipe_search_recipe_delete
+    AFTER DELETE ON recipe BEGIN
+        DELETE FROM recipe_search WHERE rowid = old.recipe_id; END""",
+]
+
+
+def supports_fts5(ddl, target, bind, **kw) -> bool:
+    """DDL predicate: True if the database is a SQLite build with FTS5."""
+    if bind.dialect.name != "sqlite":
+        return False
+    options = bind.exec_driver_sql("PRAGMA compile_options").scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+def build_recipe_search_table(metadata: MetaData) -> tuple[MetaData, TableClause]:
+    """An FTS5 index over recipe names, instructions and ingredient names.
+
+    The virtual table cannot be described by a `Table`, so it is created, and
+    dropped, through DDL hooked into `metadata.create_all`/`drop_all`. A trigger
+    drops the row of a deleted recipe; the write operations refresh the rows of the
+    recipes they write, once per recipe, with `refresh_recipe_search`. Its rowid is
+    the recipe_id. Nothing is created on databases without FTS5.
+    """
+    for statement in RECIPE_SEARCH_DDL:
+        event.listen(
+            metadata, "after_create", DDL(statement).execute_if(callable_=supports_fts5)
+        )
+    event.listen(
+        metadata,
+        "before_drop",
+        DDL("DROP TABLE IF EXISTS recipe_search").execute_if(callable_=supports_fts5),
+    )
+    search_table = TableClause(
+        "recipe_search",
+        column("rowid", Integer),
+        column("name", String),
+        column("instructions", String),
+        column("ingredients", String),
+    )
+    return (metadata, search_table)
+
+
+def _drop_recipe_document(recipe_id: str) -> str:
+    return f"DELETE FROM recipe_document WHERE recipe_id = {recipe_id};"
+
+
+RECIPE_DOCUMENT_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_document_recipe_update
+    AFTER UPDATE ON recipe BEGIN {_drop_recipe_document("old.recipe_id")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_document_recipe_delete
+    AFTER DELETE ON recipe BEGIN {_drop_recipe_document("old.recipe_id")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_document_ingredient_insert
+    AFTER INSERT ON ingredient BEGIN {_drop_recipe_document("new.recipe_id")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_document_ingredient_update
+    AFTER UPDATE OF recipe_id, ingred_name, amount, unit, notes, "group"
+    ON ingredient BEGIN
+        {_drop_recipe_document("old.recipe_id")}
+        {_drop_recipe_document("new.recipe_id")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS recipe_document_ingredient_delete
+    AFTER DELETE ON ingredient BEGIN {_drop_recipe_document("old.recipe_id")} END""",
+]
+RECIPE_DOCUMENT_TRIGGERS = [
+    "recipe_document_recipe_update",
+    "recipe_document_recipe_delete",
+    "recipe_document_ingredient_insert",
+    "recipe_document_ingredient_update",
+    "recipe_document_ingredient_delete",
+]
+
+
+def build_recipe_documents_table(metadata: MetaData) -> tuple[MetaData, Table]:
+    """The response body of every recipe, stored as encoded JSON ready to be sent.
+
+    Rows are written by `src.db.operations` when RECIPE_DOCUMENTS_ENABLED is set.
+    Triggers on the recipe and ingredient tables, `RECIPE_DOCUMENT_DDL`, delete the
+    document of a recipe whenever that recipe changes, whichever code path writes,
+    so a stored document is never stale; a missing one is read the normal way. The
+    triggers cost a DELETE per row written, so they are only installed, by
+    `src.db.setup.ensure_recipe_documents`, while the documents are enabled.
+    """
+    table = Table(
+        "recipe_document",
+        metadata,
+        Column(
+            "recipe_id",
+            ForeignKey("recipe.recipe_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        Column("document", LargeBinary, nullable=False),
+    )
+    return (metadata, table)
+
+
+DATA_GENERATION_DDL = [
+    "INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0)",
+]
+
+
+def build_data_generation_table(metadata: MetaData) -> tuple[MetaData, Table]:
+    """A single row counting the write transactions on recipes and ingredients.
+
+    The write paths of `src.db.operations` bump the generation once per
+    transaction, so each worker process can tell whether data it derived from the
+    tables, such as a shared index snapshot, is still current. Writes made
+    outside of `src.db.operations` are not counted.
+    """
+    table = Table(
+        "data_generation",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("generation", Integer, nullable=False),
+    )
+    for statement in DATA_GENERATION_DDL:
+        event.listen(
+            metadata, "after_create", DDL(statement).execute_if(dialect="sqlite")
+        )
     return (metadata, table)
@@ -0,0 +1,365 @@
+"""Opt-in request instrumentation: metrics, Server-Timing headers and profiles.
+
+`install` wires three parts into an app:
+    1) `InstrumentationMiddleware` times every request. While a request runs, its
+    `RequestMetrics` is the value of `current_request`.
+    2) Cursor execution events on the engines add each statement and its duration
+    to the metrics of the current request. Statements run through
+    `AsyncConnection.run_sync` count too, because SQLAlchemy's greenlets share the
+    context of the awaiting task.
+    3) `InstrumentedRoute` records when the endpoint returned, so the time spent
+    validating and rendering its response is known.
+
+Finished requests are aggregated by route in a `MetricsRegistry`, served in the
+Prometheus text format at /metrics. Each response carries the timings of its own
+request in a Server-Timing header, measured up to the start of the response.
+"""
+import asyncio
+import cProfile
+import heapq
+import math
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterable
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from src.db.cache import recipe_cache
+
+UNMATCHED_ROUTE = "<unmatched>"
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_QUERY_STARTS = "instrumentation_query_starts"
+
+
+class RequestMetrics:
+    """What one request spent its time on. Durations are in seconds."""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.route = UNMATCHED_ROUTE
+        self.status = 500
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.db_statements = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.endpoint_end: float | None = None
+
+    def server_timing(self) -> str:
+        """The Server-Timing header value of the request so far, in milliseconds."""
+        elapsed = time.perf_counter() - self.start
+        return (
+            f"app;dur={elapsed * 1000:.2f}, "
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.db_statements} '
+            f'statements", render;dur={self.render_seconds * 1000:.2f}'
+        )
+
+
+current_request: ContextVar[RequestMetrics | None] = ContextVar(
+    "current_request", default=None
+)
+
+
+class MetricsRegistry:
+    """Aggregates finished requests by route and renders them for Prometheus."""
+
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self._lock = Lock()
+        self._buckets = buckets
+        self._requests: Counter[tuple[str, str, int]] = Counter()
+        self._bucket_counts: dict[str, list[int]] = {}
+        self._duration_sums: Counter[str] = Counter()
+        self._db_statements: Counter[str] = Counter()
+        self._db_seconds: Counter[str] = Counter()
+        self._render_seconds: Counter[str] = Counter()
+
+    def observe(self, metrics: RequestMetrics) -> None:
+        route = metrics.route
+        with self._lock:
+            self._requests[(metrics.method, route, metrics.status)] += 1
+            counts = self._bucket_counts.setdefault(route, [0] * len(self._buckets))
+            for x, bound in enumerate(self._buckets):
+                if metrics.duration <= bound:
+                    counts[x] += 1
+            self._duration_sums[route] += metrics.duration
+            self._db_statements[route] += metrics.db_statements
+            self._db_seconds[route] += metrics.db_seconds
+            self._render_seconds[route] += metrics.render_seconds
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        with self._lock:
+            _header(lines, "http_requests_total", "counter", "Requests handled.")
+            for (method, route, status), count in sorted(self._requests.items()):
+                labels = _labels(method=method, route=route, status=status)
+                lines.append(f"http_requests_total{labels} {count}")
+            _header(
+                lines,
+                "http_request_duration_seconds",
+                "histogram",
+                "Time from receiving a request to sending the last of its response.",
+            )
+            for route, counts in sorted(self._bucket_counts.items()):
+                for bound, count in zip(self._buckets, counts):
+                    labels = _labels(route=route, le=bound)
+                    lines.append(
+                        f"http_request_duration_seconds_bucket{labels} {count}"
+                    )
+                total = sum(self._requests[x] for x in self._requests if x[1] == route)
+                labels = _labels(route=route, le="+Inf")
+                lines.append(f"http_request_duration_seconds_bucket{labels} {total}")
+                labels = _labels(route=route)
+                lines.append(
+                    f"http_request_duration_seconds_sum{labels} "
+                    f"{self._duration_sums[route]}"
+                )
+                lines.append(f"http_request_duration_seconds_count{labels} {total}")
+            for name, values, help_text in (
+                ("db_statements_total", self._db_statements, "SQL statements run."),
+                (
+                    "db_duration_seconds_total",
+                    self._db_seconds,
+                    "Time spent executing SQL statements.",
+                ),
+                (
+                    "response_render_seconds_total",
+                    self._render_seconds,
+                    "Time spent validating and serialising responses.",
+                ),
+            ):
+                _header(lines, name, "counter", help_text)
+                for route, value in sorted(values.items()):
+                    lines.append(f"{name}{_labels(route=route)} {value}")
+        stats = recipe_cache.stats()
+        labels = _labels(backend=stats.backend)
+        for name, kind, value in (
+            ("recipe_cache_hits_total", "counter", stats.hits),
+            ("recipe_cache_misses_total", "counter", stats.misses),
+            ("recipe_cache_evictions_total", "counter", stats.evictions),
+            ("recipe_cache_invalidations_total", "counter", stats.invalidations),
+            ("recipe_cache_entries", "gauge", stats.size),
+            ("recipe_cache_max_entries", "gauge", stats.max_entries),
+        ):
+            _header(lines, name, kind, "See GET /cache/stats.")
+            lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    """Runs a share of the requests under cProfile and keeps the slowest profiles.
+
+    Profiles are written to `profile_dir` as .prof files, named after their
+    duration and route, for `python -m pstats` or snakeviz. Only one request is
+    profiled at a time. cProfile follows the event loop thread, so coroutines of
+    other requests that interleave with the profiled one are part of its profile,
+    and sync endpoints, which run in a thread pool, are not.
+    """
+
+    def __init__(self, sample_rate: float, keep_slowest: int, profile_dir: str):
+        self.sample_rate = sample_rate
+        self.keep_slowest = keep_slowest
+        self.profile_dir = Path(profile_dir)
+        self._active = False
+        self._slowest: list[tuple[float, str]] = []
+
+    def start(self) -> cProfile.Profile | None:
+        if self._active or self.keep_slowest <= 0:
+            return None
+        if random.random() >= self.sample_rate:
+            return None
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler: cProfile.Profile, metrics: RequestMetrics) -> None:
+        profiler.disable()
+        self._active = False
+        if (
+            len(self._slowest) >= self.keep_slowest
+            and metrics.duration <= self._slowest[0][0]
+        ):
+            return
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        route = re.sub(r"[^A-Za-z0-9]+", "_", metrics.route).strip("_") or "root"
+        path = self.profile_dir / (
+            f"{metrics.duration * 1000:.0f}ms-{metrics.method}-{route}-"
+            f"{time.time_ns()}.prof"
+        )
+        profiler.dump_stats(path)
+        heapq.heappush(self._slowest, (metrics.duration, str(path)))
+        if len(self._slowest) > self.keep_slowest:
+            _, evicted = heapq.heappop(self._slowest)
+            Path(evicted).unlink(missing_ok=True)
+
+
+class InstrumentationMiddleware:
+    """Times requests, adds Server-Timing headers and feeds the registry."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        registry: MetricsRegistry,
+        profiler: SlowRequestProfiler | None = None,
+    ):
+        self.app = app
+        self.registry = registry
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = RequestMetrics(method=scope["method"])
+        token = current_request.set(metrics)
+        profile = self.profiler.start() if self.profiler is not None else None
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                metrics.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.duration = time.perf_counter() - metrics.start
+            current_request.reset(token)
+            if profile is not None and self.profiler is not None:
+                self.profiler.finish(profile, metrics)
+            self.registry.observe(metrics)
+
+
+class InstrumentedRoute(APIRoute):
+    """An APIRoute that reports its path and how long its response took to render.
+
+    Without an instrumented request in progress, it behaves like an APIRoute.
+    """
+
+    def get_route_handler(self) -> Callable:
+        if self.dependant.call is not None:
+            self.dependant.call = _record_endpoint_end(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def instrumented_handler(request: Request) -> Response:
+            metrics = current_request.get()
+            if metrics is None:
+                return await handler(request)
+            metrics.route = route
+            response = await handler(request)
+            if metrics.endpoint_end is not None:
+                metrics.render_seconds += time.perf_counter() - metrics.endpoint_end
+            return response
+
+        return instrumented_handler
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attributes the statements run on `engine` to the current request."""
+    for identifier, listener in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+    ):
+        if not event.contains(engine, identifier, listener):
+            event.listen(engine, identifier, listener)
+
+
+def install(
+    app: FastAPI,
+    engines: Iterable[Engine],
+    profile_sample_rate: float = 0.0,
+    profile_keep_slowest: int = 10,
+    profile_dir: str = "instance/profiles",
+) -> MetricsRegistry:
+    """Instruments `app` and `engines` and serves the metrics at /metrics.
+
+    Routes must use `InstrumentedRoute` to report their path and render time.
+    Pass the `sync_engine` of async engines.
+    """
+    for engine in engines:
+        instrument_engine(engine)
+    registry = MetricsRegistry()
+    profiler = None
+    if profile_sample_rate > 0:
+        profiler = SlowRequestProfiler(
+            profile_sample_rate, profile_keep_slowest, profile_dir
+        )
+    app.add_middleware(InstrumentationMiddleware, registry=registry, profiler=profiler)
+
+    def read_metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            registry.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    app.add_api_route("/metrics", read_metrics, include_in_schema=False)
+    return registry
+
+
+def _record_endpoint_end(call: Callable[..., Any]) -> Callable[..., Any]:
+    if asyncio.iscoroutinefunction(call):
+
+        @wraps(call)
+        async def timed_coroutine(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                _mark_endpoint_end()
+
+        return timed_coroutine
+
+    @wraps(call)
+    def timed_function(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return call(*args, **kwargs)
+        finally:
+            _mark_endpoint_end()
+
+    return timed_function
+
+
+def _mark_endpoint_end() -> None:
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.endpoint_end = time.perf_counter()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        conn.info.setdefault(_QUERY_STARTS, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = current_request.get()
+    starts = conn.info.get(_QUERY_STARTS)
+    if metrics is None or not starts:
+        return
+    metrics.db_seconds += time.perf_counter() - starts.pop()
+    metrics.db_statements += 1
+
+
+def _header(lines: list[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(**labels: Any) -> str:
+    def escape(value: Any) -> str:
+        if isinstance(value, float) and math.isfinite(value):
+            value = repr(value)
+        text = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+        return text.replace('"', '\\"')
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
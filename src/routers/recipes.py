@@ -1,83 +1,256 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, Response, HTTPException, Query
-from sqlalchemy import Connection
-from src.db.setup import get_db_conn
-from src.db.operations import (
+import base64
+import binascii
+import json
+from typing import Annotated, AsyncIterator
+from fastapi import APIRouter, Body, Depends, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncConnection
+from src.db.operations import SearchUnavailable
+from src.db.setup import get_async_db_conn
+from src.db.async_operations import (
     create_recipe,
+    create_recipes,
+    update_recipes,
+    delete_recipes,
     read_recipe_by_id,
+    read_recipe_document,
     update_recipe,
+    patch_recipe,
     delete_recipe,
     read_recipes_matching_query,
     read_recipes,
+    find_recipes as find_scored_recipes,
+    find_recipes_by_pantry,
+    search_recipes as search_scored_recipes,
+    stream_recipes,
 )
-from src.schemas.recipe import BaseRecipe, Recipe, ScoredRecipe
-from src.smarts.recipe_finder import RecipeFinder
+from src.instrumentation import InstrumentedRoute
+from src.routers.responses import FastJSONResponse, json_response
+from src.settings import settings
+from src.schemas.recipe import (
+    BaseRecipe,
+    PantryRecipe,
+    Recipe,
+    RecipePatch,
+    ScoredRecipe,
+)
+
+router = APIRouter(prefix="/recipes", route_class=InstrumentedRoute)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(recipe: Recipe) -> str:
+    """Opaque pagination cursor pointing just after `recipe`."""
+    key = json.dumps([recipe.name, recipe.recipe_id]).encode()
+    return base64.urlsafe_b64encode(key).decode()
 
-router = APIRouter(prefix="/recipes")
 
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        name, recipe_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(name, str) or not isinstance(recipe_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return name, recipe_id
 
-@router.get("/prototype")
+
+def reject_duplicate_ids(recipe_ids: list[int]) -> None:
+    """A batch names each recipe once; anything else is a client error."""
+    duplicates = sorted({x for x in recipe_ids if recipe_ids.count(x) > 1})
+    if len(duplicates) > 0:
+        raise HTTPException(
+            status_code=422, detail=f"Recipes {duplicates} are listed more than once"
+        )
+
+
+@router.get("/prototype", response_model=list[Recipe])
 async def prototype_functionality(
-    db: Connection = Depends(get_db_conn),
-) -> list[Recipe]:
-    recipes = read_recipes(conn=db)
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> list[Recipe] | FastJSONResponse:
+    recipes = await read_recipes(conn=db)
     if recipes is None:
         raise HTTPException(status_code=500)
-    return recipes
+    return json_response(recipes)
+
 
+@router.get("/export")
+async def export_recipes(
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> StreamingResponse:
+    """Streams the whole catalogue as newline-delimited JSON, one recipe per line."""
 
-@router.get("/find")
+    async def ndjson_lines() -> AsyncIterator[str]:
+        async for recipe in stream_recipes(conn=db):
+            yield recipe.json() + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@router.get("/find", response_model=list[ScoredRecipe])
 async def find_recipes(
     ingredients: Annotated[set[str], Query()],
     exclude: Annotated[set[int] | None, Query()] = None,
-    db: Connection = Depends(get_db_conn),
-) -> list[ScoredRecipe]:
-    r_finder = RecipeFinder(conn=db)
-    return r_finder.find(ingredients, exclude)
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    prefer_rare_ingredients: bool = False,
+    ingred_amount_is_factor: bool = False,
+    prefer_popular_recipes: bool = False,
+    exact: bool = False,
+) -> list[ScoredRecipe] | FastJSONResponse:
+    scored_recipes = await find_scored_recipes(
+        ingredients=ingredients,
+        exclude=exclude,
+        limit=limit,
+        offset=offset,
+        prefer_rare_ingredients=prefer_rare_ingredients,
+        ingred_amount_is_factor=ingred_amount_is_factor,
+        prefer_popular_recipes=prefer_popular_recipes,
+        exact=exact,
+    )
+    return json_response(scored_recipes)
+
+
+@router.get("/pantry", response_model=list[PantryRecipe])
+async def find_recipes_in_pantry(
+    items: Annotated[set[str], Query()],
+    max_missing: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    exact: bool = False,
+) -> list[PantryRecipe] | FastJSONResponse:
+    """Recipes ranked by the fraction of their ingredients found among `items`."""
+    pantry_recipes = await find_recipes_by_pantry(
+        pantry=items,
+        max_missing=max_missing,
+        limit=limit,
+        offset=offset,
+        exact=exact,
+    )
+    return json_response(pantry_recipes)
+
+
+@router.get("/search", response_model=list[ScoredRecipe])
+async def search_recipes(
+    q: Annotated[str, Query(min_length=1)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> list[ScoredRecipe] | FastJSONResponse:
+    try:
+        scored_recipes = await search_scored_recipes(
+            query=q, conn=db, limit=limit, offset=offset
+        )
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return json_response(scored_recipes)
 
 
-@router.get("/{recipe_id}")
+@router.post("/batch", status_code=201)
+async def post_recipes(
+    new_recipes: list[BaseRecipe], db: AsyncConnection = Depends(get_async_db_conn)
+) -> list[Recipe]:
+    """Creates all recipes in one transaction, returned in the order they were sent."""
+    return await create_recipes(new_recipes, db)
+
+
+@router.put("/batch")
+async def put_recipes(
+    recipes: list[Recipe], db: AsyncConnection = Depends(get_async_db_conn)
+) -> list[Recipe]:
+    """Updates all recipes in one transaction. Nothing changes if one is missing."""
+    reject_duplicate_ids([x.recipe_id for x in recipes])
+    try:
+        return await update_recipes(recipes, db)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.delete("/batch")
+async def delete_recipes_by_ids(
+    recipe_ids: Annotated[list[int], Body()],
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> list[int]:
+    """Deletes all recipes in one transaction and returns the IDs that existed."""
+    reject_duplicate_ids(recipe_ids)
+    return await delete_recipes(recipe_ids=recipe_ids, conn=db)
+
+
+@router.get("/{recipe_id}", response_model=Recipe)
 async def get_recipe_by_id(
-    recipe_id: int, db: Connection = Depends(get_db_conn)
-) -> Recipe:
-    recipe = read_recipe_by_id(id=recipe_id, conn=db)
+    recipe_id: int, db: AsyncConnection = Depends(get_async_db_conn)
+) -> Recipe | Response:
+    if settings.RECIPE_DOCUMENTS_ENABLED:
+        document = await read_recipe_document(id=recipe_id, conn=db)
+        if document is not None:
+            return Response(content=document, media_type="application/json")
+    recipe = await read_recipe_by_id(id=recipe_id, conn=db)
     if recipe is None:
         raise HTTPException(status_code=404)
-    return recipe
+    return json_response(recipe)
 
 
-@router.get("/")
+@router.get("/", response_model=list[Recipe])
 async def get_recipes(
+    response: Response,
     name: str | None = None,
     author: str | None = None,
     ingredients: Annotated[list[str] | None, Query()] = None,
-    db: Connection = Depends(get_db_conn),
-) -> list[Recipe]:
-    recipes = read_recipes_matching_query(
-        conn=db, name=name, author=author, ingredients=ingredients
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    cursor: str | None = None,
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> list[Recipe] | FastJSONResponse:
+    """Returns one page of matching recipes, ordered by name.
+
+    When there may be more recipes, the cursor of the next page is sent in the
+    X-Next-Cursor header; pass it back as `cursor` to continue.
+    """
+    after = decode_cursor(cursor) if cursor is not None else None
+    recipes = await read_recipes_matching_query(
+        conn=db,
+        name=name,
+        author=author,
+        ingredients=ingredients,
+        limit=limit,
+        after=after,
     )
-    if recipes is None:
-        return []
-    return recipes
+    if len(recipes) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(recipes[-1])
+    return json_response(recipes, response)
 
 
 @router.post("/", status_code=201)
 async def post_recipe(
-    new_recipe: BaseRecipe, db: Connection = Depends(get_db_conn)
+    new_recipe: BaseRecipe, db: AsyncConnection = Depends(get_async_db_conn)
 ) -> Recipe:
-    response = create_recipe(new_recipe, db)
+    response = await create_recipe(new_recipe, db)
     return response
 
 
 @router.put("/{recipe_id}")
 async def put_recipe_by_id(
-    recipe_id: int, recipe: Recipe, db: Connection = Depends(get_db_conn)
+    recipe_id: int, recipe: Recipe, db: AsyncConnection = Depends(get_async_db_conn)
 ) -> Recipe:
-    response = update_recipe(recipe, db)
+    response = await update_recipe(recipe, db)
     return response
 
 
+@router.patch("/{recipe_id}")
+async def patch_recipe_by_id(
+    recipe_id: int,
+    patch: RecipePatch,
+    db: AsyncConnection = Depends(get_async_db_conn),
+) -> Recipe:
+    recipe = await patch_recipe(recipe_id=recipe_id, patch=patch, conn=db)
+    if recipe is None:
+        raise HTTPException(status_code=404)
+    return recipe
+
+
 @router.delete("/{recipe_id}", status_code=204)
-async def delete_recipe_by_id(recipe_id: int, db: Connection = Depends(get_db_conn)):
-    delete_recipe(recipe_id=recipe_id, conn=db)
+async def delete_recipe_by_id(
+    recipe_id: int, db: AsyncConnection = Depends(get_async_db_conn)
+):
+    await delete_recipe(recipe_id=recipe_id, conn=db)
     return Response(status_code=204)
@@ -0,0 +1,36 @@
+"""An opt-in fast path for JSON responses of already validated models.
+
+When an endpoint returns models, FastAPI validates them again against the response
+model, turns them into plain data with `jsonable_encoder` and encodes that with the
+stdlib `json`. The recipes the endpoints return are built from our own tables or
+from validated input, so with FAST_JSON_RESPONSES the endpoints return a
+`FastJSONResponse` instead, which FastAPI sends as it is. It encodes the models
+with `src.serialisation.dumps`.
+"""
+from typing import Any
+from fastapi import Response
+from src.serialisation import dumps
+from src.settings import settings
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, response: Response | None = None) -> Any:
+    """Returns `content` in a `FastJSONResponse` if FAST_JSON_RESPONSES is enabled.
+
+    Otherwise `content` is returned as it is, for FastAPI to validate and encode
+    against the route's `response_model`. Only pass data that is already valid for
+    that model, since the fast path skips validation. Headers set on the
+    endpoint's `response` parameter are sent either way.
+    """
+    if not settings.FAST_JSON_RESPONSES:
+        return content
+    fast_response = FastJSONResponse(content)
+    if response is not None:
+        fast_response.headers.raw.extend(response.headers.raw)
+    return fast_response
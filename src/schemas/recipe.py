@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 
 
 class Ingredient(BaseModel):
@@ -31,14 +31,30 @@ class RecipeInDB(Recipe):
     ingredients: list[Ingredient] | None
 
 
-class JoinedRecipeRecord(RecipeInDB):
-    ingred_name: str
-    amount: float | None
-    unit: str | None
-    notes: str | None
-    group: str | None
+class RecipePatch(BaseModel):
+    """A partial update. Only the fields present in the request are changed."""
+
+    name: str | None
+    author: str | None
+    rating: int | None
+    prep_time: float | None
+    cook_time: float | None
+    ingredients: list[Ingredient] | None
+    instructions: str | None
+
+    @validator("name", "author", "ingredients", pre=True)
+    def not_null(cls, v):
+        if v is None:
+            raise ValueError("may be omitted but not null")
+        return v
 
 
 class ScoredRecipe(BaseModel):
     score: float
     recipe: Recipe
+
+
+class PantryRecipe(ScoredRecipe):
+    """A recipe scored by the fraction of its ingredients a pantry covers."""
+
+    missing_ingredients: list[str]
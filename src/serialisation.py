@@ -0,0 +1,40 @@
+"""Compact JSON encoding of pydantic models, shared by the API and the datastore.
+
+The fast response path of `src.routers.responses` and the stored recipe documents
+of `src.db.operations` encode recipes the same way, so a stored document is
+byte-for-byte the response body. Models are encoded directly with orjson when the
+"fast" extra is installed, and with the stdlib `json` otherwise. The bytes are the
+same either way.
+"""
+import json
+from datetime import date, datetime, time
+from typing import Any
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encodes plain data, pydantic models and datetimes as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_to_json_data)
+    return json.dumps(
+        content,
+        default=_to_json_data,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _to_json_data(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        # Only fields live in a model's __dict__. Unlike .dict(), nothing is copied;
+        # nested models come back here as the encoder reaches them.
+        return value.__dict__
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,9 +1,50 @@
+from typing import Literal
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str
     SQLA_ECHO: bool
+    # Defaults to DATABASE_URL with its sqlite driver swapped for aiosqlite
+    ASYNC_DATABASE_URL: str | None = None
+    # "lru" keeps recent reads in memory, "none" disables caching. The LRU cache is
+    # per process: with several workers, reads can be stale for CACHE_TTL_SECONDS.
+    CACHE_BACKEND: str = "none"
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_TTL_SECONDS: float = 60.0
+    # SQLite storage profile, applied to every new connection. WAL lets readers
+    # carry on while a writer commits, which matters with several workers per file.
+    SQLITE_JOURNAL_MODE: Literal[
+        "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"
+    ] = "WAL"
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    # negative values are KiB, positive values are pages
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE: Literal["DEFAULT", "FILE", "MEMORY"] = "MEMORY"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # connection pool of each engine, per worker process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    # Send recipe lists without validating them again, encoded with orjson if
+    # installed. See src.routers.responses
+    FAST_JSON_RESPONSES: bool = False
+    # Keep every recipe's response body in the recipe_document table, so that
+    # GET /recipes/{recipe_id} is a single primary key lookup
+    RECIPE_DOCUMENTS_ENABLED: bool = False
+    # Share one read-only ingredient index between worker processes through this
+    # file, instead of building it in every process. See src.smarts.index_snapshot
+    INDEX_SNAPSHOT_PATH: str | None = None
+    # Open the connection pool, compile the hot statements and build the finder
+    # index before a worker serves requests. See src.warm_up
+    WARM_UP_ENABLED: bool = False
+    # Opt-in request instrumentation: GET /metrics and Server-Timing headers
+    INSTRUMENTATION_ENABLED: bool = False
+    # Share of requests run under cProfile, of which the slowest are kept
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_KEEP_SLOWEST: int = 10
+    PROFILE_DIR: str = "instance/profiles"
 
     class Config:
         env_file = "dev.env", "prod.env"
@@ -0,0 +1,427 @@
+"""A read-only ingredient index in a file that every worker process maps.
+
+`IngredientIndex` lives in the memory of each process, so with several gunicorn
+workers it is built, and held, once per worker. With INDEX_SNAPSHOT_PATH set, the
+index is written to that file instead and each worker maps it read-only: the pages
+are shared through the OS page cache, and a freshly started worker attaches to the
+file rather than reading every ingredient from the datastore.
+
+The file holds flat int64 arrays and UTF-8 string tables, read in place through
+memoryviews. Names, trigrams and canonical names are sorted, so lookups are binary
+searches and name IDs are positions in the sorted names.
+
+Every snapshot is stamped with the generation of the recipe data it was built from,
+see `build_data_generation_table`. Before answering a query a worker compares it
+with the current generation. If they differ, whichever worker gets the file lock
+first writes the new snapshot and swaps it in with an atomic rename; the others
+wait for the lock and then attach to the file it wrote. This relies on fcntl file
+locks, so it is only available on POSIX systems.
+"""
+import fcntl
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+from contextlib import contextmanager
+from threading import RLock
+from typing import Iterable, Iterator, Sequence
+from sqlalchemy import Connection
+from src.db.cache import recipe_cache
+from src.db.sql_operations import (
+    select_data_generation,
+    select_recipe_ingredient_names,
+)
+from src.smarts.ingredient_index import GRAM_SIZE, _grams
+from src.smarts.normaliser import normalise_ingredient_name
+
+MAGIC = b"RIXSNAP1"
+# magic, generation of the recipe data, number of sections
+HEADER = struct.Struct("<8sqq")
+# byte offset and byte length of a section
+SECTION = struct.Struct("<qq")
+SECTION_COUNT = 15
+
+
+class _Strings(Sequence[str]):
+    """Sorted strings stored as one UTF-8 blob plus the offset of each string."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        return str(self._blob[self._offsets[i] : self._offsets[i + 1]], "utf-8")
+
+    def find(self, value: str) -> int | None:
+        i = bisect_left(self, value)
+        if i < len(self) and self[i] == value:
+            return i
+        return None
+
+
+class _Postings(Sequence[memoryview]):
+    """One list of int64 values per position, stored as CSR offsets and values."""
+
+    def __init__(self, offsets: memoryview, values: memoryview):
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        return self._values[self._offsets[i] : self._offsets[i + 1]]
+
+
+class _RecipeNameIds(Mapping[int, memoryview]):
+    """Maps recipe IDs to the IDs of their ingredient names."""
+
+    def __init__(self, recipe_ids: memoryview, name_ids: _Postings):
+        self._recipe_ids = recipe_ids
+        self._name_ids = name_ids
+
+    def __getitem__(self, recipe_id: int) -> memoryview:
+        i = bisect_left(self._recipe_ids, recipe_id)
+        if i == len(self._recipe_ids) or self._recipe_ids[i] != recipe_id:
+            raise KeyError(recipe_id)
+        return self._name_ids[i]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._recipe_ids)
+
+    def __len__(self) -> int:
+        return len(self._recipe_ids)
+
+
+class IndexSnapshot:
+    """The read side of `IngredientIndex` over a mapped snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, generation, section_count = HEADER.unpack_from(view)
+        if magic != MAGIC or section_count != SECTION_COUNT:
+            raise ValueError(f"{path} is not an ingredient index snapshot")
+        layout = list(
+            SECTION.iter_unpack(
+                view[HEADER.size : HEADER.size + SECTION_COUNT * SECTION.size]
+            )
+        )
+        if len(layout) != SECTION_COUNT or any(
+            offset + length > len(view) for offset, length in layout
+        ):
+            raise ValueError(f"{path} is a truncated ingredient index snapshot")
+        sections = [view[offset : offset + length] for offset, length in layout]
+        # Sections 0, 7 and 11 are UTF-8 blobs, every other one holds int64s
+        ints = [
+            x.cast("q") if i not in (0, 7, 11) else x for i, x in enumerate(sections)
+        ]
+        self.generation: int = generation
+        self._names = _Strings(ints[0], ints[1])
+        self._recipe_ids = ints[2]
+        self._names_by_recipe = _Postings(ints[3], ints[4])
+        self._recipes_by_name = _Postings(ints[5], ints[6])
+        self._grams = _Strings(ints[7], ints[8])
+        self._names_by_gram = _Postings(ints[9], ints[10])
+        self._canonical_names = _Strings(ints[11], ints[12])
+        self._names_by_canonical = _Postings(ints[13], ints[14])
+
+    def name_id(self, ingred_name: str) -> int | None:
+        return self._names.find(ingred_name.lower())
+
+    def name_count(self) -> int:
+        return len(self._names)
+
+    def recipe_name_ids(self) -> Mapping[int, memoryview]:
+        return _RecipeNameIds(self._recipe_ids, self._names_by_recipe)
+
+    def recipes_with_name(self, name_id: int) -> memoryview:
+        return self._recipes_by_name[name_id]
+
+    def match_names(self, term: str, exact: bool = False) -> set[int]:
+        if exact:
+            i = self._canonical_names.find(normalise_ingredient_name(term))
+            return set() if i is None else set(self._names_by_canonical[i])
+        term = term.lower()
+        if len(term) < GRAM_SIZE:
+            return {x for x, name in enumerate(self._names) if term in name}
+        postings = []
+        for gram in _grams(term):
+            i = self._grams.find(gram)
+            if i is None:
+                return set()
+            postings.append(self._names_by_gram[i])
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for name_ids in postings[1:]:
+            candidates.intersection_update(name_ids)
+        return {x for x in candidates if term in self._names[x]}
+
+    def recipes_matching(self, term: str, exact: bool = False) -> set[int]:
+        recipe_ids: set[int] = set()
+        for name_id in self.match_names(term, exact=exact):
+            recipe_ids.update(self._recipes_by_name[name_id])
+        return recipe_ids
+
+    def coverage(
+        self, terms: Iterable[str], max_missing: int, exact: bool = False
+    ) -> dict[int, tuple[float, int]]:
+        pantry: set[int] = set()
+        for term in terms:
+            pantry |= self.match_names(term, exact=exact)
+        candidates: set[int] = set()
+        for name_id in pantry:
+            candidates.update(self._recipes_by_name[name_id])
+        names_by_recipe = self.recipe_name_ids()
+        coverage: dict[int, tuple[float, int]] = {}
+        for recipe_id in candidates:
+            name_ids = names_by_recipe[recipe_id]
+            missing = sum(1 for x in name_ids if x not in pantry)
+            if missing <= max_missing:
+                total = len(name_ids)
+                coverage[recipe_id] = ((total - missing) / total, missing)
+        return coverage
+
+
+def write_snapshot(path: str, generation: int, rows: Iterable[tuple[int, str]]) -> None:
+    """Builds a snapshot from (recipe_id, ingred_name) rows and swaps it in at `path`.
+
+    The file is written next to `path` and renamed over it, so readers see either
+    the old snapshot or the complete new one. Processes that mapped the old file
+    keep reading it until they attach to the new one.
+    """
+    names_by_recipe: dict[int, set[str]] = {}
+    for recipe_id, ingred_name in rows:
+        names_by_recipe.setdefault(recipe_id, set()).add(ingred_name.lower())
+    names = sorted(set().union(*names_by_recipe.values()))
+    name_ids = {name: i for i, name in enumerate(names)}
+    recipe_ids = sorted(names_by_recipe)
+    name_ids_by_recipe = [
+        sorted(name_ids[x] for x in names_by_recipe[recipe_id])
+        for recipe_id in recipe_ids
+    ]
+    recipes_by_name: list[list[int]] = [[] for _ in names]
+    for recipe_id, recipe_name_ids in zip(recipe_ids, name_ids_by_recipe):
+        for name_id in recipe_name_ids:
+            recipes_by_name[name_id].append(recipe_id)
+    names_by_gram: dict[str, list[int]] = {}
+    names_by_canonical: dict[str, list[int]] = {}
+    for name_id, name in enumerate(names):
+        for gram in _grams(name):
+            names_by_gram.setdefault(gram, []).append(name_id)
+        canonical_name = normalise_ingredient_name(name)
+        names_by_canonical.setdefault(canonical_name, []).append(name_id)
+    grams = sorted(names_by_gram)
+    canonical_names = sorted(names_by_canonical)
+    sections = [
+        *_string_sections(names),
+        array("q", recipe_ids).tobytes(),
+        *_posting_sections(name_ids_by_recipe),
+        *_posting_sections(recipes_by_name),
+        *_string_sections(grams),
+        *_posting_sections(names_by_gram[x] for x in grams),
+        *_string_sections(canonical_names),
+        *_posting_sections(names_by_canonical[x] for x in canonical_names),
+    ]
+
+    offset = HEADER.size + len(sections) * SECTION.size
+    layout: list[tuple[int, int]] = []
+    for section in sections:
+        layout.append((offset, len(section)))
+        offset += _padded(len(section))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, generation, len(sections)))
+        for section_offset, length in layout:
+            f.write(SECTION.pack(section_offset, length))
+        for section in sections:
+            f.write(section)
+            f.write(bytes(_padded(len(section)) - len(section)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> IndexSnapshot | None:
+    """Maps the snapshot at `path`, or returns None if there is no valid one."""
+    try:
+        return IndexSnapshot(path)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
+
+
+class SharedIngredientIndex:
+    """`IngredientIndex` backed by a snapshot file shared by all worker processes.
+
+    Writes are not applied to the snapshot. The write paths of `src.db.operations`
+    bump the generation of the recipe data instead, and `ensure_built` swaps in a
+    snapshot of the new generation before the next query. Cached
+    query results are dropped whenever a new snapshot is attached, since they may
+    have been derived from the old one, possibly by another process's writes.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = RLock()
+        self._generation = 0
+        self._snapshot: IndexSnapshot | None = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def lock(self) -> RLock:
+        """Held while the snapshot is swapped. Hold it to keep reading one snapshot."""
+        return self._lock
+
+    def build(self, conn: Connection) -> None:
+        """Writes a new snapshot from the datastore and attaches to it."""
+        generation = select_data_generation(conn=conn)
+        rows = select_recipe_ingredient_names(conn=conn)
+        with self._lock, _file_lock(f"{self._path}.lock"):
+            write_snapshot(self._path, generation, rows)
+            self._attach(self._load())
+
+    def ensure_built(self, conn: Connection) -> None:
+        """Attaches to a snapshot of the current generation, building it if needed.
+
+        The datastore is read before any lock is taken. Under the async engine a
+        query yields to other requests on the same thread, which would re-enter
+        the lock, or block the whole thread on the file lock, while it is held.
+        """
+        generation = select_data_generation(conn=conn)
+        if self._is_current(self._snapshot, generation):
+            return
+        snapshot = self._load()
+        if self._is_current(snapshot, generation):
+            with self._lock:
+                self._attach(snapshot)
+            return
+        # Read in the transaction that returned `generation`, so the rows match it
+        rows = select_recipe_ingredient_names(conn=conn)
+        with self._lock, _file_lock(f"{self._path}.lock"):
+            if self._is_current(self._snapshot, generation):
+                return
+            snapshot = self._load()
+            if not self._is_current(snapshot, generation):
+                write_snapshot(self._path, generation, rows)
+                snapshot = self._load()
+            self._attach(snapshot)
+
+    def invalidate(self) -> None:
+        """Detaches from the snapshot. The next `ensure_built` attaches again."""
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+
+    def add_recipe(
+        self, recipe_id: int, ingred_names: Iterable[str], data_generation: int
+    ) -> None:
+        """Does nothing: the write bumped the data generation, see `ensure_built`."""
+
+    def remove_recipe(self, recipe_id: int, data_generation: int) -> None:
+        """Does nothing: the write bumped the data generation, see `ensure_built`."""
+
+    def replace_recipe(
+        self, recipe_id: int, ingred_names: Iterable[str], data_generation: int
+    ) -> None:
+        """Does nothing: the write bumped the data generation, see `ensure_built`."""
+
+    def name_id(self, ingred_name: str) -> int | None:
+        return self._current().name_id(ingred_name)
+
+    def name_count(self) -> int:
+        return self._current().name_count()
+
+    def recipe_name_ids(self) -> Mapping[int, memoryview]:
+        return self._current().recipe_name_ids()
+
+    def recipes_with_name(self, name_id: int) -> memoryview:
+        return self._current().recipes_with_name(name_id)
+
+    def match_names(self, term: str, exact: bool = False) -> set[int]:
+        return self._current().match_names(term, exact=exact)
+
+    def recipes_matching(self, term: str, exact: bool = False) -> set[int]:
+        return self._current().recipes_matching(term, exact=exact)
+
+    def score(self, terms: Iterable[str]) -> Counter[int]:
+        scores: Counter[int] = Counter()
+        with self._lock:
+            for term in terms:
+                scores.update(self.recipes_matching(term))
+        return scores
+
+    def coverage(
+        self, terms: Iterable[str], max_missing: int, exact: bool = False
+    ) -> dict[int, tuple[float, int]]:
+        with self._lock:
+            return self._current().coverage(terms, max_missing, exact=exact)
+
+    def _is_current(self, snapshot: IndexSnapshot | None, generation: int) -> bool:
+        return snapshot is not None and snapshot.generation == generation
+
+    def _current(self) -> IndexSnapshot:
+        if self._snapshot is None:
+            raise RuntimeError("Call ensure_built before querying the index")
+        return self._snapshot
+
+    def _load(self) -> IndexSnapshot | None:
+        return load_snapshot(self._path)
+
+    def _attach(self, snapshot: IndexSnapshot | None) -> None:
+        if snapshot is None:
+            raise RuntimeError(f"Could not load the index snapshot at {self._path}")
+        # The old snapshot is unmapped once the last memoryview into it is gone
+        self._snapshot = snapshot
+        self._generation += 1
+        recipe_cache.invalidate_queries()
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Holds an exclusive lock on `path` across processes and threads."""
+    with open(path, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _string_sections(strings: list[str]) -> list[bytes]:
+    encoded = [x.encode("utf-8") for x in strings]
+    offsets = array("q", [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return [b"".join(encoded), offsets.tobytes()]
+
+
+def _posting_sections(postings: Iterable[list[int]]) -> list[bytes]:
+    offsets = array("q", [0])
+    values = array("q")
+    for posting in postings:
+        values.extend(posting)
+        offsets.append(len(values))
+    return [offsets.tobytes(), values.tobytes()]
+
+
+def _padded(length: int) -> int:
+    """Rounds up to a multiple of 8, so every int64 section is aligned."""
+    return -(-length // 8) * 8
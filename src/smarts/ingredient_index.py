@@ -0,0 +1,286 @@
+from collections import Counter
+from threading import Lock, RLock
+from typing import TYPE_CHECKING, Iterable
+from sqlalchemy import Connection
+from src.db.cache import recipe_cache
+from src.db.sql_operations import (
+    select_data_generation,
+    select_recipe_ingredient_names,
+)
+from src.settings import settings
+from src.smarts.normaliser import normalise_ingredient_name
+
+if TYPE_CHECKING:
+    from src.smarts.index_snapshot import SharedIngredientIndex
+
+GRAM_SIZE = 3
+
+
+def _grams(text: str) -> set[str]:
+    return {text[i : i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class IngredientIndex:
+    """Inverted index from ingredient names to the recipes that use them.
+
+    Every distinct (lowercased) ingredient name gets an integer ID. The index keeps
+        1) a posting list of recipe IDs per name,
+        2) the set of name IDs per recipe, and
+        3) a posting list of name IDs per character trigram, and
+        4) the name IDs per canonical ingredient name, for exact matching.
+
+    A substring query intersects the trigram posting lists of the query term to find
+    candidate names and only verifies those, so a lookup never scans the ingredient
+    table. Terms shorter than a trigram fall back to checking every known name,
+    which is still a scan of the distinct names rather than of every ingredient row.
+
+    The index is filled lazily from the datastore with `ensure_built` and remembers
+    the generation of the recipe data it was read at, `data_generation`. The write
+    paths in `src.db.operations` apply their own changes, tagged with the generation
+    they committed. Writes made by other processes only show as a newer generation
+    in the datastore, so `ensure_built` rebuilds the index whenever the generation
+    moved past the one it holds. Every change bumps `generation`, so structures
+    derived from the index know when to rebuild.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._build_lock = Lock()
+        self._is_built = False
+        self._generation = 0
+        self._data_generation = -1
+        self._name_ids: dict[str, int] = {}
+        self._names: list[str] = []
+        self._recipes_by_name: dict[int, set[int]] = {}
+        self._names_by_recipe: dict[int, set[int]] = {}
+        self._names_by_gram: dict[str, set[int]] = {}
+        self._names_by_canonical: dict[str, set[int]] = {}
+
+    @property
+    def is_built(self) -> bool:
+        return self._is_built
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def data_generation(self) -> int:
+        """The generation of the recipe data the index holds, -1 before a build."""
+        return self._data_generation
+
+    @property
+    def lock(self) -> RLock:
+        """Held while the index changes. Hold it to read a consistent snapshot."""
+        return self._lock
+
+    def build(self, conn: Connection) -> None:
+        """(Re)builds the whole index from the datastore.
+
+        The datastore is read before the index lock is taken, so writers applying
+        their changes are not held up by the query.
+        """
+        # Both reads in one transaction, so the rows match the generation
+        generation = select_data_generation(conn=conn)
+        rows = select_recipe_ingredient_names(conn=conn)
+        with self._lock:
+            was_built = self._is_built
+            self._reset()
+            for recipe_id, ingred_name in rows:
+                self._add(recipe_id, ingred_name)
+            self._is_built = True
+            self._data_generation = generation
+        if was_built:
+            # Queries answered from the old index may be stale
+            recipe_cache.invalidate_queries()
+
+    def ensure_built(self, conn: Connection) -> None:
+        """Builds the index if it is not built or older than the datastore.
+
+        Costs one query for the generation when the index is current.
+        """
+        generation = select_data_generation(conn=conn)
+        if self._is_built and self._data_generation >= generation:
+            return
+        with self._build_lock:
+            if self._is_built and self._data_generation >= generation:
+                return
+            self.build(conn=conn)
+
+    def invalidate(self) -> None:
+        """Drops the index contents. The next `ensure_built` reloads them."""
+        with self._lock:
+            self._reset()
+            self._is_built = False
+            self._data_generation = -1
+
+    def add_recipe(
+        self, recipe_id: int, ingred_names: Iterable[str], data_generation: int
+    ) -> None:
+        """Registers the ingredients of a recipe, written at `data_generation`.
+
+        See `_applies` for when this is a no-op.
+        """
+        with self._lock:
+            if not self._applies(data_generation):
+                return
+            for ingred_name in ingred_names:
+                self._add(recipe_id, ingred_name)
+            self._generation += 1
+            self._data_generation = data_generation
+
+    def remove_recipe(self, recipe_id: int, data_generation: int) -> None:
+        with self._lock:
+            if not self._applies(data_generation):
+                return
+            self._generation += 1
+            self._data_generation = data_generation
+            for name_id in self._names_by_recipe.pop(recipe_id, set()):
+                recipe_ids = self._recipes_by_name[name_id]
+                recipe_ids.discard(recipe_id)
+                if len(recipe_ids) == 0:
+                    for gram in _grams(self._names[name_id]):
+                        self._names_by_gram[gram].discard(name_id)
+
+    def replace_recipe(
+        self, recipe_id: int, ingred_names: Iterable[str], data_generation: int
+    ) -> None:
+        with self._lock:
+            self.remove_recipe(recipe_id, data_generation)
+            self.add_recipe(recipe_id, ingred_names, data_generation)
+
+    def name_id(self, ingred_name: str) -> int | None:
+        return self._name_ids.get(ingred_name.lower())
+
+    def name_count(self) -> int:
+        """The number of name IDs handed out, an upper bound on every name ID."""
+        return len(self._names)
+
+    def recipe_name_ids(self) -> dict[int, set[int]]:
+        """Maps every indexed recipe to the IDs of its ingredient names."""
+        return self._names_by_recipe
+
+    def recipes_with_name(self, name_id: int) -> set[int]:
+        return self._recipes_by_name[name_id]
+
+    def match_names(self, term: str, exact: bool = False) -> set[int]:
+        """Returns the IDs of all known names that contain `term`.
+
+        With `exact`, only names that normalise to the same canonical ingredient as
+        `term` match, so "egg" finds "2 large eggs" but not "eggplant".
+        """
+        if exact:
+            return set(
+                self._names_by_canonical.get(normalise_ingredient_name(term), ())
+            )
+        term = term.lower()
+        if len(term) < GRAM_SIZE:
+            return {
+                name_id
+                for name_id, recipe_ids in self._recipes_by_name.items()
+                if len(recipe_ids) > 0 and term in self._names[name_id]
+            }
+        postings = [self._names_by_gram.get(gram, set()) for gram in _grams(term)]
+        postings.sort(key=len)
+        candidates = set.intersection(*postings)
+        return {x for x in candidates if term in self._names[x]}
+
+    def recipes_matching(self, term: str, exact: bool = False) -> set[int]:
+        """Returns the IDs of all recipes with an ingredient name containing `term`."""
+        recipe_ids: set[int] = set()
+        for name_id in self.match_names(term, exact=exact):
+            recipe_ids |= self._recipes_by_name[name_id]
+        return recipe_ids
+
+    def score(self, terms: Iterable[str]) -> Counter[int]:
+        """Counts, per recipe, how many of `terms` match at least one ingredient.
+
+        Recipes matching none of the terms are not part of the result.
+        """
+        scores: Counter[int] = Counter()
+        with self._lock:
+            for term in terms:
+                scores.update(self.recipes_matching(term))
+        return scores
+
+    def coverage(
+        self, terms: Iterable[str], max_missing: int, exact: bool = False
+    ) -> dict[int, tuple[float, int]]:
+        """Measures how much of each recipe a pantry of `terms` covers.
+
+        A name is covered when one of the terms matches it, see `match_names`.
+        Returns, for every recipe with at least one covered name and at most
+        `max_missing` uncovered ones, the fraction of its names that are covered and
+        the number missing. The pantry is resolved to name IDs once, so each recipe
+        then costs one set difference over its own names however large the pantry
+        is.
+        """
+        with self._lock:
+            pantry: set[int] = set()
+            for term in terms:
+                pantry |= self.match_names(term, exact=exact)
+            candidates: set[int] = set()
+            for name_id in pantry:
+                candidates |= self._recipes_by_name[name_id]
+            coverage: dict[int, tuple[float, int]] = {}
+            for recipe_id in candidates:
+                name_ids = self._names_by_recipe[recipe_id]
+                missing = len(name_ids - pantry)
+                if missing <= max_missing:
+                    total = len(name_ids)
+                    coverage[recipe_id] = ((total - missing) / total, missing)
+            return coverage
+
+    def _applies(self, data_generation: int) -> bool:
+        """Whether a change written at `data_generation` can be applied in place.
+
+        It can if the index holds the generation just before it, or the same one,
+        when a transaction changed several recipes. Otherwise the index is not
+        built, already newer, or missed writes of other processes; `ensure_built`
+        then reads the datastore instead.
+        """
+        return (
+            self._is_built
+            and data_generation - 1 <= self._data_generation <= data_generation
+        )
+
+    def _reset(self) -> None:
+        self._generation += 1
+        self._name_ids = {}
+        self._names = []
+        self._recipes_by_name = {}
+        self._names_by_recipe = {}
+        self._names_by_gram = {}
+        self._names_by_canonical = {}
+
+    def _add(self, recipe_id: int, ingred_name: str) -> None:
+        name = ingred_name.lower()
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._name_ids[name] = name_id
+            self._names.append(name)
+            self._recipes_by_name[name_id] = set()
+            canonical_name = normalise_ingredient_name(name)
+            self._names_by_canonical.setdefault(canonical_name, set()).add(name_id)
+        recipe_ids = self._recipes_by_name[name_id]
+        if len(recipe_ids) == 0:
+            for gram in _grams(name):
+                self._names_by_gram.setdefault(gram, set()).add(name_id)
+        recipe_ids.add(recipe_id)
+        self._names_by_recipe.setdefault(recipe_id, set()).add(name_id)
+
+
+def build_ingredient_index(
+    snapshot_path: str | None,
+) -> "IngredientIndex | SharedIngredientIndex":
+    """An in-process index, or one shared through the snapshot at `snapshot_path`."""
+    if snapshot_path is None:
+        return IngredientIndex()
+    # Imported here, the snapshot module builds on this one
+    from src.smarts.index_snapshot import SharedIngredientIndex
+
+    return SharedIngredientIndex(snapshot_path)
+
+
+ingredient_index = build_ingredient_index(settings.INDEX_SNAPSHOT_PATH)
@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+
+# Words that say how much of an ingredient to use
+UNITS = {
+    "can",
+    "clove",
+    "cup",
+    "dash",
+    "g",
+    "gram",
+    "handful",
+    "kg",
+    "l",
+    "lb",
+    "liter",
+    "litre",
+    "ml",
+    "ounce",
+    "oz",
+    "package",
+    "piece",
+    "pinch",
+    "pound",
+    "sprig",
+    "stalk",
+    "tablespoon",
+    "tbsp",
+    "teaspoon",
+    "tsp",
+}
+# Words that describe how an ingredient is prepared or bought, not what it is
+ADJECTIVES = {
+    "and",
+    "beaten",
+    "boneless",
+    "chilled",
+    "chopped",
+    "coarsely",
+    "crushed",
+    "cubed",
+    "diced",
+    "divided",
+    "drained",
+    "finely",
+    "fresh",
+    "freshly",
+    "grated",
+    "ground",
+    "halved",
+    "heaping",
+    "large",
+    "lightly",
+    "medium",
+    "melted",
+    "minced",
+    "optional",
+    "packed",
+    "peeled",
+    "plus",
+    "rinsed",
+    "roughly",
+    "shredded",
+    "skinless",
+    "sliced",
+    "small",
+    "softened",
+    "thinly",
+    "warmed",
+}
+# Plurals the suffix rules below get wrong, and words that only look plural
+IRREGULAR_SINGULARS = {
+    "leaves": "leaf",
+    "halves": "half",
+    "loaves": "loaf",
+    "knives": "knife",
+}
+NOT_PLURAL = {
+    "asparagus",
+    "citrus",
+    "couscous",
+    "grits",
+    "hummus",
+    "molasses",
+    "oats",
+    "swiss",
+    "series",
+}
+
+_QUANTITY = re.compile(r"^(\d+([./]\d+)?|[¼½¾⅓⅔⅛]|\d+[¼½¾⅓⅔⅛])(-\S+)?$")
+_NOTES = re.compile(r"\([^)]*\)|,.*$| to taste.*$")
+_WORD = re.compile(r"[a-z0-9¼½¾⅓⅔⅛./'’-]+")
+
+
+def singularise(word: str) -> str:
+    """Turns an English plural into its singular with a few suffix rules."""
+    if word in IRREGULAR_SINGULARS:
+        return IRREGULAR_SINGULARS[word]
+    if word in NOT_PLURAL or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=16384)
+def normalise_ingredient_name(ingred_name: str) -> str:
+    """Reduces an ingredient name to the canonical name of the ingredient.
+
+    The name is lowercased, notes after a comma or in parentheses are dropped, then
+    quantities, units and preparation adjectives are removed and every word is
+    singularised, e.g. "2 Large Garlic Cloves, minced" becomes "garlic". Units are
+    only removed while other words remain, so "cloves" stays "clove". Returns an
+    empty string for names without any word.
+    """
+    name = _NOTES.sub("", ingred_name.lower())
+    words = [singularise(x) for x in _WORD.findall(name) if not _QUANTITY.match(x)]
+    words = [x for x in words if x not in ADJECTIVES] or words
+    described = [x for x in words if x not in UNITS]
+    return " ".join(described or words)
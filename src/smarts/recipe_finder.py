@@ -1,30 +1,47 @@
+import heapq
+from typing import Iterable
 from sqlalchemy import Connection
-from src.schemas.recipe import ScoredRecipe
-from src.db.sql_operations import (
-    select_joined_recipes_matching_query,
-)
+from src.schemas.recipe import PantryRecipe, ScoredRecipe
+from src.db.sql_operations import select_joined_recipes_by_ids
+from src.db.cache import query_key, recipe_cache
 from src.db.operations import _combine_joined_recipe_records
+from src.smarts.ingredient_index import ingredient_index
+from src.smarts.normaliser import normalise_ingredient_name
+from src.smarts.scoring import scoring_engine
 
 
 class RecipeFinder:
     def __init__(
         self,
         conn: Connection,
-        # ingred_amount_is_factor: bool = False,
-        # prefer_popular_recipes: bool = True,
+        prefer_rare_ingredients: bool = False,
+        ingred_amount_is_factor: bool = False,
+        prefer_popular_recipes: bool = False,
+        exact_ingredients: bool = False,
         # prefer_different_cuisine: bool = True,
     ):
         self.conn = conn
-        # self.ingred_amount_is_factor = ingred_amount_is_factor
-        # self.prefer_popular_recipes = prefer_popular_recipes
+        self.prefer_rare_ingredients = prefer_rare_ingredients
+        self.ingred_amount_is_factor = ingred_amount_is_factor
+        self.prefer_popular_recipes = prefer_popular_recipes
+        self.exact_ingredients = exact_ingredients
         # self.prefer_different_cuisine = prefer_different_cuisine
 
     def find(
-        self, ingredients: set[str], exclude: set[int] | None
+        self,
+        ingredients: set[str],
+        exclude: set[int] | None,
+        limit: int | None = None,
+        offset: int = 0,
     ) -> list[ScoredRecipe]:
         """Provides a recipe list that include at least one of the provided ingredients
 
-        Sorts the returned recipes from best match to worst match.
+        Sorts the returned recipes from best match to worst match. Candidates and
+        scores come from the in-memory `scoring_engine`; only the matching recipes
+        are read from the datastore. Matching is a case-insensitive substring check,
+        or a comparison of canonical ingredients if the finder was created with
+        `exact_ingredients`. By default the score is the number of matching
+        ingredients; the weights set on the finder refine it, see `ScoringEngine`.
 
         Parameters:
         - `ingredients`: a list of ingredient names. At least one of these will be
@@ -32,34 +49,150 @@ class RecipeFinder:
         - `exclude`: a list of recipe IDs to exclude from the resulting recipes. Note
         that this function does not confirm these IDs are valid. It merely prevents
         any recipe with one of these IDs from being in the results.
+        - `limit`: the maximum number of recipes to return. `None` returns them all.
+        - `offset`: the number of best matches to skip, for paging through results.
 
         Returns:
-        - `scored_recipes`: a list of recipes with scores, sorted by score
+        - `scored_recipes`: a list of recipes with scores, sorted by score. Ties are
+        broken by recipe ID so that pages are stable.
         """
 
-        joined_records = select_joined_recipes_matching_query(
-            conn=self.conn, name=None, author=None, ingredients=ingredients
+        key = query_key(
+            "find",
+            {x.lower() for x in ingredients},
+            exclude or [],
+            limit,
+            offset,
+            self.prefer_rare_ingredients,
+            self.ingred_amount_is_factor,
+            self.prefer_popular_recipes,
+            self.exact_ingredients,
         )
-        if joined_records is None:
-            raise Exception("No recipes were returned but they should have been.")
+        scored_recipes = recipe_cache.get(key)
+        if scored_recipes is not None:
+            return scored_recipes
+        epoch = recipe_cache.epoch()
 
+        scores = scoring_engine.score(
+            conn=self.conn,
+            terms=ingredients,
+            prefer_rare_ingredients=self.prefer_rare_ingredients,
+            ingred_amount_is_factor=self.ingred_amount_is_factor,
+            prefer_popular_recipes=self.prefer_popular_recipes,
+            exact=self.exact_ingredients,
+        )
         if exclude is not None:
-            joined_records = [y for y in joined_records if y.recipe_id not in exclude]
-
-        recipes = _combine_joined_recipe_records(joined_records)
-        max_score = len(ingredients)
-        scored_recipes: list[ScoredRecipe] = []
-        for recipe in recipes:
-            unique_ingredients = {x.ingred_name for x in recipe.ingredients}
-            score = 0
-            for i in ingredients:
-                for unique_ingredient in unique_ingredients:
-                    if i in unique_ingredient:
-                        score += 1
-                        break
-            scored_recipes.append(ScoredRecipe(score=score, recipe=recipe))
-            if score > max_score:
-                raise Exception("A recipe scored higher than the maximum.")
-
-        scored_recipes.sort(key=lambda recipe: recipe.score, reverse=True)
+            for recipe_id in exclude:
+                scores.pop(recipe_id, None)
+
+        ranking = _rank(scores.items(), limit=limit, offset=offset)
+        if len(ranking) == 0:
+            return []
+
+        joined_records = select_joined_recipes_by_ids(
+            conn=self.conn, recipe_ids=[recipe_id for recipe_id, _ in ranking]
+        )
+        recipes = {
+            x.recipe_id: x for x in _combine_joined_recipe_records(joined_records)
+        }
+        scored_recipes = [
+            ScoredRecipe(score=score, recipe=recipes[recipe_id])
+            for recipe_id, score in ranking
+            if recipe_id in recipes
+        ]
+        recipe_cache.set(key, scored_recipes, epoch)
         return scored_recipes
+
+    def find_by_pantry(
+        self,
+        pantry: set[str],
+        max_missing: int = 0,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[PantryRecipe]:
+        """Provides the recipes that can be cooked, or nearly, from a pantry
+
+        An ingredient is in the pantry when one of the pantry items matches its name,
+        the same check as in `find`.
+
+        Parameters:
+        - `pantry`: the names of the available ingredients.
+        - `max_missing`: how many ingredients of a recipe may be missing from the
+        pantry. With 0, only fully covered recipes are returned.
+        - `limit`: the maximum number of recipes to return. `None` returns them all.
+        - `offset`: the number of best matches to skip, for paging through results.
+
+        Returns:
+        - `pantry_recipes`: recipes scored by the fraction of their ingredients in
+        the pantry, best first. Ties go to the recipe missing fewer ingredients,
+        then to the lower recipe ID.
+        """
+        terms = {x.lower() for x in pantry}
+        key = query_key(
+            "pantry", terms, max_missing, limit, offset, self.exact_ingredients
+        )
+        pantry_recipes = recipe_cache.get(key)
+        if pantry_recipes is not None:
+            return pantry_recipes
+        epoch = recipe_cache.epoch()
+
+        ingredient_index.ensure_built(conn=self.conn)
+        coverage = ingredient_index.coverage(
+            terms, max_missing=max_missing, exact=self.exact_ingredients
+        )
+
+        def sort_key(recipe_id: int):
+            return (-coverage[recipe_id][0], coverage[recipe_id][1], recipe_id)
+
+        if limit is None:
+            ranked_ids = sorted(coverage, key=sort_key)[offset:]
+        else:
+            ranked_ids = heapq.nsmallest(offset + limit, coverage, key=sort_key)
+            ranked_ids = ranked_ids[offset:]
+        if len(ranked_ids) == 0:
+            return []
+
+        joined_records = select_joined_recipes_by_ids(
+            conn=self.conn, recipe_ids=ranked_ids
+        )
+        recipes = {
+            x.recipe_id: x for x in _combine_joined_recipe_records(joined_records)
+        }
+        pantry_recipes = [
+            PantryRecipe(
+                score=coverage[recipe_id][0],
+                recipe=recipes[recipe_id],
+                missing_ingredients=[
+                    x.ingred_name
+                    for x in recipes[recipe_id].ingredients
+                    if not self._in_pantry(x.ingred_name, terms)
+                ],
+            )
+            for recipe_id in ranked_ids
+            if recipe_id in recipes
+        ]
+        recipe_cache.set(key, pantry_recipes, epoch)
+        return pantry_recipes
+
+    def _in_pantry(self, ingred_name: str, terms: set[str]) -> bool:
+        if self.exact_ingredients:
+            canonical_terms = {normalise_ingredient_name(x) for x in terms}
+            return normalise_ingredient_name(ingred_name) in canonical_terms
+        return any(term in ingred_name.lower() for term in terms)
+
+
+def _rank(
+    scores: Iterable[tuple[int, float]], limit: int | None, offset: int
+) -> list[tuple[int, float]]:
+    """Orders (recipe_id, score) pairs best first and cuts out the requested page.
+
+    With a limit, only the best `offset + limit` pairs are kept on a heap, so the
+    cost is O(n log k) rather than a full sort of every match.
+    """
+
+    def sort_key(item: tuple[int, float]):
+        return (-item[1], item[0])
+
+    if limit is None:
+        return sorted(scores, key=sort_key)[offset:]
+    return heapq.nsmallest(offset + limit, scores, key=sort_key)[offset:]
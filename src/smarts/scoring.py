@@ -0,0 +1,220 @@
+import math
+from collections import Counter
+from statistics import median
+from threading import Lock
+from typing import TYPE_CHECKING, Iterable
+from sqlalchemy import Connection
+from src.db.sql_operations import select_recipe_ingredient_amounts
+from src.smarts.ingredient_index import IngredientIndex, ingredient_index
+
+if TYPE_CHECKING:
+    from src.smarts.index_snapshot import SharedIngredientIndex
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    # Install the "fast" extra for the vectorised engine. Without it, scores are
+    # computed from the index in pure Python and are the same, only slower.
+    np = None
+    sparse = None
+
+# An amount is compared with the median amount of the same ingredient across all
+# recipes. Units are not converted, so the ratio is clipped to keep outliers in check.
+MIN_AMOUNT_FACTOR = 0.5
+MAX_AMOUNT_FACTOR = 2.0
+# Each rating point raises the score of a recipe by this share
+RATING_WEIGHT = 0.1
+
+
+class ScoringEngine:
+    """Scores recipes by how well their ingredients match a set of query terms.
+
+    A recipe earns one point per term that matches one of its ingredient names. On
+    top of that, optionally:
+        1) `prefer_rare_ingredients` weighs each term by its smoothed inverse
+        document frequency, so a match on a rare ingredient counts more than one on
+        salt.
+        2) `ingred_amount_is_factor` scales a match by how much of the ingredient
+        the recipe uses compared with other recipes, see `MIN_AMOUNT_FACTOR`.
+        3) `prefer_popular_recipes` raises the score of well rated recipes.
+
+    With NumPy and SciPy installed, the recipe × ingredient name matrix is kept as a
+    sparse CSC matrix and each term is scored for every recipe in one vectorised
+    operation over the columns of its matching names. The matrix is derived from
+    `ingredient_index` and rebuilt lazily after the index changed. It is private to
+    each process, even when the index is a shared snapshot.
+    """
+
+    def __init__(self, index: "IngredientIndex | SharedIngredientIndex"):
+        self._index = index
+        self._lock = Lock()
+        self._factors_generation = -1
+        self._amount_factors: dict[tuple[int, int], float] = {}
+        self._ratings: dict[int, int] = {}
+        self._matrix_key: tuple[int, int] | None = None
+        self._matrix = None
+        self._matrix_recipe_ids = None
+        self._matrix_ratings = None
+
+    @property
+    def is_vectorised(self) -> bool:
+        return np is not None
+
+    def score(
+        self,
+        conn: Connection,
+        terms: Iterable[str],
+        prefer_rare_ingredients: bool = False,
+        ingred_amount_is_factor: bool = False,
+        prefer_popular_recipes: bool = False,
+        exact: bool = False,
+    ) -> dict[int, float]:
+        """Scores every recipe matching at least one of `terms`.
+
+        Recipes matching none of the terms are not part of the result. Without any
+        of the weights, the score is the number of matching terms. `exact` matches
+        terms by canonical ingredient, see `IngredientIndex.match_names`.
+        """
+        self._index.ensure_built(conn=conn)
+        if ingred_amount_is_factor or prefer_popular_recipes:
+            self._ensure_factors(conn=conn)
+        with self._index.lock:
+            name_sets = [self._index.match_names(x, exact=exact) for x in terms]
+            if np is None:
+                return self._score_python(
+                    name_sets,
+                    prefer_rare_ingredients,
+                    ingred_amount_is_factor,
+                    prefer_popular_recipes,
+                )
+            return self._score_vectorised(
+                name_sets,
+                prefer_rare_ingredients,
+                ingred_amount_is_factor,
+                prefer_popular_recipes,
+            )
+
+    def _score_vectorised(
+        self,
+        name_sets: list[set[int]],
+        prefer_rare_ingredients: bool,
+        ingred_amount_is_factor: bool,
+        prefer_popular_recipes: bool,
+    ) -> dict[int, float]:
+        self._ensure_matrix()
+        recipe_count = self._matrix.shape[0]
+        scores = np.zeros(recipe_count)
+        for name_ids in name_sets:
+            if len(name_ids) == 0:
+                continue
+            columns = self._matrix[:, sorted(name_ids)]
+            if ingred_amount_is_factor:
+                matches = columns.max(axis=1).toarray().ravel()
+            else:
+                matches = (columns.getnnz(axis=1) > 0).astype(float)
+            if prefer_rare_ingredients:
+                document_count = np.count_nonzero(matches)
+                matches *= _idf(recipe_count, document_count)
+            scores += matches
+        if prefer_popular_recipes:
+            scores *= 1 + RATING_WEIGHT * self._matrix_ratings
+        rows = np.flatnonzero(scores)
+        return dict(zip(self._matrix_recipe_ids[rows].tolist(), scores[rows].tolist()))
+
+    def _score_python(
+        self,
+        name_sets: list[set[int]],
+        prefer_rare_ingredients: bool,
+        ingred_amount_is_factor: bool,
+        prefer_popular_recipes: bool,
+    ) -> dict[int, float]:
+        recipe_count = len(self._index.recipe_name_ids())
+        scores: Counter[int] = Counter()
+        for name_ids in name_sets:
+            matches: dict[int, float] = {}
+            if ingred_amount_is_factor:
+                for name_id in name_ids:
+                    for recipe_id in self._index.recipes_with_name(name_id):
+                        factor = self._amount_factors.get((recipe_id, name_id), 1.0)
+                        matches[recipe_id] = max(matches.get(recipe_id, 0.0), factor)
+            else:
+                matches = dict.fromkeys(
+                    set().union(*map(self._index.recipes_with_name, name_ids)), 1
+                )
+            weight = 1.0
+            if prefer_rare_ingredients:
+                weight = _idf(recipe_count, len(matches))
+            if weight == 1.0 and not ingred_amount_is_factor:
+                scores.update(matches.keys())
+                continue
+            for recipe_id, factor in matches.items():
+                scores[recipe_id] += weight * factor
+        if prefer_popular_recipes:
+            for recipe_id in scores:
+                rating = self._ratings.get(recipe_id) or 0
+                scores[recipe_id] *= 1 + RATING_WEIGHT * rating
+        return scores
+
+    def _ensure_factors(self, conn: Connection) -> None:
+        """Loads amounts and ratings if the index changed since they were loaded."""
+        generation = self._index.generation
+        if self._factors_generation == generation:
+            return
+        rows = select_recipe_ingredient_amounts(conn=conn)
+        ratings: dict[int, int] = {}
+        amounts: dict[tuple[int, int], float] = {}
+        for recipe_id, rating, ingred_name, amount in rows:
+            if rating is not None:
+                ratings[recipe_id] = rating
+            name_id = self._index.name_id(ingred_name)
+            if name_id is None or amount is None or amount <= 0:
+                continue
+            key = (recipe_id, name_id)
+            amounts[key] = max(amount, amounts.get(key, 0.0))
+        amounts_by_name: dict[int, list[float]] = {}
+        for (_, name_id), amount in amounts.items():
+            amounts_by_name.setdefault(name_id, []).append(amount)
+        medians = {x: median(values) for x, values in amounts_by_name.items()}
+        with self._lock:
+            self._ratings = ratings
+            self._amount_factors = {
+                (recipe_id, name_id): min(
+                    max(amount / medians[name_id], MIN_AMOUNT_FACTOR),
+                    MAX_AMOUNT_FACTOR,
+                )
+                for (recipe_id, name_id), amount in amounts.items()
+            }
+            self._factors_generation = generation
+
+    def _ensure_matrix(self) -> None:
+        """(Re)builds the sparse matrix. Must be called holding the index lock."""
+        key = (self._index.generation, self._factors_generation)
+        if self._matrix_key == key:
+            return
+        with self._lock:
+            names_by_recipe = self._index.recipe_name_ids()
+            recipe_ids = sorted(names_by_recipe)
+            rows: list[int] = []
+            columns: list[int] = []
+            data: list[float] = []
+            for row, recipe_id in enumerate(recipe_ids):
+                for name_id in names_by_recipe[recipe_id]:
+                    rows.append(row)
+                    columns.append(name_id)
+                    data.append(self._amount_factors.get((recipe_id, name_id), 1.0))
+            shape = (len(recipe_ids), self._index.name_count())
+            self._matrix = sparse.csc_matrix((data, (rows, columns)), shape=shape)
+            self._matrix_recipe_ids = np.array(recipe_ids, dtype=np.int64)
+            self._matrix_ratings = np.array(
+                [self._ratings.get(x) or 0 for x in recipe_ids], dtype=float
+            )
+            self._matrix_key = key
+
+
+def _idf(recipe_count: int, document_count: int) -> float:
+    """Smoothed inverse document frequency, always at least 1."""
+    return math.log((1 + recipe_count) / (1 + document_count)) + 1
+
+
+scoring_engine = ScoringEngine(ingredient_index)
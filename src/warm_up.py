@@ -0,0 +1,78 @@
+"""Primes a worker before it serves its first request.
+
+A fresh worker opens its database connections, compiles its statements and builds
+the ingredient index on the first requests that need them, so those requests are
+the slow ones. With WARM_UP_ENABLED, the app's lifespan does that work up front,
+and the worker only reports ready once it is done. Each phase is timed, so the
+cold start can be measured and bounded.
+"""
+import asyncio
+import time
+from typing import Any
+from sqlalchemy import Connection, Engine, Executable
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.db import statements
+from src.smarts.ingredient_index import ingredient_index
+from src.smarts.scoring import scoring_engine
+
+# The read statements of the hot paths, with parameters that match nothing
+WARM_UP_STATEMENTS: list[tuple[Executable, dict[str, Any]]] = [
+    (statements.recipe_by_id, {"recipe_id": 0}),
+    (statements.recipe_with_ingredients_by_id, {"recipe_id": 0}),
+    (statements.ingredients_by_recipe_id, {"recipe_id": 0}),
+    (statements.ingredient_rows_by_recipe_id, {"recipe_id": 0}),
+    (statements.recipes_by_ids.by_values, {"values": [0]}),
+    (statements.joined_recipes_by_ids.by_values, {"values": [0]}),
+    (statements.recipe_created_at_by_ids.by_values, {"values": [0]}),
+    (statements.recipe_document_by_id, {"recipe_id": 0}),
+    (statements.data_generation, {}),
+    (
+        statements.joined_recipes_by_filters(False, False, False, paged=True),
+        {"limit": 1},
+    ),
+]
+
+
+async def warm_up(
+    engine: Engine, async_engine: AsyncEngine, pool_size: int
+) -> dict[str, float]:
+    """Primes the pools, the compiled statements and the finder index.
+
+    Returns the seconds spent on each phase.
+    """
+    timings: dict[str, float] = {}
+    start = time.perf_counter()
+    connections = [await async_engine.connect() for _ in range(max(pool_size, 1))]
+    try:
+        timings["pool"] = time.perf_counter() - start
+        # Statements are compiled once per engine, on their first execution
+        start = time.perf_counter()
+        for statement, params in WARM_UP_STATEMENTS:
+            await connections[0].execute(statement, params)
+        timings["statements"] = time.perf_counter() - start
+    finally:
+        # Closed connections go back to the pool and stay open
+        for conn in connections:
+            await conn.close()
+    start = time.perf_counter()
+    await asyncio.to_thread(_warm_up_index, engine)
+    timings["index"] = time.perf_counter() - start
+    return timings
+
+
+def _warm_up_index(engine: Engine) -> None:
+    with engine.connect() as conn:
+        _execute_statements(conn)
+        ingredient_index.ensure_built(conn=conn)
+        scoring_engine.score(
+            conn=conn,
+            terms=[],
+            ingred_amount_is_factor=True,
+            prefer_popular_recipes=True,
+        )
+
+
+def _execute_statements(conn: Connection) -> None:
+    for statement, params in WARM_UP_STATEMENTS:
+        conn.execute(statement, params)
+    conn.rollback()
@@ -3,16 +3,28 @@ import json
 from sqlalchemy import MetaData, create_engine
 from starlette.testclient import TestClient
 from src.app import app
-from src.db.tables import build_ingredients_table, build_recipes_table
+from src.db.tables import (
+    build_canonical_ingredients_table,
+    build_data_generation_table,
+    build_ingredients_table,
+    build_recipe_documents_table,
+    build_recipe_search_table,
+    build_recipes_table,
+)
 from src.db.sql_operations import select_joined_recipes_matching_query
-from src.db.operations import create_recipe
+from src.db.operations import bulk_import_recipes
+from src.db.setup import init_db
 from src.settings import settings
 from src.schemas.recipe import BaseRecipe
 
 # creates a fresh database
 metadata = MetaData()
+metadata, _ = build_canonical_ingredients_table(metadata=metadata)
 metadata, recipes_table = build_recipes_table(metadata=metadata)
 metadata, ingredients_table = build_ingredients_table(metadata=metadata)
+metadata, _ = build_recipe_search_table(metadata=metadata)
+metadata, _ = build_recipe_documents_table(metadata=metadata)
+metadata, _ = build_data_generation_table(metadata=metadata)
 engine = create_engine(settings.DATABASE_URL, echo=True)
 metadata.drop_all(engine)
 metadata.create_all(bind=engine)
@@ -21,10 +33,10 @@ metadata.create_all(bind=engine)
 with engine.connect() as conn:
     with open("tests/full-dataset.json", "r") as f:
         json_data = json.load(f)
-        for recipe in json_data:
-            recipe = BaseRecipe(**recipe)
-            if create_recipe(recipe, conn) is None:
-                raise Exception("Encoding error:")
+        bulk_import_recipes((BaseRecipe(**recipe) for recipe in json_data), conn)
+
+# the app's engines, as its lifespan would create them
+init_db()
 
 
 @pytest.fixture
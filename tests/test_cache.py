@@ -0,0 +1,99 @@
+from fastapi.testclient import TestClient
+from src.db import operations
+from src.db.cache import LRUCache, query_key, recipe_key
+from src.settings import settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used_and_expired():
+    # arrange
+    clock = FakeClock()
+    cache = LRUCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.set(recipe_key(1), "one", cache.epoch())
+    cache.set(recipe_key(2), "two", cache.epoch())
+
+    # act
+    cache.get(recipe_key(1))
+    cache.set(recipe_key(3), "three", cache.epoch())
+    clock.now = 5
+    survivor = cache.get(recipe_key(1))
+    clock.now = 11
+    expired = cache.get(recipe_key(3))
+
+    # assert
+    assert cache.get(recipe_key(2)) is None
+    assert survivor == "one"
+    assert expired is None
+    stats = cache.stats()
+    assert stats.hits == 2
+    assert stats.evictions == 2
+
+
+def test_lru_cache_invalidates_precisely():
+    # arrange
+    cache = LRUCache(max_entries=10, ttl_seconds=60)
+    cache.set(recipe_key(1), "one", cache.epoch())
+    cache.set(recipe_key(2), "two", cache.epoch())
+    cache.set(
+        query_key("recipes", None, None, ["b", "a"]), ["one", "two"], cache.epoch()
+    )
+
+    # act
+    cache.invalidate_recipe(1)
+
+    # assert
+    assert cache.get(recipe_key(1)) is None
+    assert cache.get(recipe_key(2)) == "two"
+    assert cache.get(query_key("recipes", None, None, ["a", "b"])) is None
+
+
+def test_lru_cache_drops_values_read_before_an_invalidation():
+    # arrange
+    cache = LRUCache(max_entries=10, ttl_seconds=60)
+    epoch = cache.epoch()
+
+    # act
+    cache.invalidate_recipe(1)
+    cache.set(recipe_key(1), "stale one", epoch)
+    cache.set(recipe_key(2), ["two"], cache.epoch())
+    cache.get(recipe_key(2)).append("changed by a caller")
+
+    # assert
+    assert cache.get(recipe_key(1)) is None
+    assert cache.get(recipe_key(2)) == ["two"]
+
+
+def test_recipe_reads_see_writes(client: TestClient, monkeypatch):
+    # arrange
+    monkeypatch.setattr(operations, "recipe_cache", LRUCache(10, ttl_seconds=60))
+    monkeypatch.setattr(settings, "RECIPE_DOCUMENTS_ENABLED", False)
+    data = {
+        "name": "Cached crumble",
+        "author": "Joe",
+        "ingredients": [{"ingred_name": "apple"}],
+        "instructions": "Bake.",
+    }
+    recipe_dict = client.post("/recipes/", json=data).json()
+    recipe_id = recipe_dict["recipe_id"]
+    recipe_dict["rating"] = 3
+
+    # act
+    try:
+        client.get(f"/recipes/{recipe_id}")
+        client.put(f"/recipes/{recipe_id}", json=recipe_dict)
+        response = client.get(f"/recipes/{recipe_id}")
+        stats = operations.recipe_cache.stats()
+    finally:
+        client.delete(f"/recipes/{recipe_id}")
+
+    # assert
+    assert response.json()["rating"] == 3
+    assert stats.misses == 2 and stats.size == 1
+    assert client.get("/cache/stats").status_code == 200
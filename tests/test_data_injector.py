@@ -0,0 +1,17 @@
+import io
+import json
+from data_injector import iter_json_array
+
+
+def test_iter_json_array_streams_elements():
+    # arrange
+    with open("tests/recipe_samples.json", "r") as f:
+        raw = f.read()
+    expected = json.loads(raw)
+
+    # act
+    streamed = list(iter_json_array(io.StringIO(raw), chunk_size=7))
+
+    # assert
+    assert streamed == expected
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+from httpx import AsyncClient
+from src.app import app
+from src.db.cache import recipe_cache
+from src.db.operations import create_recipe, delete_recipe
+from src.db.setup import get_engine
+from src.schemas.recipe import BaseRecipe, Ingredient
+from src.smarts import index_snapshot, recipe_finder
+from src.smarts.index_snapshot import SharedIngredientIndex, load_snapshot
+from src.smarts.ingredient_index import IngredientIndex
+from src.smarts.scoring import ScoringEngine
+
+
+def test_snapshot_answers_like_the_in_process_index(db_conn, tmp_path):
+    # arrange
+    index = IngredientIndex()
+    index.build(conn=db_conn)
+    shared = SharedIngredientIndex(str(tmp_path / "index.snapshot"))
+
+    # act
+    shared.ensure_built(conn=db_conn)
+
+    # assert
+    for term in ["garlic", "eg", "salt", "olive oil", "no such ingredient"]:
+        assert shared.recipes_matching(term) == index.recipes_matching(term)
+    assert shared.recipes_matching("egg", exact=True) == index.recipes_matching(
+        "egg", exact=True
+    )
+    pantry = ["salt", "eggs", "flour", "butter", "milk"]
+    assert shared.coverage(pantry, max_missing=3) == index.coverage(
+        pantry, max_missing=3
+    )
+    assert shared.score(["garlic", "onion"]) == index.score(["garlic", "onion"])
+    assert len(shared.recipe_name_ids()) == len(index.recipe_name_ids())
+
+
+def test_snapshot_is_shared_and_follows_writes(db_conn, tmp_path, monkeypatch):
+    # arrange
+    path = str(tmp_path / "index.snapshot")
+    first = SharedIngredientIndex(path)
+    first.ensure_built(conn=db_conn)
+
+    def fail(*args):
+        raise AssertionError("the snapshot should have been reused")
+
+    # act
+    monkeypatch.setattr(index_snapshot, "write_snapshot", fail)
+    second = SharedIngredientIndex(path)
+    second.ensure_built(conn=db_conn)
+    monkeypatch.undo()
+    recipe = create_recipe(
+        BaseRecipe(
+            name="Dragonfruit bowl",
+            author="Tester",
+            ingredients=[Ingredient(ingred_name="dragonfruit")],
+        ),
+        db_conn,
+    )
+    db_conn.rollback()
+    try:
+        second.ensure_built(conn=db_conn)
+        first.ensure_built(conn=db_conn)
+    finally:
+        delete_recipe(recipe.recipe_id, db_conn)
+
+    # assert
+    assert second.recipes_matching("dragonfruit") == {recipe.recipe_id}
+    assert first.recipes_matching("dragonfruit") == {recipe.recipe_id}
+
+
+def test_invalid_snapshots_are_rebuilt(db_conn, tmp_path):
+    # arrange
+    path = tmp_path / "index.snapshot"
+    SharedIngredientIndex(str(path)).build(conn=db_conn)
+    valid = path.read_bytes()
+    shared = SharedIngredientIndex(str(path))
+
+    # act
+    path.write_bytes(valid[: len(valid) // 2])
+    truncated = load_snapshot(str(path))
+    path.write_bytes(b"not a snapshot")
+    corrupt = load_snapshot(str(path))
+    path.write_bytes(b"")
+    empty = load_snapshot(str(path))
+    shared.ensure_built(conn=db_conn)
+
+    # assert
+    assert truncated is None and corrupt is None and empty is None
+    assert path.read_bytes() == valid
+    assert len(shared.recipes_matching("garlic")) > 0
+
+
+def test_concurrent_ensure_built_writes_one_snapshot(tmp_path, monkeypatch):
+    # arrange
+    shared = SharedIngredientIndex(str(tmp_path / "index.snapshot"))
+    write_snapshot = index_snapshot.write_snapshot
+    writes: list[int] = []
+
+    def count_writes(*args):
+        writes.append(1)
+        write_snapshot(*args)
+
+    monkeypatch.setattr(index_snapshot, "write_snapshot", count_writes)
+    barrier = threading.Barrier(8)
+    results: list[set[int]] = []
+
+    def query():
+        with get_engine().connect() as conn:
+            barrier.wait()
+            shared.ensure_built(conn=conn)
+            results.append(shared.recipes_matching("garlic"))
+
+    # act
+    threads = [threading.Thread(target=query) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    # assert
+    assert len(writes) == 1
+    assert len(results) == 8
+    assert all(x == results[0] and len(x) > 0 for x in results)
+
+
+def test_concurrent_find_requests_with_a_stale_snapshot(db_conn, tmp_path, monkeypatch):
+    # arrange
+    shared = SharedIngredientIndex(str(tmp_path / "index.snapshot"))
+    shared.ensure_built(conn=db_conn)
+    db_conn.rollback()
+    monkeypatch.setattr(recipe_finder, "ingredient_index", shared)
+    monkeypatch.setattr(recipe_finder, "scoring_engine", ScoringEngine(shared))
+    recipe = create_recipe(
+        BaseRecipe(
+            name="Stale snapshot stew",
+            author="Tester",
+            ingredients=[Ingredient(ingred_name="salt")],
+        ),
+        db_conn,
+    )
+    recipe_cache.clear()
+
+    async def find_all():
+        async with AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                *[
+                    async_client.get("/recipes/find", params={"ingredients": "salt"})
+                    for _ in range(8)
+                ]
+            )
+
+    # act
+    try:
+        responses = asyncio.run(asyncio.wait_for(find_all(), timeout=30))
+    finally:
+        delete_recipe(recipe.recipe_id, db_conn)
+
+    # assert
+    assert all(x.status_code == 200 for x in responses)
+    assert shared.recipes_matching("salt") >= {recipe.recipe_id}
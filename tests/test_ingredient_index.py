@@ -0,0 +1,79 @@
+from src.db.operations import create_recipe, delete_recipe
+from src.db.setup import get_engine
+from src.schemas.recipe import BaseRecipe, Ingredient
+from src.smarts.ingredient_index import IngredientIndex
+
+
+def test_ingredient_index_matches_substrings(joined_recipe_records, db_conn):
+    # arrange
+    index = IngredientIndex()
+    index.build(conn=db_conn)
+
+    # act
+    matched_ids = index.recipes_matching("garlic")
+    short_matched_ids = index.recipes_matching("eg")
+
+    # assert
+    expected_ids = {
+        r.recipe_id for r in joined_recipe_records if "garlic" in r.ingred_name.lower()
+    }
+    expected_short_ids = {
+        r.recipe_id for r in joined_recipe_records if "eg" in r.ingred_name.lower()
+    }
+    assert len(expected_ids) > 0
+    assert matched_ids == expected_ids
+    assert short_matched_ids == expected_short_ids
+
+
+def test_ingredient_index_tracks_writes(db_conn):
+    # arrange
+    index = IngredientIndex()
+    index.build(conn=db_conn)
+    recipe_id = 1_000_000
+
+    generation = index.data_generation
+
+    # act
+    index.add_recipe(recipe_id, ["Dragonfruit", "saffron threads"], generation + 1)
+    added_scores = index.score(["dragonfruit", "saffron"])
+    index.replace_recipe(recipe_id, ["saffron threads"], generation + 2)
+    replaced_matches = index.recipes_matching("dragonfruit")
+    index.remove_recipe(recipe_id, generation + 3)
+    removed_matches = index.recipes_matching("saffron")
+
+    # assert
+    assert added_scores[recipe_id] == 2
+    assert recipe_id not in replaced_matches
+    assert recipe_id not in removed_matches
+
+
+def test_ingredient_index_sees_writes_of_other_processes(db_conn):
+    # arrange
+    index = IngredientIndex()
+    with get_engine().connect() as conn:
+        index.ensure_built(conn=conn)
+    new_recipe = BaseRecipe(
+        name="Quince paste",
+        author="Tester",
+        ingredients=[Ingredient(ingred_name="quince")],
+    )
+
+    # act
+    # create_recipe updates the index of this process, not `index`
+    recipe = create_recipe(new_recipe, db_conn)
+    try:
+        with get_engine().connect() as conn:
+            index.ensure_built(conn=conn)
+            created_matches = index.recipes_matching("quince")
+            index.ensure_built(conn=conn)
+            generation = index.data_generation
+    finally:
+        delete_recipe(recipe.recipe_id, db_conn)
+    with get_engine().connect() as conn:
+        index.ensure_built(conn=conn)
+        deleted_matches = index.recipes_matching("quince")
+
+    # assert
+    assert created_matches == {recipe.recipe_id}
+    assert index.data_generation == generation + 1
+    assert deleted_matches == set()
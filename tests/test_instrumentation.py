@@ -0,0 +1,71 @@
+import pstats
+import re
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+from src import instrumentation
+from src.db import operations
+from src.db.cache import LRUCache
+from src.db.setup import get_async_engine, get_engine
+from src.routers import recipes
+
+
+def build_instrumented_client(**kwargs) -> TestClient:
+    app = FastAPI()
+    app.include_router(recipes.router)
+    engines = [get_engine(), get_async_engine().sync_engine]
+    instrumentation.install(app, engines, **kwargs)
+    return TestClient(app)
+
+
+def test_instrumentation_reports_statements_per_request(monkeypatch):
+    # arrange
+    client = build_instrumented_client()
+    monkeypatch.setattr(operations, "recipe_cache", LRUCache(10, ttl_seconds=60))
+
+    # act
+    response = client.get("/recipes/", params={"ingredients": "garlic", "limit": 20})
+    cached_response = client.get(
+        "/recipes/", params={"ingredients": "garlic", "limit": 20}
+    )
+    missing_response = client.get("/recipes/0")
+    metrics = client.get("/metrics")
+
+    # assert
+    assert response.status_code == 200
+    assert len(response.json()) == 20
+    server_timing = response.headers["server-timing"]
+    assert re.fullmatch(
+        r'app;dur=[\d.]+, db;dur=[\d.]+;desc="1 statements", render;dur=[\d.]+',
+        server_timing,
+    )
+    assert 'desc="0 statements"' in cached_response.headers["server-timing"]
+    assert missing_response.status_code == 404
+    assert metrics.headers["content-type"].startswith("text/plain")
+    lines = metrics.text.splitlines()
+    assert 'http_requests_total{method="GET",route="/recipes/",status="200"} 2' in lines
+    assert (
+        'http_requests_total{method="GET",route="/recipes/{recipe_id}",status="404"} 1'
+        in lines
+    )
+    assert 'db_statements_total{route="/recipes/"} 1' in lines
+    assert (
+        'http_request_duration_seconds_bucket{route="/recipes/",le="+Inf"} 2' in lines
+    )
+    assert any(x.startswith("recipe_cache_hits_total{") for x in lines)
+
+
+def test_instrumentation_keeps_slowest_profiles(tmp_path):
+    # arrange
+    client = build_instrumented_client(
+        profile_sample_rate=1.0, profile_keep_slowest=2, profile_dir=str(tmp_path)
+    )
+
+    # act
+    for recipe_id in range(1, 6):
+        client.get(f"/recipes/{recipe_id}")
+
+    # assert
+    profiles = list(tmp_path.glob("*.prof"))
+    assert len(profiles) == 2
+    assert all("GET-recipes_recipe_id" in x.name for x in profiles)
+    pstats.Stats(str(profiles[0]))
@@ -0,0 +1,25 @@
+import pytest
+from src.smarts.normaliser import normalise_ingredient_name
+
+
+@pytest.mark.parametrize(
+    "ingred_name, expected",
+    [
+        ("2 Large Garlic Cloves, minced", "garlic"),
+        ("cloves", "clove"),
+        ("1/2 cup chopped fresh parsley", "parsley"),
+        ("Eggs (beaten)", "egg"),
+        ("salt to taste", "salt"),
+        ("3 tomatoes", "tomato"),
+        ("bay leaves", "bay leaf"),
+        ("rolled oats", "rolled oats"),
+        ("eggplant", "eggplant"),
+        ("", ""),
+    ],
+)
+def test_normalise_ingredient_name(ingred_name, expected):
+    # act
+    canonical_name = normalise_ingredient_name(ingred_name)
+
+    # assert
+    assert canonical_name == expected
@@ -1,5 +1,15 @@
-from src.db.operations import _combine_joined_recipe_records
-from src.schemas.recipe import Recipe
+from sqlalchemy import event
+from src.db.cache import recipe_cache
+from src.db.operations import (
+    _combine_joined_recipe_records,
+    bulk_import_recipes,
+    create_recipe,
+    delete_recipe,
+    read_recipes_matching_query,
+    update_recipe,
+)
+from src.schemas.recipe import BaseRecipe, Ingredient, Recipe
+from src.smarts.normaliser import normalise_ingredient_name
 
 
 def test_combined_joined_recipe_records(joined_recipe_records):
@@ -11,3 +21,125 @@ def test_combined_joined_recipe_records(joined_recipe_records):
 
     # assert
     assert isinstance(combined_records[0], Recipe)
+    for recipe in combined_records:
+        assert Recipe(**recipe.dict()) == recipe
+
+
+def test_bulk_import_recipes(db_conn):
+    # arrange
+    new_recipes = [
+        BaseRecipe(
+            name=f"Bulk recipe {x}",
+            author="bulk author",
+            ingredients=[
+                Ingredient(ingred_name=f"bulk ingredient {x}", amount=x),
+                Ingredient(ingred_name="water", amount=1, unit="cup"),
+            ],
+        )
+        for x in range(5)
+    ]
+
+    # act
+    count = bulk_import_recipes(new_recipes, db_conn, batch_size=2)
+
+    # assert
+    assert count == 5
+    stored = read_recipes_matching_query(
+        conn=db_conn, name=None, author="bulk author", ingredients=None
+    )
+    assert stored is not None
+    assert sorted(r.name for r in stored) == [r.name for r in new_recipes]
+    assert all(len(r.ingredients) == 2 for r in stored)
+
+    # cleanup
+    for recipe in stored:
+        delete_recipe(recipe_id=recipe.recipe_id, conn=db_conn)
+
+
+def test_read_recipes_matching_query_uses_one_query(db_conn):
+    # arrange
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    recipe_cache.clear()
+    event.listen(db_conn, "before_cursor_execute", count_statement)
+
+    # act
+    recipes = read_recipes_matching_query(
+        conn=db_conn, name=None, author=None, ingredients=["garlic", "onion"]
+    )
+    event.remove(db_conn, "before_cursor_execute", count_statement)
+
+    # assert
+    assert len(recipes) > 1
+    assert len(statements) == 1
+    for recipe in recipes:
+        names = {normalise_ingredient_name(x.ingred_name) for x in recipe.ingredients}
+        assert "garlic" in names or "onion" in names
+
+
+def test_read_recipes_matching_query_ignores_ingredient_case(db_conn):
+    # act
+    lower = read_recipes_matching_query(
+        conn=db_conn, name=None, author=None, ingredients=["garlic cloves"]
+    )
+    upper = read_recipes_matching_query(
+        conn=db_conn, name=None, author=None, ingredients=["GARLIC Cloves"]
+    )
+
+    # assert
+    assert len(lower) > 0
+    assert [r.recipe_id for r in upper] == [r.recipe_id for r in lower]
+
+
+def test_update_recipe_writes_only_changed_ingredients(db_conn):
+    # arrange
+    statements: list[str] = []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    recipe = create_recipe(
+        BaseRecipe(
+            name="Spiced lentils",
+            author="Tester",
+            ingredients=[
+                Ingredient(ingred_name="lentils", amount=200.0, unit="g"),
+                Ingredient(ingred_name="cumin"),
+                Ingredient(ingred_name="onion"),
+            ],
+        ),
+        db_conn,
+    )
+    unchanged = recipe.copy(update={"rating": 3})
+    edited = [x.copy() for x in recipe.ingredients[:-1]]
+    edited[0].amount = 42.0
+    edited.append(Ingredient(ingred_name="sumac"))
+    edited.append(Ingredient(ingred_name="saffron"))
+
+    # act
+    event.listen(db_conn, "before_cursor_execute", record_statement)
+    try:
+        update_recipe(unchanged, db_conn)
+        unchanged_statements = [
+            x for x in statements if "ingredient" in x and "recipe_search" not in x
+        ]
+        statements.clear()
+        updated = update_recipe(recipe.copy(update={"ingredients": edited}), db_conn)
+    finally:
+        event.remove(db_conn, "before_cursor_execute", record_statement)
+        delete_recipe(recipe.recipe_id, db_conn)
+
+    # assert
+    assert [x.split()[0] for x in unchanged_statements] == ["SELECT", "SELECT"]
+    ingredient_writes = [
+        x.split()[0]
+        for x in statements
+        if x.startswith(
+            ("INSERT INTO ingredient ", "UPDATE ingredient ", "DELETE FROM ingredient ")
+        )
+    ]
+    assert sorted(ingredient_writes) == ["INSERT", "UPDATE"]
+    assert updated.ingredients == edited
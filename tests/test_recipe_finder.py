@@ -1,3 +1,8 @@
+import asyncio
+from httpx import AsyncClient
+from src.app import app
+from src.db.operations import read_recipe_by_id
+from src.smarts.ingredient_index import ingredient_index
 from src.smarts.recipe_finder import RecipeFinder
 
 
@@ -23,3 +28,86 @@ def test_recipe_finder_sorts_recipes(joined_recipe_records, db_conn):
 
         assert has_ingredient is True
         assert r.score == len(matches)
+
+
+def test_recipe_finder_pages_through_results(db_conn):
+    # arrange
+    rfinder = RecipeFinder(conn=db_conn)
+    query = set(["garlic", "onion", "pepper"])
+
+    # act
+    all_recipes = rfinder.find(query, None)
+    first_page = rfinder.find(query, None, limit=5)
+    second_page = rfinder.find(query, None, limit=5, offset=5)
+
+    # assert
+    assert len(all_recipes) > 10
+    expected_ids = [r.recipe.recipe_id for r in all_recipes[:10]]
+    assert [r.recipe.recipe_id for r in first_page + second_page] == expected_ids
+
+
+def test_recipe_finder_ranks_by_pantry_coverage(db_conn):
+    # arrange
+    rfinder = RecipeFinder(conn=db_conn)
+    recipe = read_recipe_by_id(id=7, conn=db_conn)
+    assert recipe is not None
+    names = [x.ingred_name for x in recipe.ingredients]
+    pantry = set(names[1:]) | {"unicorn"}
+
+    # act
+    covered = rfinder.find_by_pantry(set(names))
+    strict = rfinder.find_by_pantry(pantry)
+    lenient = rfinder.find_by_pantry(pantry, max_missing=1)
+
+    # assert
+    assert all(x.score == 1.0 and x.missing_ingredients == [] for x in covered)
+    assert recipe.recipe_id in [x.recipe.recipe_id for x in covered]
+    assert recipe.recipe_id not in [x.recipe.recipe_id for x in strict]
+    match = next(x for x in lenient if x.recipe.recipe_id == recipe.recipe_id)
+    assert match.missing_ingredients == names[:1]
+    assert match.score == (len(set(names)) - 1) / len(set(names))
+    assert [x.score for x in lenient] == sorted(
+        [x.score for x in lenient], reverse=True
+    )
+
+
+def test_recipe_finder_matches_canonical_ingredients(db_conn):
+    # arrange
+    substring_finder = RecipeFinder(conn=db_conn)
+    exact_finder = RecipeFinder(conn=db_conn, exact_ingredients=True)
+
+    # act
+    substring_matches = substring_finder.find({"egg"}, None)
+    exact_matches = exact_finder.find({"Eggs"}, None)
+
+    # assert
+    assert 0 < len(exact_matches) < len(substring_matches)
+    for r in exact_matches:
+        names = [x.ingred_name.lower() for x in r.recipe.ingredients]
+        assert any("egg" in x and "eggplant" not in x for x in names)
+
+
+def test_concurrent_find_requests_build_the_index_once(db_conn):
+    # arrange
+    expected = RecipeFinder(conn=db_conn).find({"garlic"}, None, limit=20)
+    ingredient_index.invalidate()
+
+    async def find_all():
+        async with AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                *[
+                    async_client.get(
+                        "/recipes/find", params={"ingredients": "garlic", "limit": 20}
+                    )
+                    for _ in range(8)
+                ]
+            )
+
+    # act
+    responses = asyncio.run(asyncio.wait_for(find_all(), timeout=30))
+
+    # assert
+    expected_ids = [x.recipe.recipe_id for x in expected]
+    for response in responses:
+        assert response.status_code == 200
+        assert [x["recipe"]["recipe_id"] for x in response.json()] == expected_ids
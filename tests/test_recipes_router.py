@@ -1,10 +1,20 @@
+import asyncio
+import json
+import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import Connection
+from httpx import AsyncClient
+from sqlalchemy import Connection, text
 from src.app import app
+from src import serialisation
+from src.db.setup import ensure_recipe_documents, get_engine
+from src.settings import settings
+from src.db import operations
 from src.db.operations import (
     delete_recipe_by_id,
     insert_recipe,
     insert_ingredients,
+    rebuild_recipe_documents,
+    select_recipe_document_by_id,
 )
 
 
@@ -109,3 +119,307 @@ def test_delete_recipe(client: TestClient):
     assert response.status_code == 204
     confirmation = client.get("/recipes/1")
     assert confirmation.status_code == 404
+
+
+def test_concurrent_requests():
+    # arrange
+    async def fetch_all():
+        async with AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                *[async_client.get(f"/recipes/{x}") for x in range(2, 22)],
+                *[
+                    async_client.get("/recipes/find", params={"ingredients": "salt"})
+                    for _ in range(5)
+                ],
+            )
+
+    # act
+    responses = asyncio.run(fetch_all())
+
+    # assert
+    assert all(x.status_code == 200 for x in responses)
+    assert [x.json()["recipe_id"] for x in responses[:20]] == list(range(2, 22))
+
+
+def test_search_recipes(client: TestClient):
+    # arrange
+    data = {
+        "name": "Zanzibari Pilau",
+        "author": "Joe",
+        "ingredients": [{"ingred_name": "basmati rice"}, {"ingred_name": "cardamom"}],
+        "instructions": "Toast the spices.",
+    }
+    recipe_id = client.post("/recipes/", json=data).json()["recipe_id"]
+
+    # act
+    by_name = client.get("/recipes/search", params={"q": "zanzibari"})
+    by_prefix = client.get("/recipes/search", params={"q": "pilau cardam"})
+    client.delete(f"/recipes/{recipe_id}")
+    after_delete = client.get("/recipes/search", params={"q": "zanzibari"})
+
+    # assert
+    assert by_name.status_code == 200
+    assert [r["recipe"]["recipe_id"] for r in by_name.json()] == [recipe_id]
+    assert [r["recipe"]["recipe_id"] for r in by_prefix.json()] == [recipe_id]
+    assert after_delete.json() == []
+
+
+def test_search_recipes_follows_ingredient_changes(client: TestClient):
+    # arrange
+    data = {
+        "name": "Orchard fruit paste",
+        "author": "Joe",
+        "ingredients": [{"ingred_name": "quince"}, {"ingred_name": "sugar"}],
+        "instructions": "Simmer.",
+    }
+    recipe = client.post("/recipes/", json=data).json()
+    recipe["ingredients"] = [{"ingred_name": "sugar"}, {"ingred_name": "yuzu"}]
+
+    # act
+    client.put(f"/recipes/{recipe['recipe_id']}", json=recipe)
+    by_new = client.get("/recipes/search", params={"q": "orchard paste yuzu"})
+    by_old = client.get("/recipes/search", params={"q": "orchard paste quince"})
+    client.delete(f"/recipes/{recipe['recipe_id']}")
+
+    # assert
+    assert [r["recipe"]["recipe_id"] for r in by_new.json()] == [recipe["recipe_id"]]
+    assert by_old.json() == []
+
+
+def test_search_recipes_without_full_text_search(client: TestClient, monkeypatch):
+    # arrange
+    monkeypatch.setattr(operations, "has_recipe_search", lambda conn: False)
+
+    # act
+    response = client.get("/recipes/search", params={"q": "chicken"})
+
+    # assert
+    assert response.status_code == 501
+
+
+def test_search_recipes_ranks_by_relevance(client: TestClient):
+    # act
+    response = client.get("/recipes/search", params={"q": "chicken", "limit": 10})
+
+    # assert
+    assert response.status_code == 200
+    scores = [r["score"] for r in response.json()]
+    assert len(scores) == 10
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_export_recipes(client: TestClient):
+    # arrange
+    expected_count = len(client.get("/recipes/prototype").json())
+
+    # act
+    response = client.get("/recipes/export")
+
+    # assert
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    recipes = [json.loads(line) for line in response.text.splitlines()]
+    assert len(recipes) == expected_count
+    recipe_ids = [r["recipe_id"] for r in recipes]
+    assert recipe_ids == sorted(recipe_ids)
+    assert all(len(r["ingredients"]) > 0 for r in recipes)
+
+
+def test_read_recipes_pages_with_cursor(client: TestClient):
+    # arrange
+    expected_ids = {r["recipe_id"] for r in client.get("/recipes/prototype").json()}
+    first_page = client.get("/recipes/", params={"limit": 40})
+    data = {
+        "name": "AAA inserted between pages",
+        "author": "Joe",
+        "ingredients": [{"ingred_name": "salt"}],
+        "instructions": "None.",
+    }
+    inserted_id = client.post("/recipes/", json=data).json()["recipe_id"]
+
+    # act
+    pages = [first_page.json()]
+    cursor = first_page.headers.get("X-Next-Cursor")
+    while cursor is not None:
+        response = client.get("/recipes/", params={"limit": 40, "cursor": cursor})
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+    client.delete(f"/recipes/{inserted_id}")
+
+    # assert
+    recipes = [recipe for page in pages for recipe in page]
+    recipe_ids = [r["recipe_id"] for r in recipes]
+    assert len(recipe_ids) == len(set(recipe_ids))
+    assert set(recipe_ids) == expected_ids
+    keys = [(r["name"], r["recipe_id"]) for r in recipes]
+    assert keys == sorted(keys)
+    assert all(len(page) <= 40 for page in pages)
+
+
+def test_read_recipes_rejects_invalid_cursor(client: TestClient):
+    # act
+    response = client.get("/recipes/", params={"cursor": "not-a-cursor"})
+
+    # assert
+    assert response.status_code == 400
+
+
+def test_batch_recipe_endpoints(client: TestClient):
+    # arrange
+    new_recipes = [
+        {
+            "name": f"Batch recipe {x}",
+            "author": "Joe",
+            "ingredients": [{"ingred_name": "salt"}, {"ingred_name": f"spice {x}"}],
+            "instructions": "Mix.",
+        }
+        for x in range(3)
+    ]
+
+    # act
+    created = client.post("/recipes/batch", json=new_recipes)
+    recipes = created.json()
+    for recipe in recipes:
+        recipe["author"] = "Jane"
+        recipe["ingredients"] = recipe["ingredients"][1:]
+    updated = client.put("/recipes/batch", json=recipes)
+    missing = client.put("/recipes/batch", json=[{**recipes[0], "recipe_id": 10**9}])
+    recipe_ids = [x["recipe_id"] for x in recipes]
+    duplicated_put = client.put("/recipes/batch", json=[recipes[0], recipes[0]])
+    duplicated_delete = client.request(
+        "DELETE", "/recipes/batch", json=[recipe_ids[0], recipe_ids[0]]
+    )
+    deleted = client.request("DELETE", "/recipes/batch", json=recipe_ids + [10**9])
+
+    # assert
+    assert created.status_code == 201
+    assert [x["name"] for x in recipes] == [x["name"] for x in new_recipes]
+    assert [len(x["ingredients"]) for x in recipes] == [1, 1, 1]
+    assert updated.status_code == 200
+    assert updated.json()[2]["author"] == "Jane"
+    assert updated.json()[2]["ingredients"] == [
+        {
+            "ingred_name": "spice 2",
+            "amount": None,
+            "unit": None,
+            "notes": None,
+            "group": None,
+        }
+    ]
+    assert updated.json()[2]["created_at"] == recipes[2]["created_at"]
+    assert missing.status_code == 404
+    assert duplicated_put.status_code == 422
+    assert duplicated_delete.status_code == 422
+    assert sorted(deleted.json()) == sorted(recipe_ids)
+    assert client.get(f"/recipes/{recipe_ids[0]}").status_code == 404
+
+
+def test_patch_recipe(client: TestClient):
+    # arrange
+    original = client.get("/recipes/3").json()
+
+    # act
+    response = client.patch("/recipes/3", json={"rating": 2})
+    null_name = client.patch("/recipes/3", json={"name": None})
+    missing = client.patch(f"/recipes/{10**9}", json={"rating": 2})
+
+    # assert
+    assert response.status_code == 200
+    patched = response.json()
+    assert patched["rating"] == 2
+    assert patched["name"] == original["name"]
+    assert patched["ingredients"] == original["ingredients"]
+    assert null_name.status_code == 422
+    assert missing.status_code == 404
+
+
+def test_find_recipes_in_pantry(client: TestClient):
+    # arrange
+    recipe = client.get("/recipes/8").json()
+    items = [x["ingred_name"] for x in recipe["ingredients"]]
+
+    # act
+    response = client.get(
+        "/recipes/pantry", params={"items": items, "max_missing": 2, "limit": 10}
+    )
+
+    # assert
+    assert response.status_code == 200
+    assert response.json()[0]["score"] == 1.0
+    assert response.json()[0]["missing_ingredients"] == []
+    assert len(response.json()) <= 10
+
+
+@pytest.mark.parametrize("encoder", ["orjson", "json"])
+def test_fast_json_responses_match_validated_responses(
+    client: TestClient, monkeypatch, encoder
+):
+    # arrange
+    if encoder == "json":
+        monkeypatch.setattr(serialisation, "orjson", None)
+    requests = [
+        ("/recipes/prototype", None),
+        ("/recipes/7", None),
+        ("/recipes/", {"ingredients": "garlic", "limit": 5}),
+        ("/recipes/find", {"ingredients": ["garlic", "onion"]}),
+        ("/recipes/pantry", {"items": ["salt", "eggs"], "max_missing": 3}),
+        ("/recipes/search", {"q": "chicken"}),
+    ]
+    expected = [client.get(path, params=params) for path, params in requests]
+
+    # act
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+    fast = [client.get(path, params=params) for path, params in requests]
+
+    # assert
+    for expected_response, fast_response in zip(expected, fast):
+        assert fast_response.status_code == expected_response.status_code == 200
+        assert fast_response.headers["content-type"] == "application/json"
+        assert fast_response.content == expected_response.content
+    assert fast[2].headers["X-Next-Cursor"] == expected[2].headers["X-Next-Cursor"]
+
+
+def test_recipe_documents_follow_writes(
+    client: TestClient, db_conn: Connection, monkeypatch
+):
+    # arrange
+    monkeypatch.setattr(settings, "RECIPE_DOCUMENTS_ENABLED", True)
+    ensure_recipe_documents(engine=get_engine(), enabled=True)
+    data = {
+        "name": "Shakshuka",
+        "author": "Ottolenghi",
+        "ingredients": [
+            {"ingred_name": "eggs", "amount": 4},
+            {"ingred_name": "tomatoes", "amount": 6},
+        ],
+    }
+    recipe_id = client.post("/recipes/", json=data).json()["recipe_id"]
+    created_document = select_recipe_document_by_id(recipe_id, db_conn)
+
+    # act
+    from_document = client.get(f"/recipes/{recipe_id}")
+    patched = client.patch(f"/recipes/{recipe_id}", json={"rating": 9})
+    patched_document = select_recipe_document_by_id(recipe_id, db_conn)
+    db_conn.execute(
+        text("UPDATE ingredient SET amount = 5 WHERE recipe_id = :recipe_id"),
+        {"recipe_id": recipe_id},
+    )
+    db_conn.commit()
+    stale_document = select_recipe_document_by_id(recipe_id, db_conn)
+    rebuild_recipe_documents(db_conn)
+    rebuilt_document = select_recipe_document_by_id(recipe_id, db_conn)
+    monkeypatch.setattr(settings, "RECIPE_DOCUMENTS_ENABLED", False)
+    validated = client.get(f"/recipes/{recipe_id}")
+    client.delete(f"/recipes/{recipe_id}")
+    ensure_recipe_documents(engine=get_engine(), enabled=False)
+
+    # assert
+    assert from_document.headers["content-type"] == "application/json"
+    assert from_document.content == created_document
+    assert json.loads(patched_document) == patched.json()
+    assert patched.json()["rating"] == 9
+    assert stale_document is None
+    assert rebuilt_document == validated.content
+    assert [x["amount"] for x in validated.json()["ingredients"]] == [5, 5]
+    assert select_recipe_document_by_id(recipe_id, db_conn) is None
+    assert db_conn.execute(text("SELECT count(*) FROM recipe_document")).scalar() == 0
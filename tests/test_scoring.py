@@ -0,0 +1,47 @@
+import pytest
+from src.smarts import scoring
+from src.smarts.ingredient_index import IngredientIndex
+from src.smarts.scoring import ScoringEngine
+
+WEIGHTS = [
+    {},
+    {"prefer_rare_ingredients": True},
+    {"ingred_amount_is_factor": True},
+    {"prefer_rare_ingredients": True, "prefer_popular_recipes": True},
+]
+
+
+@pytest.mark.skipif(scoring.np is None, reason="the fast extra is not installed")
+@pytest.mark.parametrize("weights", WEIGHTS)
+def test_vectorised_scores_match_python_fallback(db_conn, monkeypatch, weights):
+    # arrange
+    terms = {"garlic", "onion", "cumin"}
+    engine = ScoringEngine(IngredientIndex())
+
+    # act
+    vectorised = engine.score(db_conn, terms, **weights)
+    monkeypatch.setattr(scoring, "np", None)
+    fallback = engine.score(db_conn, terms, **weights)
+
+    # assert
+    assert len(vectorised) > 0
+    assert vectorised.keys() == fallback.keys()
+    for recipe_id, score in vectorised.items():
+        assert score == pytest.approx(fallback[recipe_id])
+
+
+def test_rare_ingredients_weigh_more(db_conn):
+    # arrange
+    engine = ScoringEngine(IngredientIndex())
+
+    # act
+    scores = engine.score(db_conn, {"salt", "cumin"}, prefer_rare_ingredients=True)
+    salt = engine.score(db_conn, {"salt"}, prefer_rare_ingredients=True)
+    cumin = engine.score(db_conn, {"cumin"}, prefer_rare_ingredients=True)
+
+    # assert
+    assert len(cumin) < len(salt)
+    assert max(cumin.values()) > max(salt.values())
+    for recipe_id, score in scores.items():
+        expected = salt.get(recipe_id, 0) + cumin.get(recipe_id, 0)
+        assert score == pytest.approx(expected)
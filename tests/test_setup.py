@@ -0,0 +1,127 @@
+from sqlalchemy import MetaData, create_engine, inspect, text
+from starlette.testclient import TestClient
+from src.app import app
+from src.db.setup import construct_db_if_none_exists, ensure_recipe_documents
+from src.settings import settings
+from src.db.tables import (
+    build_canonical_ingredients_table,
+    build_ingredients_table,
+    build_recipe_documents_table,
+    build_recipes_table,
+)
+
+
+def build_metadata() -> MetaData:
+    metadata = MetaData()
+    metadata, _ = build_canonical_ingredients_table(metadata=metadata)
+    metadata, _ = build_recipes_table(metadata=metadata)
+    metadata, _ = build_ingredients_table(metadata=metadata)
+    return metadata
+
+
+def test_construct_db_adds_missing_indexes(tmp_path):
+    # arrange
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    old_metadata = build_metadata()
+    for table in old_metadata.tables.values():
+        table.indexes.clear()
+    old_metadata.create_all(bind=engine)
+    metadata = build_metadata()
+
+    # act
+    construct_db_if_none_exists(engine=engine, metadata=metadata)
+
+    # assert
+    inspector = inspect(engine)
+    ingredient_indexes = {x["name"] for x in inspector.get_indexes("ingredient")}
+    recipe_indexes = {x["name"] for x in inspector.get_indexes("recipe")}
+    assert "ix_ingredient_recipe_id" in ingredient_indexes
+    assert "ix_ingredient_ingred_name_nocase" in ingredient_indexes
+    assert {"ix_recipe_name", "ix_recipe_author"} <= recipe_indexes
+
+
+def test_construct_db_links_existing_ingredients_to_canonical_ones(tmp_path):
+    # arrange
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """CREATE TABLE recipe (recipe_id INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL, author VARCHAR NOT NULL, rating INTEGER,
+                prep_time FLOAT, cook_time FLOAT, created_at DATETIME NOT NULL,
+                modified_at DATETIME NOT NULL, instructions VARCHAR)"""
+            )
+        )
+        conn.execute(
+            text(
+                """CREATE TABLE ingredient (ingred_id INTEGER PRIMARY KEY,
+                recipe_id INTEGER REFERENCES recipe (recipe_id) ON DELETE CASCADE,
+                ingred_name VARCHAR, amount FLOAT, unit VARCHAR, notes VARCHAR,
+                "group" VARCHAR)"""
+            )
+        )
+        conn.execute(
+            text(
+                """INSERT INTO ingredient (recipe_id, ingred_name) VALUES
+                (1, 'Garlic cloves'), (1, 'garlic'), (2, 'eggplant'), (2, 'eggs')"""
+            )
+        )
+
+    # act
+    construct_db_if_none_exists(engine=engine, metadata=build_metadata())
+
+    # assert
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """SELECT ingred_name, name FROM ingredient
+                JOIN canonical_ingredient USING (canonical_id) ORDER BY ingred_id"""
+            )
+        ).all()
+    indexes = {x["name"] for x in inspect(engine).get_indexes("ingredient")}
+    assert [tuple(x) for x in rows] == [
+        ("Garlic cloves", "garlic"),
+        ("garlic", "garlic"),
+        ("eggplant", "eggplant"),
+        ("eggs", "egg"),
+    ]
+    assert "ix_ingredient_canonical_id" in indexes
+
+
+def test_lifespan_warms_up_before_serving(monkeypatch):
+    # arrange
+    monkeypatch.setattr(settings, "WARM_UP_ENABLED", True)
+
+    # act
+    with TestClient(app) as client:
+        response = client.get("/recipes/find", params={"ingredients": "garlic"})
+        warm_up_seconds = app.state.warm_up_seconds
+
+    # assert
+    assert response.status_code == 200
+    assert set(warm_up_seconds) == {"pool", "statements", "index"}
+    assert all(x >= 0 for x in warm_up_seconds.values())
+
+
+def test_recipe_document_triggers_follow_the_setting(tmp_path):
+    # arrange
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'documents.db'}")
+    metadata = build_metadata()
+    metadata, _ = build_recipe_documents_table(metadata=metadata)
+    metadata.create_all(bind=engine)
+    trigger_count = text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")
+
+    # act
+    ensure_recipe_documents(engine=engine, enabled=True)
+    with engine.begin() as conn:
+        enabled_count = conn.execute(trigger_count).scalar()
+        conn.execute(text("INSERT INTO recipe_document VALUES (1, x'7b7d')"))
+    ensure_recipe_documents(engine=engine, enabled=False)
+    with engine.connect() as conn:
+        disabled_count = conn.execute(trigger_count).scalar()
+        documents = conn.execute(text("SELECT * FROM recipe_document")).all()
+
+    # assert
+    assert enabled_count == 5
+    assert disabled_count == 0
+    assert documents == []
@@ -0,0 +1,106 @@
+from collections import Counter
+
+import pytest
+from src.db import sql_operations
+from src.db.sql_operations import (
+    select_joined_recipes_by_filters,
+    select_joined_recipes_by_ids,
+    select_joined_recipes_matching_query,
+    select_recipe_by_id_with_ingredients,
+    select_recipe_ids_by_ingredients,
+    select_recipes_by_ids,
+)
+
+
+@pytest.mark.parametrize(
+    "max_bound_parameters, staged_values_threshold",
+    [(900, 9000), (7, 9000), (7, 20)],
+    ids=["single-in", "chunked-in", "staged"],
+)
+def test_id_selectors_bound_parameters(
+    db_conn,
+    joined_recipe_records,
+    monkeypatch,
+    max_bound_parameters,
+    staged_values_threshold,
+):
+    # arrange
+    recipe_ids = list(range(2, 60))
+    ingred_names = ["garlic cloves", "kosher salt", "olive oil"] + [
+        f"missing ingredient{x}" for x in range(30)
+    ]
+    expected_matched_ids = select_recipe_ids_by_ingredients(
+        conn=db_conn, ingred_names=ingred_names
+    )
+    # recipes of the author match in every chunk, but must be returned once
+    author = joined_recipe_records[0].author
+    expected_matching_records = select_joined_recipes_matching_query(
+        conn=db_conn, name=None, author=author, ingredients=set(ingred_names)
+    )
+    monkeypatch.setattr(sql_operations, "MAX_BOUND_PARAMETERS", max_bound_parameters)
+    monkeypatch.setattr(
+        sql_operations, "STAGED_VALUES_THRESHOLD", staged_values_threshold
+    )
+
+    # act
+    recipes = select_recipes_by_ids(conn=db_conn, recipe_ids=recipe_ids)
+    joined_records = select_joined_recipes_by_ids(conn=db_conn, recipe_ids=recipe_ids)
+    matched_ids = select_recipe_ids_by_ingredients(
+        conn=db_conn, ingred_names=ingred_names
+    )
+    matching_records = select_joined_recipes_matching_query(
+        conn=db_conn, name=None, author=author, ingredients=set(ingred_names)
+    )
+
+    # assert
+    assert recipes is not None
+    assert sorted(r.recipe_id for r in recipes) == recipe_ids
+    joined_ids = [r.recipe_id for r in joined_records]
+    assert joined_ids == sorted(joined_ids)
+    assert set(joined_ids) == set(recipe_ids)
+    assert matched_ids is not None and len(matched_ids) > 0
+    assert matched_ids == expected_matched_ids
+    assert matching_records is not None and len(matching_records) > 0
+    assert Counter(matching_records) == Counter(expected_matching_records)
+
+
+def test_statements_are_compiled_once_per_shape(db_conn):
+    # arrange
+    compiled_cache: dict = {}
+    db_conn.execution_options(compiled_cache=compiled_cache)
+
+    def run_queries(offset: int):
+        select_recipe_by_id_with_ingredients(recipe_id=1 + offset, conn=db_conn)
+        select_joined_recipes_by_ids(conn=db_conn, recipe_ids=[2 + offset, 3])
+        select_joined_recipes_by_filters(
+            conn=db_conn,
+            name=f"recipe {offset}",
+            author=None,
+            ingred_names=["garlic"] * (offset + 1),
+            limit=5 + offset,
+            after=(f"name {offset}", offset),
+        )
+
+    # act
+    run_queries(offset=0)
+    compiled_count = len(compiled_cache)
+    for offset in range(1, 5):
+        run_queries(offset=offset)
+
+    # assert
+    assert compiled_count > 0
+    assert len(compiled_cache) == compiled_count
+
+
+def test_joined_recipes_by_filters_honours_a_zero_limit(db_conn):
+    # act
+    empty_page = select_joined_recipes_by_filters(
+        conn=db_conn, name=None, author=None, ingred_names=None, limit=0
+    )
+    unlimited = select_joined_recipes_by_filters(
+        conn=db_conn, name=None, author=None, ingred_names=None, limit=None
+    )
+
+    # assert
+    assert empty_page == []
+    assert len(unlimited) > 0